@@ -1,18 +1,87 @@
 import streamlit as st
 from PIL import Image
+import hmac
 import os
+import time
 
 from functionalities import (
-    analyze_image_with_ai,
-    read_uploaded_file,
-    ask_ai
+    document_cache,
+    parse_time_stats,
+    stream_ask_ai,
+    summarize_history,
+    vision_cache
 )
+import jobs
+import tracing
+from async_runtime import limiter
+from cache import content_hash
+from extraction import STRUCTURED_EXTRACTION
+from history import ChatHistory
+from imaging import vision_upload_stats
+from intent_router import TestDriveBooking, intent_router_stats, route
+from knowledge import knowledge_store
+from model_tiers import tier_summary
+from pdf_routing import vision_routing_stats
+from resilience import resilience_stats
+from response_cache import is_opening_turn, response_cache
+from retrieval import retrieve_context
 
-def handle_quick_action(user_msg, combined_context):
+def message_html(role, content):
+    if role == "user":
+        return f"""
+            <div class="chat-message user-message">
+                <strong>👤 You:</strong><br>{content}
+            </div>
+        """
+    return f"""
+        <div class="chat-message bot-message">
+            <strong>🤖 Assistant:</strong><br>{content}
+        </div>
+    """
+
+def send_message(user_msg, chat_container, quick_action=False):
+    """Send a message and render the reply into chat_container as tokens arrive"""
+    # Scripted steps (test-drive booking, fixed quick actions) are answered from templates without a model call
+    _, routed_reply = route(user_msg, st.session_state.booking, branch_lookup=lambda query: dealership_context(f"{query} branch address"))
+    # Replies are shared across sessions, so only turns answered without any conversation history are cached:
+    # a session's opening question, or a quick action (which is asked without history). Follow-ups could
+    # depend on, or repeat, another customer's earlier turns. Answers from a half-finished upload analysis aren't cached.
+    cacheable = (
+        routed_reply is None and not pending_job_ids
+        and (quick_action or is_opening_turn(st.session_state.messages))
+    )
+    instant_reply = routed_reply or (response_cache.get(user_msg, data_fingerprint) if cacheable else None)
+    if instant_reply is None:
+        combined_context = build_context(user_msg)
+        chat_history = "" if cacheable else st.session_state.history.prompt_history(st.session_state.messages)
     st.session_state.messages.append({"role": "user", "content": user_msg})
-    ai_response = ask_ai(user_msg, combined_context)
+
+    with chat_container:
+        st.markdown(message_html("user", user_msg), unsafe_allow_html=True)
+        placeholder = st.empty()
+        if instant_reply is not None:
+            ai_response = instant_reply
+        else:
+            start = time.perf_counter()
+            ai_response = ""
+            for token in stream_ask_ai(user_msg, chat_history, combined_context):
+                ai_response += token
+                placeholder.markdown(message_html("bot", ai_response + "▌"), unsafe_allow_html=True)
+            if cacheable and not ai_response.startswith("Error"):
+                response_cache.set(user_msg, data_fingerprint, ai_response, time.perf_counter() - start)
+        placeholder.markdown(message_html("bot", ai_response), unsafe_allow_html=True)
+
+    # Only the finished reply goes into the transcript
     st.session_state.messages.append({"role": "bot", "content": ai_response})
 
+@st.cache_resource
+def load_logo(path):
+    """Logo file bytes, read once per process; passing bytes lets Streamlit serve the same media URL every rerun"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
 # ----------------------
 # Page Configuration
 # ----------------------
@@ -88,8 +157,8 @@ with col_logo:
     # Logo placeholder - replace 'path/to/your/logo.png' with your actual logo path
     logo_path = "./toyota-white.png"  # Change this to your logo file path
     
-    if os.path.exists(logo_path):
-        logo = Image.open(logo_path)
+    logo = load_logo(logo_path)
+    if logo:
         st.image(logo, width=250)
     else:
         # Placeholder for logo
@@ -111,6 +180,16 @@ st.divider()
 # ----------------------
 # Sidebar for File Uploads
 # ----------------------
+# Analysis runs in background jobs; this session only holds their ids. They stay out of the URL, where anyone
+# with the link could read another customer's results; after a refresh, uploading the file again reattaches
+if "jobs" not in st.session_state:
+    st.session_state.jobs = {}
+
+def detach_jobs(*kinds):
+    """A new or cleared upload replaces the session's job; the old job keeps running for anyone else attached"""
+    for kind in kinds:
+        st.session_state.jobs.pop(kind, None)
+
 with st.sidebar:
     st.header("📁 Upload Document")
     st.markdown("Upload documents, images, receipts, or handwritten notes for analysis")
@@ -119,130 +198,333 @@ with st.sidebar:
     uploaded_file = st.file_uploader(
         "Choose a file",
         type=["pdf", "txt", "csv", "docx"],
-        help="Supports PDF, TXT, CSV, and DOCX files"
+        help="Supports PDF, TXT, CSV, and DOCX files",
+        key="uploaded_file",
+        on_change=detach_jobs,
+        args=("document", "pdf_vision")
+    )
+    pdf_vision = st.checkbox(
+        "Visual analysis of PDF pages",
+        value=False,
+        help="Also reads handwriting and stamps page by page with the vision model (slower)",
+        on_change=detach_jobs,
+        args=("pdf_vision",)
     )
     
     st.subheader("🖼️ Image Upload")
     uploaded_image = st.file_uploader(
         "Choose an image",
         type=["png", "jpg", "jpeg"],
-        help="Supports handwriting and receipt recognition"
+        help="Supports handwriting and receipt recognition",
+        key="uploaded_image",
+        on_change=detach_jobs,
+        args=("image",)
     )
     
+    knowledge_stats = knowledge_store.stats()
+    if knowledge_stats["sources"]:
+        st.caption(f"📚 Knowledge base: {knowledge_stats['sources']} document(s) shared by every chat")
+    
     st.divider()
 
 # ----------------------
 # Process Uploaded Files
 # ----------------------
+# Submitting is idempotent: the same content maps to the same job across reruns, refreshes and sessions
+if uploaded_file and "document" not in st.session_state.jobs:
+    st.session_state.jobs["document"] = jobs.submit_analysis("document", uploaded_file).id
+if uploaded_file and pdf_vision and uploaded_file.type == "application/pdf" and "pdf_vision" not in st.session_state.jobs:
+    st.session_state.jobs["pdf_vision"] = jobs.submit_analysis("pdf_vision", uploaded_file).id
+if uploaded_image and "image" not in st.session_state.jobs:
+    st.session_state.jobs["image"] = jobs.submit_analysis("image", uploaded_image).id
+
+attached_jobs = {kind: jobs.get(job_id) for kind, job_id in st.session_state.jobs.items()}
+# Jobs can disappear once they age out of the registry
+attached_jobs = {kind: job for kind, job in attached_jobs.items() if job is not None}
+st.session_state.jobs = {kind: job.id for kind, job in attached_jobs.items()}
+
+pending_job_ids = [job.id for job in attached_jobs.values() if not job.finished]
+
+# The chat uses whatever has been extracted so far
 file_text = ""
 image_analysis = ""
+document_job = attached_jobs.get("document")
+if document_job:
+    file_text = document_job.result if document_job.status == "done" else document_job.partial_result()
+pdf_vision_job = attached_jobs.get("pdf_vision")
+if pdf_vision_job and pdf_vision_job.status == "done":
+    file_text = pdf_vision_job.result
+elif pdf_vision_job and pdf_vision_job.partial_result():
+    file_text += f"\n\nVISUAL ANALYSIS (in progress):\n{pdf_vision_job.partial_result()}"
+image_job = attached_jobs.get("image")
+if image_job and image_job.status == "done":
+    image_analysis = image_job.result
+
+JOB_LABELS = {"document": "📄 Document", "pdf_vision": "🔍 PDF pages", "image": "🖼️ Image"}
+
+@st.fragment(run_every=1 if pending_job_ids else None)
+def job_progress(pending_job_ids):
+    """Poll running jobs without rerunning the page; rerun the whole app once one finishes so its result is used"""
+    for kind, job in attached_jobs.items():
+        label = f"{JOB_LABELS[kind]}: **{job.name}**"
+        if job.status == "done":
+            st.success(f"✅ {label}")
+        elif job.status == "error":
+            st.error(f"{label}\n\n{job.error}")
+        else:
+            steps = f"{job.done_steps}/{job.total_steps}" if job.total_steps else f"{job.done_steps} part(s)"
+            st.progress(job.progress(), text=f"{label} · {job.status} · {steps}")
+            if kind == "document" and job.done_steps:
+                st.text(job.partial_result()[:500])
+    if any(jobs.get(job_id) is None or jobs.get(job_id).finished for job_id in pending_job_ids):
+        st.rerun()
+
+if attached_jobs:
+    with st.sidebar:
+        job_progress(pending_job_ids)
 
-if uploaded_file:
+if document_job and document_job.status == "done":
     with st.sidebar:
-        st.success(f"✅ File loaded: **{uploaded_file.name}**")
-        with st.spinner("📄 Analyzing document..."):
-            file_text = read_uploaded_file(uploaded_file)
-            st.info("📊 Content extracted successfully")
+        st.info("📊 Content extracted successfully")
+        parse_stats = parse_time_stats().get(uploaded_file.type) if uploaded_file else None
+        if parse_stats:
+            cache_stats = document_cache.stats()
+            st.caption(
+                f"Avg parse time for this type: {parse_stats['avg_s']:.2f}s over {parse_stats['files']} file(s) · "
+                f"document cache {cache_stats['hits']} hits / {cache_stats['misses']} misses"
+            )
         
         with st.expander("📖 View Document Content"):
             preview_text = file_text[:2000] + "..." if len(file_text) > 2000 else file_text
             st.text_area("Content Preview", preview_text, height=200, disabled=True)
 
-if uploaded_image:
+if uploaded_image or image_analysis:
     with st.sidebar:
-        image = Image.open(uploaded_image)
-        st.image(image, caption="Uploaded Image", use_container_width=True)
+        if uploaded_image:
+            image = Image.open(uploaded_image)
+            st.image(image, caption="Uploaded Image", use_container_width=True)
         
-        with st.spinner("🔍 Analyzing image..."):
-            image_analysis = analyze_image_with_ai(uploaded_image)
-        st.success("✅ Image analyzed successfully!")
-        
-        with st.expander("🔎 View Image Analysis"):
-            st.write(image_analysis)
+        if image_analysis:
+            with st.expander("🔎 View Image Analysis"):
+                # Structured records are one fact per line; markdown would fold them into a paragraph
+                if STRUCTURED_EXTRACTION:
+                    st.text(image_analysis)
+                else:
+                    st.write(image_analysis)
+                cache_stats = vision_cache.stats()
+                upload_stats = vision_upload_stats()
+                st.caption(f"Vision cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+                if upload_stats["images"]:
+                    st.caption(
+                        f"Vision uploads: {upload_stats['encoded_bytes'] / 1024:,.0f} KB sent "
+                        f"(from {upload_stats['original_bytes'] / 1024:,.0f} KB), ~{upload_stats['estimated_tokens']:,} image tokens"
+                    )
+
+# Combine context - large files contribute only the chunks relevant to each question.
+# Parts that stay the same from turn to turn go first so the prompt prefix keeps hitting the provider cache.
+def build_context(question):
+    combined_context = ""
+    if image_analysis:
+        combined_context += f"IMAGE ANALYSIS:\n{image_analysis}\n\n"
+    return combined_context + dealership_context(question)
+
+def dealership_context(question):
+    """The document and knowledge-base part of the context; the image analysis is the customer's own data"""
+    combined_context = ""
+    if file_text:
+        combined_context += f"FILE CONTENT:\n{retrieve_context(file_text, question)}\n\n"
+    knowledge = knowledge_store.retrieve_context(question)
+    if knowledge:
+        combined_context += f"DEALERSHIP KNOWLEDGE BASE:\n{knowledge}\n\n"
+    return combined_context
 
-# Combine context
-combined_context = ""
-if file_text:
-    combined_context += f"FILE CONTENT:\n{file_text}\n\n"
-if image_analysis:
-    combined_context += f"IMAGE ANALYSIS:\n{image_analysis}\n\n"
+# Cached replies are scoped to the dealership data they were answered from
+data_fingerprint = content_hash(file_text, image_analysis, knowledge_store.fingerprint())
 
 # ----------------------
 # Initialize Session State
 # ----------------------
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "history" not in st.session_state:
+    st.session_state.history = ChatHistory(summarize=summarize_history)
+if "booking" not in st.session_state:
+    st.session_state.booking = TestDriveBooking()
 
 # ----------------------
 # Main Chat Interface
 # ----------------------
 st.subheader("💬 Chat Interface")
 
-# Display chat history
-chat_container = st.container()
-with chat_container:
-    if len(st.session_state.messages) == 0:
-        st.info("👋 Welcome! How can I assist you today?")
-    
-    for msg in st.session_state.messages:
-        if msg["role"] == "user":
-            st.markdown(f"""
-                <div class="chat-message user-message">
-                    <strong>👤 You:</strong><br>{msg['content']}
-                </div>
-            """, unsafe_allow_html=True)
-        else:
-            st.markdown(f"""
-                <div class="chat-message bot-message">
-                    <strong>🤖 Assistant:</strong><br>{msg['content']}
-                </div>
-            """, unsafe_allow_html=True)
+CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", "20"))
 
-# Chat input form
-with st.form(key="chat_input_form", clear_on_submit=True):
-    col_input, col_send = st.columns([5, 1])
+def show_earlier_messages():
+    st.session_state.chat_visible += CHAT_PAGE_SIZE
+
+def render_transcript():
+    """Render the newest messages; older ones stay behind a "show earlier" button so each rerun sends a bounded payload"""
+    messages = st.session_state.messages
+    if len(messages) == 0:
+        st.info("👋 Welcome! How can I assist you today?")
+        return
     
-    with col_input:
-        user_input = st.text_input(
-            "Type your message",
-            placeholder="Ask me anything about Toyota vehicles, services, or upload documents...",
-            label_visibility="collapsed"
-        )
+    visible = st.session_state.setdefault("chat_visible", CHAT_PAGE_SIZE)
+    hidden = max(0, len(messages) - visible) if CHAT_PAGE_SIZE else 0
+    if hidden:
+        st.button(f"⬆️ Show earlier messages ({hidden} hidden)", key="show_earlier", on_click=show_earlier_messages)
     
-    with col_send:
-        submitted = st.form_submit_button("Send ➤", use_container_width=True)
+    for msg in messages[hidden:]:
+        st.markdown(message_html(msg["role"], msg["content"]), unsafe_allow_html=True)
+
+QUICK_ACTIONS = [
+    ("📞 Ask A Representative", "I want to ask a representative."),
+    ("🚗 Book A Test Drive", "I want to book a test drive."),
+    ("🎁 Explore Promos", "I want to explore current promotions."),
+    ("🔧 Service Booking", "I want to book a service appointment."),
+]
+
+@st.fragment
+def chat_view():
+    """Transcript, input and quick actions rerun on their own, so a chat turn doesn't re-send the header, sidebar or uploads"""
+    # New turns stream into the end of the transcript in place; widget interactions rerun only this fragment
+    chat_container = st.container()
+    with chat_container:
+        render_transcript()
+
+    with st.container():
+        reply_cache_stats = response_cache.stats()
+        if reply_cache_stats["exact_hits"] + reply_cache_stats["semantic_hits"]:
+            st.caption(
+                f"⚡ Reply cache: {reply_cache_stats['hit_rate']:.0%} hit rate, "
+                f"~{reply_cache_stats['latency_saved_s']:.1f}s of model time saved"
+            )
+
+        history_stats = st.session_state.history.stats()
+        if history_stats["trimmed_turns"]:
+            st.caption(
+                f"🧠 Context: {history_stats['verbatim_tokens']} tokens of recent messages + "
+                f"{history_stats['summary_tokens']}-token summary of {history_stats['trimmed_turns']} earlier turns"
+            )
+
+    # Chat input form
+    with st.form(key="chat_input_form", clear_on_submit=True):
+        col_input, col_send = st.columns([5, 1])
+        
+        with col_input:
+            user_input = st.text_input(
+                "Type your message",
+                placeholder="Ask me anything about Toyota vehicles, services, or upload documents...",
+                label_visibility="collapsed"
+            )
+        
+        with col_send:
+            submitted = st.form_submit_button("Send ➤", use_container_width=True)
+
+    if submitted and user_input:
+        send_message(user_input, chat_container)
+
+    # ----------------------
+    # Quick Action Buttons
+    # ----------------------
+    st.divider()
+    st.subheader("⚡ Quick Actions")
+
+    for column, (label, message) in zip(st.columns(len(QUICK_ACTIONS)), QUICK_ACTIONS):
+        with column:
+            if st.button(label, use_container_width=True):
+                send_message(message, chat_container, quick_action=True)
+
+chat_view()
 
-if submitted and user_input:
-    st.session_state.messages.append({"role": "user", "content": user_input})
-    ai_response = ask_ai(user_input, combined_context, st.session_state.messages)
-    st.session_state.messages.append({"role": "bot", "content": ai_response})
-    st.rerun()
+
+def admin_password():
+    """Secret for actions that change state shared by every session: st.secrets["admin_password"] or ADMIN_PASSWORD"""
+    try:
+        secret = st.secrets.get("admin_password")
+    except FileNotFoundError:
+        secret = None
+    return secret or os.getenv("ADMIN_PASSWORD", "")
+
+def admin_signed_in():
+    """Password prompt; without a configured secret, shared state can only be changed with the ingest CLI"""
+    if st.session_state.get("admin_signed_in"):
+        return True
+    secret = admin_password()
+    if not secret:
+        st.caption("Set admin_password in secrets (or ADMIN_PASSWORD) to manage tracing and the knowledge base here; use ingest.py otherwise.")
+        return False
+    entered = st.text_input("Admin password", type="password", key="admin_password_input")
+    if entered and hmac.compare_digest(entered.encode("utf-8"), secret.encode("utf-8")):
+        st.session_state.admin_signed_in = True
+        return True
+    if entered:
+        st.caption("Wrong password.")
+    return False
 
 # ----------------------
-# Quick Action Buttons
+# Admin Panel (set ADMIN_PANEL=1; changes need the admin password)
 # ----------------------
-st.divider()
-st.subheader("⚡ Quick Actions")
+if os.getenv("ADMIN_PANEL", "").lower() in ("1", "true", "yes"):
+    with st.sidebar:
+        with st.expander("🛠️ Admin: Performance"):
+            can_manage = admin_signed_in()
+            if can_manage:
+                # Process-wide switch; turning it off makes tracing a no-op for every session
+                tracing.set_enabled(st.toggle("Enable tracing", value=tracing.enabled()))
 
-col1, col2, col3, col4 = st.columns(4)
+            st.markdown("**Stages**")
+            st.dataframe(tracing.stage_summary(), hide_index=True, use_container_width=True)
 
-with col1:
-    if st.button("📞 Ask A Representative", use_container_width=True):
-        handle_quick_action("I want to ask a representative.", combined_context)
-        st.rerun()
+            st.markdown("**Model tokens** (cached = served from the provider's prompt cache)")
+            st.dataframe(tracing.usage_summary(), hide_index=True, use_container_width=True)
 
-with col2:
-    if st.button("🚗 Book A Test Drive", use_container_width=True):
-        handle_quick_action("I want to book a test drive.", combined_context)
-        st.rerun()
+            st.markdown("**Model tiers** (chat turns; escalated = small-tier answer retried on the large tier)")
+            model_tier_summary = tier_summary()
+            st.dataframe(model_tier_summary["tiers"], hide_index=True, use_container_width=True)
+            st.caption(f"Routing reasons: {model_tier_summary['route_reasons']}")
 
-with col3:
-    if st.button("🎁 Explore Promos", use_container_width=True):
-        handle_quick_action("I want to explore current promotions.", combined_context)
-        st.rerun()
+            st.markdown("**Recent spans**")
+            st.dataframe(list(tracing.recent_spans)[-20:][::-1], hide_index=True, use_container_width=True)
 
-with col4:
-    if st.button("🔧 Service Booking", use_container_width=True):
-        handle_quick_action("I want to book a service appointment.", combined_context)
-        st.rerun()
+            st.markdown("**Knowledge base**")
+            # Shared by every session and fed into every customer's prompt, so only signed-in admins change it
+            # (bulk loads can also use the ingest CLI)
+            if can_manage:
+                knowledge_uploads = st.file_uploader(
+                    "Add documents",
+                    type=["pdf", "txt", "csv", "docx", "png", "jpg", "jpeg"],
+                    accept_multiple_files=True,
+                    key="knowledge_uploads"
+                )
+                submitted_knowledge = st.session_state.setdefault("knowledge_jobs", {})
+                for upload in knowledge_uploads or []:
+                    if upload.file_id not in submitted_knowledge:
+                        submitted_knowledge[upload.file_id] = jobs.submit_analysis("knowledge", upload).id
+                for upload in knowledge_uploads or []:
+                    job = jobs.get(submitted_knowledge[upload.file_id])
+                    if job is not None:
+                        outcome = job.error or job.result if job.finished else job.status
+                        st.caption(f"{upload.name}: {outcome}")
+            for source in knowledge_store.sources():
+                col_name, col_remove = st.columns([4, 1])
+                col_name.caption(f"{source['name']} · {source['kind']} · {source['chunks']} chunks")
+                if can_manage and col_remove.button("✕", key=f"remove_{source['name']}"):
+                    knowledge_store.remove(source["name"])
+                    st.rerun()
+
+            st.markdown("**Caches & limiter**")
+            st.json({
+                "vision_cache": vision_cache.stats(),
+                "document_cache": document_cache.stats(),
+                "reply_cache": response_cache.stats(),
+                "llm_limiter": limiter.stats(),
+                "llm_call_layer": resilience_stats(),
+                "analysis_jobs": jobs.stats(),
+                "knowledge_base": knowledge_store.stats(),
+                "pdf_vision_routing": vision_routing_stats(),
+                "intent_router": intent_router_stats(),
+                "test_drive_booking": st.session_state.booking.as_dict(),
+            }, expanded=False)
 
+            st.markdown("**Prometheus metrics**")
+            st.code(tracing.render_prometheus(), language="text")
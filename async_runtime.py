@@ -0,0 +1,135 @@
+import asyncio
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from resilience import DeadlineExceeded, remaining_s
+
+# Model calls allowed in flight across the whole process, and how many may queue behind them
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "256"))
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+class LimiterOverloaded(RuntimeError):
+    """Raised instead of queueing when the limiter's wait queue is already full"""
+
+
+def get_loop():
+    """Return the process-wide event loop, starting it on a daemon thread the first time.
+
+    Every async model call runs here, so the shared async HTTP client and the limiter are only
+    ever touched from one loop no matter how many Streamlit script threads submit work.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def run_async(coro, timeout=None):
+    """Run a coroutine on the shared loop from synchronous code and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
+
+
+def submit_async(coro):
+    """Schedule a coroutine on the shared loop without waiting; returns a concurrent.futures.Future"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+class ConcurrencyLimiter:
+    """Async semaphore with backpressure and queue-depth metrics.
+
+    At most `max_concurrency` holders run at once; up to `max_queue` more wait their turn and anything
+    beyond that fails fast with LimiterOverloaded. Counters are only mutated on the event loop thread.
+    """
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, max_queue=LLM_MAX_QUEUE):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._semaphore = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_s = 0.0
+
+    async def __aenter__(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        if self._semaphore.locked():
+            if self.max_queue and self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise LimiterOverloaded(f"{self.waiting} requests already waiting for a model slot")
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+            start = time.perf_counter()
+            try:
+                await self._semaphore.acquire()
+            finally:
+                self.waiting -= 1
+            self.total_wait_s += time.perf_counter() - start
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.in_flight -= 1
+        self.completed += 1
+        self._semaphore.release()
+
+    @contextmanager
+    def hold(self):
+        """Sync `async with limiter` for blocking calls from script or worker threads (never the loop thread).
+
+        The slot is taken and released on the shared loop, so sync and async callers share one budget
+        and one set of counters. Inside a resilience call, waiting for the slot counts against the call's
+        deadline and raises DeadlineExceeded once it runs out.
+        """
+        timeout = remaining_s()
+        try:
+            run_async(asyncio.wait_for(self.__aenter__(), None if timeout is None else max(0.0, timeout)))
+        except TimeoutError:
+            raise DeadlineExceeded("No model slot free before the deadline") from None
+        try:
+            yield self
+        finally:
+            run_async(self.__aexit__(None, None, None))
+
+    def wrap(self, fn):
+        """fn, made to hold a slot while it runs"""
+        def run():
+            with self.hold():
+                return fn()
+        return run
+
+    def reset(self, max_concurrency=None, max_queue=None):
+        """Reconfigure and zero the counters; only call while nothing is in flight"""
+        self.max_concurrency = max_concurrency or self.max_concurrency
+        self.max_queue = self.max_queue if max_queue is None else max_queue
+        self._semaphore = None
+        self.in_flight = self.waiting = self.peak_waiting = self.completed = self.rejected = 0
+        self.total_wait_s = 0.0
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "peak_queue_depth": self.peak_waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_s": self.total_wait_s / self.completed if self.completed else 0.0,
+        }
+
+
+limiter = ConcurrencyLimiter()
@@ -0,0 +1,119 @@
+"""Load test of the async request path against a local fake LLM - no network, no API key.
+
+    python -m benchmarks.bench_async_load --sessions 50 200 --turns 3 --latency 0.5 --max-concurrency 32
+
+Each simulated session sends `turns` questions one after another through aask_ai; all sessions run at
+once on the shared event loop. The sync baseline runs the same sessions with ask_ai, one thread each,
+the way Streamlit script threads do today.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from async_runtime import limiter, run_async
+from benchmarks.fake_llm import install_fake_llm
+from functionalities import aask_ai, ask_ai
+
+QUESTIONS = [
+    "How much is the Vios?",
+    "Do you have promos for the Fortuner this month?",
+    "I want to book a test drive.",
+    "What are your branch hours in Makati?",
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(mode, sessions, latencies, elapsed, errors, extra):
+    return {
+        "mode": mode,
+        "sessions": sessions,
+        "requests": len(latencies),
+        "errors": errors,
+        "wall_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_s": round(statistics.median(latencies), 3),
+        "p95_s": round(percentile(latencies, 95), 3),
+        **extra,
+    }
+
+
+async def run_sessions(sessions, turns):
+    latencies = []
+    errors = 0
+
+    async def session(index):
+        nonlocal errors
+        for turn in range(turns):
+            start = time.perf_counter()
+            reply = await aask_ai(QUESTIONS[(index + turn) % len(QUESTIONS)], "")
+            latencies.append(time.perf_counter() - start)
+            errors += reply.startswith("Error")
+
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    return latencies, errors
+
+
+def load_async(sessions, turns, max_concurrency, max_queue):
+    limiter.reset(max_concurrency, max_queue)
+    start = time.perf_counter()
+    latencies, errors = run_async(run_sessions(sessions, turns))
+    elapsed = time.perf_counter() - start
+    stats = limiter.stats()
+    return summarize("async", sessions, latencies, elapsed, errors, {
+        "max_concurrency": max_concurrency,
+        "peak_queue_depth": stats["peak_queue_depth"],
+        "avg_queue_wait_s": round(stats["avg_wait_s"], 3),
+        "rejected": stats["rejected"],
+        "threads": threading.active_count(),
+    })
+
+
+def load_sync(sessions, turns):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def session(index):
+        nonlocal errors
+        for turn in range(turns):
+            start = time.perf_counter()
+            reply = ask_ai(QUESTIONS[(index + turn) % len(QUESTIONS)], "")
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                errors += reply.startswith("Error")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        list(pool.map(session, range(sessions)))
+    return summarize("sync-threads", sessions, latencies, time.perf_counter() - start, errors, {"threads": sessions})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.5, help="fake model latency in seconds")
+    parser.add_argument("--max-concurrency", type=int, default=32)
+    parser.add_argument("--max-queue", type=int, default=1000)
+    parser.add_argument("--skip-sync", action="store_true", help="skip the thread-per-session baseline")
+    args = parser.parse_args()
+
+    install_fake_llm(latency=args.latency)
+    results = []
+    for sessions in args.sessions:
+        results.append(load_async(sessions, args.turns, args.max_concurrency, args.max_queue))
+        if not args.skip_sync:
+            results.append(load_sync(sessions, args.turns))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
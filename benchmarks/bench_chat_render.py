@@ -0,0 +1,85 @@
+"""Server render time and websocket payload of the chat page at different conversation lengths.
+
+    python -m benchmarks.bench_chat_render --messages 10 100 500
+
+Payload is the serialized size of every element the run sends to the browser. "full_*" covers a whole-page
+rerun (uploads, sidebar interactions); "chat_turn_bytes" covers the chat fragment alone, which is all a
+message send or quick action re-sends now. "unpaginated" renders the whole transcript (CHAT_PAGE_SIZE=0),
+the way every rerun used to.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+BOT_REPLY = (
+    "The Toyota Vios 1.5 G CVT starts at ₱1,020,000. We also have flexible financing plans - monthly starts "
+    "at ₱17,000 with 20% down over 60 months. Would you like me to share the current promo for the Vios too?"
+)
+
+
+def payload_bytes(node):
+    proto = getattr(node, "proto", None)
+    size = proto.ByteSize() if proto is not None and hasattr(proto, "ByteSize") else 0
+    return size + sum(payload_bytes(child) for child in getattr(node, "children", {}).values())
+
+
+def contains(node, element_type):
+    if type(node).__name__ == element_type:
+        return True
+    return any(contains(child, element_type) for child in getattr(node, "children", {}).values())
+
+
+def chat_fragment(tree):
+    """The top-level main-area block holding the chat input, i.e. the chat_view fragment"""
+    main = next(iter(tree.children.values()))
+    return next(child for child in main.children.values() if type(child).__name__ == "Block" and contains(child, "TextInput"))
+
+
+def measure(count, page_size, repeat):
+    os.environ["CHAT_PAGE_SIZE"] = str(page_size)
+    app = AppTest.from_file(APP_PATH, default_timeout=120)
+    app.session_state["messages"] = [
+        {"role": "user", "content": f"Question {i}: how much is the Vios?"} if i % 2 == 0 else {"role": "bot", "content": BOT_REPLY}
+        for i in range(count)
+    ]
+    app.run()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        app.run()
+        timings.append(time.perf_counter() - start)
+    return {
+        "full_rerun_ms": round(statistics.median(timings) * 1000, 2),
+        "full_payload_bytes": payload_bytes(app._tree),
+        "chat_turn_bytes": payload_bytes(chat_fragment(app._tree)),
+    }
+
+
+def run(counts, repeat, page_size):
+    results = []
+    for count in counts:
+        results.append({
+            "messages": count,
+            "paginated": measure(count, page_size, repeat),
+            "unpaginated": measure(count, 0, repeat),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--page-size", type=int, default=int(os.getenv("CHAT_PAGE_SIZE", "20")))
+    args = parser.parse_args()
+    print(json.dumps(run(args.messages, args.repeat, args.page_size), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Per-call setup overhead of building ChatOpenAI clients and the ask_ai chain, before and after the registry.
+
+    python -m benchmarks.bench_clients --calls 200
+
+No requests are sent: this isolates client construction, prompt compilation and chain assembly,
+which the old code paid on every ask_ai / analyze_* call.
+"""
+import argparse
+import json
+import os
+import time
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_openai import ChatOpenAI
+
+import clients
+from functionalities import CHAT_MODEL, build_ai_chain
+
+
+def per_call_fresh(template_text):
+    # What ask_ai did before: a new client, a re-parsed template and a new chain every call
+    llm = ChatOpenAI(model=CHAT_MODEL, temperature=0, api_key=os.getenv("OPENAI_API_KEY"))
+    return ChatPromptTemplate.from_template(template_text) | llm | StrOutputParser()
+
+
+def per_call_registry():
+    return clients.get_chain("ask_ai", build_ai_chain)
+
+
+def time_calls(fn, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+    template_text = build_ai_chain().first.messages[0].prompt.template
+    clients.reset()
+    before_us = time_calls(lambda: per_call_fresh(template_text), args.calls)
+    clients.reset()
+    first_us = time_calls(per_call_registry, 1)
+    after_us = time_calls(per_call_registry, args.calls)
+
+    print(json.dumps({
+        "calls": args.calls,
+        "fresh_client_and_chain_us_per_call": round(before_us, 1),
+        "registry_first_call_us": round(first_us, 1),
+        "registry_us_per_call": round(after_us, 2),
+        "speedup": round(before_us / after_us, 1) if after_us else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
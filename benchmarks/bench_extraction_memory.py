@@ -0,0 +1,81 @@
+"""Peak memory and time of text extraction: the original `text +=` code against the streaming extractor.
+
+    python -m benchmarks.bench_extraction_memory --pdf-pages 300 --csv-rows 100000
+
+Memory is the tracemalloc peak while extracting, on top of the input bytes themselves.
+"first_chunk_ms" is how long the UI waits before it can show a preview.
+"""
+import argparse
+import csv
+import json
+import time
+import tracemalloc
+
+import PyPDF2
+
+from benchmarks.data import make_csv, make_text_pdf
+from functionalities import iter_uploaded_file
+
+
+def legacy_extract(file):
+    # read_uploaded_file as it was before streaming extraction
+    if file.type == "application/pdf":
+        reader = PyPDF2.PdfReader(file)
+        text = ""
+        for page in reader.pages:
+            extracted = page.extract_text()
+            if extracted:
+                text += extracted + "\n"
+        return text
+    csv_text = ""
+    decoded = file.read().decode("utf-8").splitlines()
+    for row in csv.reader(decoded):
+        csv_text += ", ".join(row) + "\n"
+    return csv_text
+
+
+def streaming_extract(file, on_first_chunk):
+    chunks = []
+    for chunk in iter_uploaded_file(file):
+        if not chunks:
+            on_first_chunk()
+        chunks.append(chunk)
+    return "".join(chunks)
+
+
+def measure(label, file, streaming):
+    file.seek(0)
+    first_chunk = []
+    start = time.perf_counter()
+    tracemalloc.start()
+    if streaming:
+        text = streaming_extract(file, lambda: first_chunk.append(time.perf_counter()))
+    else:
+        text = legacy_extract(file)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    elapsed = time.perf_counter() - start
+    return {
+        "input": label,
+        "method": "streaming" if streaming else "legacy",
+        "input_mb": round(len(file.getvalue()) / 1e6, 2),
+        "output_mb": round(len(text) / 1e6, 2),
+        "peak_mb": round(peak / 1e6, 2),
+        "seconds": round(elapsed, 3),
+        "first_chunk_ms": round((first_chunk[0] - start) * 1000, 1) if first_chunk else round(elapsed * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf-pages", type=int, default=300)
+    parser.add_argument("--csv-rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    inputs = [(f"pdf-{args.pdf_pages}p", make_text_pdf(args.pdf_pages)), (f"csv-{args.csv_rows}r", make_csv(args.csv_rows))]
+    results = [measure(label, file, streaming) for label, file in inputs for streaming in (False, True)]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Intent router decision latency and the share of chat turns answered without a model call.
+
+    python -m benchmarks.bench_intent_router --latency 1.0
+
+Replays scripted conversations (quick actions, the test-drive booking script, open questions mixed into a
+booking, Filipino turns) with the router on and off. Turns the router doesn't answer go to ask_ai on the
+fake LLM, so end-to-end time and model calls are comparable between the two modes.
+"""
+import argparse
+import json
+import statistics
+import time
+
+import intent_router
+from benchmarks.bench_retrieval import make_price_list
+from benchmarks.fake_llm import install_fake_llm
+from functionalities import ask_ai, load_system_prompt
+from history import format_messages
+from tokens import count_tokens
+
+CONVERSATIONS = {
+    "test drive via quick action": [
+        "I want to book a test drive.", "The Fortuner", "I'm in Makati", "October 11 at 3pm",
+        "Juan Dela Cruz 09171234567",
+    ],
+    "test drive typed with car": [
+        "Hi", "Can I book a test drive for the Vios?", "Cebu", "tomorrow 10am", "my name is Ana Santos",
+        "0917 555 1234",
+    ],
+    "booking interrupted by questions": [
+        "I'd like to schedule a test drive", "How much is the Hilux?", "Hilux", "Where is your Pasig branch?",
+        "Pasig", "Saturday 2pm", "Mark Reyes, 09181112222",
+    ],
+    "open questions": [
+        "What promos do you have for the Fortuner?", "Compare the Hilux and the Innova monthly payments",
+        "Do you have financing for the Raize?", "I want to explore current promotions.",
+    ],
+    "quick actions": ["I want to ask a representative.", "I want to book a service appointment."],
+    "filipino": ["Magkano po ang Vios?", "Gusto ko po mag test drive ng Wigo", "Taga Davao po ako"],
+}
+
+
+def replay(messages, documents, use_router):
+    intent_router.INTENT_ROUTER = use_router
+    booking = intent_router.TestDriveBooking()
+    transcript = []
+    decisions = []
+    llm_calls = 0
+    start = time.perf_counter()
+    for message in messages:
+        decision_start = time.perf_counter()
+        _, reply = intent_router.route(message, booking, branch_lookup=lambda location: documents)
+        decisions.append(time.perf_counter() - decision_start)
+        if reply is None:
+            reply = ask_ai(message, format_messages(transcript), documents)
+            llm_calls += 1
+        transcript += [{"role": "user", "content": message}, {"role": "bot", "content": reply}]
+    return {"seconds": time.perf_counter() - start, "llm_calls": llm_calls, "decisions": decisions}
+
+
+def run(latency):
+    install_fake_llm(latency=latency, first_token_latency=0.0)
+    documents = f"FILE CONTENT:\n{make_price_list(40)}\n\n"
+    prompt_tokens = count_tokens(load_system_prompt()) + count_tokens(documents)
+    results = []
+    decisions = []
+    totals = {"turns": 0, "llm_calls": 0, "routed_s": 0.0, "llm_only_s": 0.0}
+    for name, messages in CONVERSATIONS.items():
+        routed = replay(messages, documents, True)
+        llm_only = replay(messages, documents, False)
+        decisions += routed["decisions"]
+        totals["turns"] += len(messages)
+        totals["llm_calls"] += routed["llm_calls"]
+        totals["routed_s"] += routed["seconds"]
+        totals["llm_only_s"] += llm_only["seconds"]
+        results.append({
+            "conversation": name,
+            "turns": len(messages),
+            "llm_calls": routed["llm_calls"],
+            "seconds_routed": round(routed["seconds"], 3),
+            "seconds_llm_only": round(llm_only["seconds"], 3),
+        })
+    intent_router.INTENT_ROUTER = True
+
+    skipped = totals["turns"] - totals["llm_calls"]
+    decisions_us = sorted(seconds * 1e6 for seconds in decisions)
+    return {
+        "conversations": results,
+        "summary": {
+            "turns": totals["turns"],
+            "turns_without_llm": skipped,
+            "llm_skip_rate": round(skipped / totals["turns"], 3),
+            "decision_p50_us": round(statistics.median(decisions_us), 1),
+            "decision_p99_us": round(decisions_us[int(len(decisions_us) * 0.99) - 1], 1),
+            "decision_max_us": round(decisions_us[-1], 1),
+            "est_prompt_tokens_avoided": skipped * prompt_tokens,
+            "seconds_routed": round(totals["routed_s"], 3),
+            "seconds_llm_only": round(totals["llm_only_s"], 3),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=1.0, help="fake model latency per call in seconds")
+    args = parser.parse_args()
+    print(json.dumps(run(args.latency), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Replay recorded conversations through ask_ai with model tiering on and off, on a stub backend.
+
+    python -m benchmarks.bench_model_tiers
+    python -m benchmarks.bench_model_tiers --conversations transcripts.jsonl
+
+A transcripts file has one JSON object per line: {"conversation": "...", "messages": ["user turn", ...]}.
+The stub answers like gpt-4o-mini / gpt-4o would in latency and token usage; the small tier replies with the
+fallback message to questions containing any of `--small-fallback-on`, which exercises escalation. Reports
+per-tier calls, escalations, latency, tokens and cost for both modes.
+"""
+import argparse
+import json
+import statistics
+import time
+
+import model_tiers
+import tracing
+from benchmarks.bench_intent_router import CONVERSATIONS
+from benchmarks.bench_retrieval import QUESTIONS, make_price_list
+from benchmarks.fake_llm import clear_prompt_cache, install_fake_llm
+from functionalities import ask_ai
+from history import format_messages
+from retrieval import retrieve_context
+
+RECORDED = [{"conversation": name, "messages": messages} for name, messages in CONVERSATIONS.items()]
+RECORDED.append({"conversation": "price questions", "messages": QUESTIONS})
+
+
+def load_conversations(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def replay(conversations, document):
+    latencies = []
+    for conversation in conversations:
+        transcript = []
+        for message in conversation["messages"]:
+            documents = f"FILE CONTENT:\n{retrieve_context(document, message)}\n\n"
+            start = time.perf_counter()
+            reply = ask_ai(message, format_messages(transcript), documents)
+            latencies.append(time.perf_counter() - start)
+            transcript += [{"role": "user", "content": message}, {"role": "bot", "content": reply}]
+    summary = model_tiers.tier_summary()
+    return {
+        "turns": len(latencies),
+        "median_answer_s": round(statistics.median(latencies), 3),
+        "total_answer_s": round(sum(latencies), 3),
+        "usd": round(sum(row["usd"] for row in summary["tiers"]), 5),
+        **summary,
+    }
+
+
+def run(conversations, small_latency, large_latency, small_fallback_on):
+    install_fake_llm(
+        first_token_latency=0.0,
+        per_model={
+            model_tiers.SMALL_MODEL: {"latency": small_latency, "fallback_when": tuple(small_fallback_on)},
+            model_tiers.LARGE_MODEL: {"latency": large_latency},
+        },
+    )
+    document = make_price_list(200)
+    results = {}
+    for mode, routing in (("large_only", False), ("tiered", True)):
+        model_tiers.MODEL_ROUTING = routing
+        model_tiers.reset_stats()
+        tracing.reset()
+        clear_prompt_cache()
+        results[mode] = replay(conversations, document)
+    model_tiers.MODEL_ROUTING = True
+    results["cost_reduction"] = round(1 - results["tiered"]["usd"] / results["large_only"]["usd"], 3)
+    results["latency_reduction"] = round(1 - results["tiered"]["total_answer_s"] / results["large_only"]["total_answer_s"], 3)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", help="JSONL transcripts to replay (default: built-in conversations)")
+    parser.add_argument("--small-latency", type=float, default=0.25, help="stub small-tier latency in seconds")
+    parser.add_argument("--large-latency", type=float, default=0.8, help="stub large-tier latency in seconds")
+    parser.add_argument("--small-fallback-on", nargs="*", default=["financing", "service appointment"],
+                        help="phrases the stub small tier answers with the fallback message")
+    args = parser.parse_args()
+    conversations = load_conversations(args.conversations) if args.conversations else RECORDED
+    print(json.dumps(run(conversations, args.small_latency, args.large_latency, args.small_fallback_on), indent=2))
+
+
+if __name__ == "__main__":
+    main()
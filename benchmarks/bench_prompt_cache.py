@@ -0,0 +1,96 @@
+"""Prompt-cache hit rate of the chat prompt layout over a multi-turn conversation.
+
+    python -m benchmarks.bench_prompt_cache            # offline: fake LLM that mimics OpenAI prefix caching
+    python -m benchmarks.bench_prompt_cache --live     # real gpt-4o calls: cached tokens + time to first token
+
+Compares the legacy layout (one human message with the question, documents and history spliced into the
+middle of the instructions) against build_ai_chain's stable-prefix layout, for a small document passed whole
+and for a large price list where retrieval picks different chunks every turn.
+"""
+import argparse
+import json
+import time
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+import tracing
+from benchmarks.bench_retrieval import QUESTIONS, make_price_list
+from benchmarks.fake_llm import clear_prompt_cache, install_fake_llm
+from clients import get_llm
+from functionalities import CHAT_MODEL, build_ai_chain, load_system_prompt
+from history import format_messages
+from retrieval import retrieve_context
+
+# gpt-4o list prices per 1M input tokens; cached prompt tokens are billed at half price
+INPUT_USD_PER_1M = 2.50
+CACHED_INPUT_USD_PER_1M = 1.25
+
+
+def build_legacy_chain():
+    """The pre-restructuring prompt: variables spliced in right after the opening paragraph, one human message"""
+    intro, separator, rules = load_system_prompt().partition("---")
+    template = (
+        intro
+        + "User Question: {question}\nDocuments: {documents}\nChat History: {chat_history}\n"
+        + separator
+        + rules
+    )
+    return ChatPromptTemplate.from_template(template) | get_llm(CHAT_MODEL) | StrOutputParser()
+
+
+def run_conversation(chain, stage, document, live):
+    messages = []
+    first_token_s = []
+    for question in QUESTIONS * 2:
+        documents = f"FILE CONTENT:\n{retrieve_context(document, question)}\n\n"
+        inputs = {"question": question, "documents": documents, "chat_history": format_messages(messages)}
+        config = {"callbacks": tracing.callbacks(tracing.NOOP_SPAN, stage)}
+        start = time.perf_counter()
+        reply = ""
+        for token in chain.stream(inputs, config=config):
+            if not reply:
+                first_token_s.append(time.perf_counter() - start)
+            reply += token
+        messages += [{"role": "user", "content": question}, {"role": "bot", "content": reply}]
+
+    totals = next(row for row in tracing.usage_summary() if row["stage"] == stage)
+    uncached = totals["prompt_tokens"] - totals["cached_tokens"]
+    cost = (uncached * INPUT_USD_PER_1M + totals["cached_tokens"] * CACHED_INPUT_USD_PER_1M) / 1e6
+    result = {
+        "turns": len(first_token_s),
+        "prompt_tokens": totals["prompt_tokens"],
+        "cached_tokens": totals["cached_tokens"],
+        "cache_hit_rate": totals["cache_hit_rate"],
+        "input_usd": round(cost, 5),
+    }
+    if live:
+        result["avg_time_to_first_token_s"] = round(sum(first_token_s) / len(first_token_s), 3)
+    return result
+
+
+def run(live=False):
+    if not live:
+        install_fake_llm(latency=0.0, first_token_latency=0.0)
+    documents = {
+        "small document (passed whole)": make_price_list(20),
+        "large price list (retrieved per question)": make_price_list(2000),
+    }
+    results = []
+    for document_name, document in documents.items():
+        for layout, build in (("legacy", build_legacy_chain), ("stable_prefix", build_ai_chain)):
+            clear_prompt_cache()
+            stage = f"bench.{layout}.{len(results)}"
+            results.append({"document": document_name, "layout": layout, **run_conversation(build(), stage, document, live)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="call the real model (needs OPENAI_API_KEY)")
+    args = parser.parse_args()
+    print(json.dumps(run(live=args.live), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Chat latency and failures under injected faults, with and without the resilient call layer.
+
+    python -m benchmarks.bench_resilience --sessions 8 --turns 5 --error-rate 0.05 --slow-rate 0.1 --rpm 120
+
+Starts the fault-injecting stub (benchmarks.fault_server) and points real ChatOpenAI clients at it, then runs
+`sessions` concurrent chats of `turns` ask_ai calls each in two modes:
+
+- "sdk_defaults": how calls were made before - the SDK's own 2 retries and 600 s timeout, no deadline,
+  no hedging, no shared rate budget.
+- "resilient": the resilience layer with its per-attempt timeout, deadline, jittered retries, hedging after
+  `--hedge-after` seconds, and an RPM budget matching the stub's limit.
+"""
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+
+import clients
+import resilience
+from benchmarks.fault_server import start_server
+from functionalities import ask_ai
+from langchain_openai import ChatOpenAI
+
+QUESTIONS = ["How much is the Vios?", "Any promos on the Fortuner?", "Where is your Makati branch?", "Hilux price?"]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_mode(base_url, sessions, turns, sdk_retries, attempt_timeout):
+    clients.set_llm_factory(lambda **kwargs: ChatOpenAI(
+        **kwargs, base_url=base_url, api_key="x", max_retries=sdk_retries, timeout=attempt_timeout, stream_usage=True,
+        http_client=clients.get_http_client(),
+    ))
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def session(index):
+        for turn in range(turns):
+            start = time.perf_counter()
+            reply = ask_ai(QUESTIONS[(index + turn) % len(QUESTIONS)], "")
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                if reply.startswith("Error"):
+                    errors.append(reply[:120])
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=session, args=(index,)) for index in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "wall_s": round(time.perf_counter() - start, 2),
+        "p50_s": round(statistics.median(latencies), 3),
+        "p95_s": round(percentile(latencies, 0.95), 3),
+        "p99_s": round(percentile(latencies, 0.99), 3),
+        "max_s": round(max(latencies), 3),
+        "sample_errors": sorted(set(errors))[:3],
+    }
+
+
+def run(sessions, turns, latency, error_rate, drop_rate, slow_rate, slow_latency, rpm, hedge_after, deadline, seed=7):
+    results = {}
+    for mode in ("sdk_defaults", "resilient"):
+        server, config, base_url = start_server(
+            latency=latency, error_rate=error_rate, drop_rate=drop_rate, slow_rate=slow_rate,
+            slow_latency=slow_latency, rpm=rpm, seed=seed,
+        )
+        resilience.reset_stats()
+        if mode == "sdk_defaults":
+            resilience.LLM_RETRIES, resilience.LLM_HEDGE_AFTER_S, resilience.LLM_DEADLINE_S = 0, 0, 3600
+            resilience.scheduler.configure(0, 0)
+            row = run_mode(base_url, sessions, turns, sdk_retries=2, attempt_timeout=600)
+        else:
+            resilience.LLM_RETRIES, resilience.LLM_HEDGE_AFTER_S, resilience.LLM_DEADLINE_S = 3, hedge_after, deadline
+            resilience.scheduler.configure(rpm, 0)
+            row = run_mode(base_url, sessions, turns, sdk_retries=0, attempt_timeout=resilience.LLM_ATTEMPT_TIMEOUT_S)
+        server.shutdown()
+        row["server"] = dict(config.counts)
+        row["call_layer"] = resilience.resilience_stats()
+        results[mode] = row
+    clients.set_llm_factory(None)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.3, help="stub latency of a normal response")
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--drop-rate", type=float, default=0.02)
+    parser.add_argument("--slow-rate", type=float, default=0.1)
+    parser.add_argument("--slow-latency", type=float, default=20.0)
+    parser.add_argument("--rpm", type=int, default=120, help="stub's requests-per-minute limit (0 = none)")
+    parser.add_argument("--hedge-after", type=float, default=1.5)
+    parser.add_argument("--deadline", type=float, default=30.0)
+    args = parser.parse_args()
+    # Attempts that lose a hedge or time out are abandoned, so give the stub a short per-attempt timeout
+    resilience.LLM_ATTEMPT_TIMEOUT_S = float(os.getenv("LLM_ATTEMPT_TIMEOUT_S", "5"))
+    print(json.dumps(run(
+        args.sessions, args.turns, args.latency, args.error_rate, args.drop_rate, args.slow_rate,
+        args.slow_latency, args.rpm, args.hedge_after, args.deadline,
+    ), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Compare prompt size and latency of full-document stuffing against BM25 retrieval.
+
+    python -m benchmarks.bench_retrieval            # offline: prompt tokens + retrieval overhead
+    python -m benchmarks.bench_retrieval --live     # also time real ask_ai calls (needs OPENAI_API_KEY)
+"""
+import argparse
+import json
+import random
+import time
+
+from functionalities import ask_ai, build_ai_chain
+from retrieval import get_index, index_cache, retrieve_context
+from tokens import count_tokens
+
+MODELS = ["Vios", "Corolla Altis", "Camry", "Wigo", "Raize", "Rush", "Innova", "Fortuner", "Hilux", "Land Cruiser"]
+VARIANTS = ["1.3 XLE MT", "1.5 G CVT", "2.4 V AT", "2.8 LTD 4x4", "GR-S", "HEV"]
+BRANCHES = ["Makati", "Quezon City", "Pasig", "Cebu", "Davao", "Iloilo", "Pampanga", "Batangas"]
+
+QUESTIONS = [
+    "How much is the Vios 1.5 G CVT?",
+    "What promos do you have for the Fortuner?",
+    "Where is your Cebu branch and what are the hours?",
+    "Compare the Hilux and the Innova monthly payments",
+    "I want to book a test drive.",
+]
+
+
+def make_price_list(rows, seed=7):
+    """Generate a dealership price list with `rows` priced variants plus branch and promo sections"""
+    rng = random.Random(seed)
+    lines = ["TOYOTA PHILIPPINES - OFFICIAL PRICE LIST", ""]
+    for i in range(rows):
+        model = MODELS[i % len(MODELS)]
+        variant = VARIANTS[rng.randrange(len(VARIANTS))]
+        price = rng.randrange(700, 4000) * 1000
+        lines.append(f"{model} {variant} - SRP ₱{price:,} - Monthly from ₱{price // 60:,} (60 months, 20% DP)")
+    lines += ["", "BRANCHES"]
+    for branch in BRANCHES:
+        lines.append(f"Toyota {branch} - {rng.randrange(1, 999)} Main Ave, {branch} - Open 8AM-6PM Mon-Sat - (02) 8{rng.randrange(100, 999)}-{rng.randrange(1000, 9999)}")
+    lines += ["", "PROMOS"]
+    for model in MODELS:
+        lines.append(f"{model}: ₱{rng.randrange(20, 150)}K cash discount or free 3-year PMS until end of month")
+    return "\n".join(lines)
+
+
+def prompt_tokens(prompt, question, documents):
+    return count_tokens(prompt.format(question=question, documents=documents, chat_history=[]))
+
+
+def run(sizes, live=False):
+    prompt = build_ai_chain().first
+    results = []
+    for rows in sizes:
+        text = make_price_list(rows)
+        index_cache.clear()
+        start = time.perf_counter()
+        get_index(text)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        for question in QUESTIONS:
+            start = time.perf_counter()
+            retrieved = retrieve_context(text, question)
+            retrieve_ms = (time.perf_counter() - start) * 1000
+            result = {
+                "rows": rows,
+                "question": question,
+                "index_build_ms": round(build_ms, 2),
+                "retrieve_ms": round(retrieve_ms, 3),
+                "full_prompt_tokens": prompt_tokens(prompt, question, text),
+                "retrieval_prompt_tokens": prompt_tokens(prompt, question, retrieved),
+            }
+            if live:
+                for label, documents in (("full", text), ("retrieval", retrieved)):
+                    start = time.perf_counter()
+                    ask_ai(question, [], documents)
+                    result[f"{label}_latency_s"] = round(time.perf_counter() - start, 3)
+            results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--live", action="store_true", help="also time real model calls")
+    args = parser.parse_args()
+
+    results = run(args.rows, live=args.live)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    for rows in args.rows:
+        subset = [r for r in results if r["rows"] == rows]
+        full = sum(r["full_prompt_tokens"] for r in subset) / len(subset)
+        retrieved = sum(r["retrieval_prompt_tokens"] for r in subset) / len(subset)
+        print(f"# {rows} rows: {full:,.0f} -> {retrieved:,.0f} prompt tokens per turn ({full / retrieved:.1f}x smaller)")
+
+
+if __name__ == "__main__":
+    main()
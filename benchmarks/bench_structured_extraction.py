@@ -0,0 +1,277 @@
+"""Context size and answer latency of prose image analyses vs structured extraction records.
+
+    python -m benchmarks.bench_structured_extraction            # offline: fixture analyses + fake LLM
+    python -m benchmarks.bench_structured_extraction --live     # real gpt-4o on generated receipt / price sheet images
+
+For each document, the prose analysis (what analyze_image_with_ai returns) and the dense records block
+(what analyze_image_structured returns) are injected as IMAGE ANALYSIS into a multi-turn conversation.
+Reports the tokens that block adds to every turn, total prompt tokens, and answer latency. Offline, the fake
+model charges `--prefill-ms-per-1k` per uncached prompt token so latency tracks prompt size.
+"""
+import argparse
+import json
+import statistics
+import time
+from io import BytesIO
+
+import extraction
+import tracing
+from benchmarks.bench_retrieval import QUESTIONS
+from benchmarks.fake_llm import clear_prompt_cache, install_fake_llm
+from functionalities import analyze_image_with_ai, build_ai_chain
+from history import format_messages
+from tokens import count_tokens
+
+RECEIPT = {
+    "document_type": "receipt",
+    "merchant": "Toyota Makati - Service Center",
+    "date": "2024-03-14 10:42",
+    "reference_number": "OR-0048213",
+    "currency": "PHP",
+    "line_items": [
+        {"description": "10,000 km periodic maintenance", "quantity": 1, "unit_price": 4850, "amount": 4850},
+        {"description": "Engine oil 0W-20 (4L)", "quantity": 1, "unit_price": 2350, "amount": 2350},
+        {"description": "Oil filter", "quantity": 1, "unit_price": 420, "amount": 420},
+        {"description": "Cabin air filter", "quantity": 1, "unit_price": 980, "amount": 980},
+        {"description": "Wiper blade set", "quantity": 2, "unit_price": 650, "amount": 1300},
+    ],
+    "subtotal": 9900,
+    "tax": 1188,
+    "discount": 500,
+    "total": 10588,
+    "payment_method": "Visa ****4417",
+    "vehicles": [{"model": "Vios", "variant": "1.5 G CVT", "price": None, "monthly": None, "branch": None, "promo": None}],
+    "branches": [{"name": "Toyota Makati", "address": "2293 Chino Roces Ave, Makati", "phone": "(02) 8811-1234", "hours": None}],
+    "contacts": ["SA: J. Reyes"],
+    "handwritten_notes": ["next PMS at 20,000 km", "customer asked about Corolla Cross trade-in"],
+    "other_facts": ["plate NBC 4521", "odometer 10,214 km"],
+}
+
+PRICE_SHEET = {
+    "document_type": "price_sheet",
+    "merchant": "Toyota Quezon City",
+    "date": "March 2024",
+    "reference_number": None,
+    "currency": "PHP",
+    "line_items": [],
+    "subtotal": None,
+    "tax": None,
+    "discount": None,
+    "total": None,
+    "payment_method": None,
+    "vehicles": [
+        {"model": "Vios", "variant": "1.3 XLE MT", "price": 842000, "monthly": 14033, "branch": None, "promo": "₱40,000 cash discount"},
+        {"model": "Vios", "variant": "1.5 G CVT", "price": 1020000, "monthly": 17000, "branch": None, "promo": None},
+        {"model": "Corolla Cross", "variant": "1.8 V HEV", "price": 1690000, "monthly": 28167, "branch": None, "promo": "free 3-year PMS"},
+        {"model": "Fortuner", "variant": "2.8 LTD 4x4", "price": 2500000, "monthly": 41667, "branch": None, "promo": "₱100,000 off"},
+        {"model": "Hilux", "variant": "2.4 G MT", "price": 1470000, "monthly": 24500, "branch": None, "promo": None},
+        {"model": "Innova", "variant": "2.8 E AT", "price": 1520000, "monthly": 25333, "branch": None, "promo": "low DP ₱99,000"},
+    ],
+    "branches": [{"name": "Toyota Quezon City", "address": "EDSA cor. Quezon Ave", "phone": "(02) 8372-8888", "hours": "8AM-6PM Mon-Sat"}],
+    "contacts": ["sales@toyotaqc.example"],
+    "handwritten_notes": ["Fortuner promo until Mar 31"],
+    "other_facts": ["monthly = 60 months, 20% down payment", "prices subject to change without notice"],
+}
+
+# What the prose prompt typically comes back with for the same documents
+RECEIPT_PROSE = """## Comprehensive Image Analysis
+
+### 1. Text Extraction (OCR)
+
+**Printed text:**
+- "TOYOTA MAKATI - SERVICE CENTER"
+- "2293 Chino Roces Avenue, Makati City"
+- "Tel. No. (02) 8811-1234"
+- "OFFICIAL RECEIPT No. OR-0048213"
+- "Date: 03/14/2024  Time: 10:42 AM"
+- "Vehicle: VIOS 1.5 G CVT   Plate No.: NBC 4521   Odometer: 10,214 km"
+- Itemized service lines and totals (see section 3)
+- "Service Advisor: J. Reyes"
+- "Thank you for choosing Toyota!"
+
+**Handwritten text:**
+- In the lower margin, written in blue ink: "next PMS at 20,000 km"
+- Beside the total: "cust. asked abt Corolla Cross trade-in" (handwriting is slightly slanted but legible)
+
+### 2. Document Analysis
+- **Document type:** Official receipt for vehicle maintenance service
+- **Business:** Toyota Makati Service Center
+- **Date/time:** March 14, 2024 at 10:42 AM
+- **Names:** Service advisor J. Reyes
+- **Phone number:** (02) 8811-1234
+- **Signatures/stamps:** A "PAID" stamp in red ink appears at the bottom right, with an illegible signature above the cashier line.
+
+### 3. Receipt/Invoice Analysis
+- **Store/business name and location:** Toyota Makati - Service Center, 2293 Chino Roces Avenue, Makati City
+- **Date and time of transaction:** 03/14/2024, 10:42 AM
+- **Itemized list with prices:**
+  1. 10,000 km Periodic Maintenance Service - 1 x ₱4,850.00 = ₱4,850.00
+  2. Engine Oil 0W-20 (4 Liters) - 1 x ₱2,350.00 = ₱2,350.00
+  3. Oil Filter - 1 x ₱420.00 = ₱420.00
+  4. Cabin Air Filter - 1 x ₱980.00 = ₱980.00
+  5. Wiper Blade Set - 2 x ₱650.00 = ₱1,300.00
+- **Subtotal:** ₱9,900.00
+- **Discount:** ₱500.00 (loyalty discount)
+- **VAT (12%):** ₱1,188.00
+- **Total amount:** ₱10,588.00
+- **Payment method:** Credit card (Visa ending in 4417)
+- **Receipt/transaction number:** OR-0048213
+
+### 4. Visual Content
+- The image shows a thermal-paper receipt photographed on a dark wooden table under warm indoor lighting.
+- The Toyota logo is printed in black at the top center of the receipt.
+- The paper is slightly creased along the middle fold and the lower edge is curled, but all printed text remains readable.
+- The red "PAID" stamp partially overlaps the payment line without obscuring the amount.
+
+### 5. Handwritten Notes
+- "next PMS at 20,000 km" - clear, written in blue ballpoint pen in the bottom margin.
+- "cust. asked abt Corolla Cross trade-in" - mostly clear; "abt" appears to be an abbreviation of "about".
+- An illegible signature above "Cashier".
+
+### Summary
+This is an official receipt from Toyota Makati's service center dated March 14, 2024 for the 10,000 km periodic maintenance of a Toyota Vios 1.5 G CVT (plate NBC 4521). The customer paid ₱10,588.00 by Visa card after a ₱500.00 discount. Handwritten notes indicate the next maintenance is due at 20,000 km and that the customer is interested in trading in for a Corolla Cross."""
+
+PRICE_SHEET_PROSE = """## Comprehensive Image Analysis
+
+### 1. Text Extraction (OCR)
+
+**Printed text:**
+- Header: "TOYOTA QUEZON CITY - MARCH 2024 PRICE LIST"
+- "EDSA corner Quezon Avenue, Quezon City | (02) 8372-8888 | sales@toyotaqc.example"
+- "Showroom hours: 8:00 AM - 6:00 PM, Monday to Saturday"
+- A table with the columns "Model", "Variant", "SRP", "Monthly (60 mos, 20% DP)" and "Promo"
+- Footer: "Prices are subject to change without prior notice."
+
+**Handwritten text:**
+- Next to the Fortuner row, in red marker: "promo until Mar 31"
+
+### 2. Document Analysis
+- **Document type:** Dealership price list / price sheet
+- **Key information:** Suggested retail prices, monthly amortization and promotions for six Toyota variants
+- **Dates:** March 2024
+- **Contact details:** (02) 8372-8888, sales@toyotaqc.example
+- **Address:** EDSA corner Quezon Avenue, Quezon City
+
+### 3. Receipt/Invoice Analysis
+This is not a receipt or invoice; it is a price list. The listed vehicles and prices are:
+
+| Model | Variant | SRP | Monthly | Promo |
+|---|---|---|---|---|
+| Toyota Vios | 1.3 XLE MT | ₱842,000.00 | ₱14,033.00 | ₱40,000 cash discount |
+| Toyota Vios | 1.5 G CVT | ₱1,020,000.00 | ₱17,000.00 | - |
+| Toyota Corolla Cross | 1.8 V HEV | ₱1,690,000.00 | ₱28,167.00 | Free 3-year PMS |
+| Toyota Fortuner | 2.8 LTD 4x4 | ₱2,500,000.00 | ₱41,667.00 | ₱100,000 off |
+| Toyota Hilux | 2.4 G MT | ₱1,470,000.00 | ₱24,500.00 | - |
+| Toyota Innova | 2.8 E AT | ₱1,520,000.00 | ₱25,333.00 | Low DP ₱99,000 |
+
+- Monthly amortization figures are based on a 60-month term with a 20% down payment, as stated in the column header.
+
+### 4. Visual Content
+- A printed A4 sheet pinned to a cork board, photographed at a slight angle.
+- The Toyota logo and the dealership name appear in red at the top left.
+- Each row includes a small thumbnail photo of the vehicle: the Vios in silver, the Corolla Cross in white, the Fortuner in black, the Hilux in grey and the Innova in bronze.
+- The table uses alternating light grey row shading; the promo column is printed in red.
+
+### 5. Handwritten Notes
+- "promo until Mar 31" written in red marker beside the Fortuner row, clearly legible, indicating the ₱100,000 discount expires on March 31.
+
+### Summary
+This is Toyota Quezon City's March 2024 price list covering the Vios, Corolla Cross, Fortuner, Hilux and Innova, with SRPs from ₱842,000 to ₱2,500,000, 60-month amortization figures and current promos. A handwritten note says the Fortuner promo runs until March 31."""
+
+DOCUMENTS = {
+    "service receipt": (RECEIPT, RECEIPT_PROSE),
+    "price sheet": (PRICE_SHEET, PRICE_SHEET_PROSE),
+}
+
+
+def draw_document(records):
+    """Render a fixture as a plain PNG so --live has something to send to the vision model"""
+    from PIL import Image, ImageDraw
+
+    lines = [records["merchant"], records["date"] or "", records["reference_number"] or "", ""]
+    lines += [f"{item['description']}  {item['quantity']} x {item['unit_price']:,}  {item['amount']:,}" for item in records["line_items"]]
+    lines += [f"{v['model']} {v['variant']}  SRP {v['price']:,}  {v['monthly']:,}/mo  {v['promo'] or ''}" for v in records["vehicles"] if v["price"]]
+    for label in ("subtotal", "discount", "tax", "total"):
+        if records[label] is not None:
+            lines.append(f"{label.upper()}  {records[label]:,}")
+    lines += records["other_facts"] + records["handwritten_notes"]
+    image = Image.new("RGB", (900, 40 + 28 * len(lines)), "white")
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((30, 20 + 28 * i), line, fill="black")
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    buffer.seek(0)
+    buffer.name = "document.png"
+    return buffer
+
+
+def analyses(records, prose, live):
+    """(prose, dense) analyses of one document, and the seconds each extraction took"""
+    if live:
+        image = draw_document(records)
+        start = time.perf_counter()
+        prose = analyze_image_with_ai(image)
+        prose_s = time.perf_counter() - start
+        image.seek(0)
+        start = time.perf_counter()
+        dense = extraction.analyze_image_structured(image)
+        return {"prose": (prose, prose_s), "structured": (dense, time.perf_counter() - start)}
+    start = time.perf_counter()
+    dense = extraction.to_context(extraction.Extraction.from_dict(records))
+    return {"prose": (prose, None), "structured": (dense, time.perf_counter() - start)}
+
+
+def run_conversation(analysis, stage):
+    chain = build_ai_chain()
+    documents = f"IMAGE ANALYSIS:\n{analysis}\n\n"
+    messages = []
+    latencies = []
+    for question in QUESTIONS:
+        config = {"callbacks": tracing.callbacks(tracing.NOOP_SPAN, stage)}
+        start = time.perf_counter()
+        reply = chain.invoke({"question": question, "documents": documents, "chat_history": format_messages(messages)}, config=config)
+        latencies.append(time.perf_counter() - start)
+        messages += [{"role": "user", "content": question}, {"role": "bot", "content": reply}]
+    totals = next(row for row in tracing.usage_summary() if row["stage"] == stage)
+    return {
+        "turns": len(latencies),
+        "prompt_tokens": totals["prompt_tokens"],
+        "first_answer_s": round(latencies[0], 3),
+        "median_answer_s": round(statistics.median(latencies), 3),
+    }
+
+
+def run(live=False, prefill_ms_per_1k=20.0, latency=0.3):
+    if not live:
+        install_fake_llm(latency=latency, prefill_latency_per_1k=prefill_ms_per_1k / 1000)
+    results = []
+    for name, (records, prose) in DOCUMENTS.items():
+        row = {"document": name}
+        for mode, (analysis, extract_s) in analyses(records, prose, live).items():
+            # Fresh provider cache per mode so neither layout benefits from the other's prefixes
+            clear_prompt_cache()
+            row[mode] = {
+                "context_tokens": count_tokens(f"IMAGE ANALYSIS:\n{analysis}\n\n"),
+                "context_chars": len(analysis),
+                **run_conversation(analysis, f"bench.{name}.{mode}"),
+            }
+            if extract_s is not None:
+                row[mode]["extract_s"] = round(extract_s, 4)
+        row["context_reduction"] = round(row["prose"]["context_tokens"] / max(1, row["structured"]["context_tokens"]), 1)
+        row["structured_block"] = analysis
+        results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="call the real model (needs OPENAI_API_KEY)")
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=20.0, help="fake model prefill time per 1k uncached prompt tokens")
+    parser.add_argument("--latency", type=float, default=0.3, help="fake model base latency in seconds")
+    args = parser.parse_args()
+    print(json.dumps(run(args.live, args.prefill_ms_per_1k, args.latency), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Per-page vision routing over a mixed PDF corpus, with routing on vs off - fake LLM, no network.
+
+    python -m benchmarks.bench_vision_routing --latency 0.5
+
+For each document, reports which pages went to vision and why, the estimated vision input tokens and cost
+with and without routing, the time routing itself takes, and end-to-end analyze_pdf_with_ai time (needs poppler;
+without it the vision rows carry the error instead).
+"""
+import argparse
+import json
+import time
+
+import PyPDF2
+
+import pdf_routing
+from benchmarks.data import make_mixed_pdf
+from benchmarks.fake_llm import install_fake_llm
+
+CORPUS = {
+    "brochure (born-digital)": ["text"] * 20,
+    "price list (born-digital)": ["text"] * 6,
+    "scanned receipt": ["scan"] * 2,
+    "signed reservation form": ["text", "text", "annotated"],
+    "spec sheet with photos": ["text", "sparse", "text", "sparse"],
+    "scanned price list": ["scan"] * 8,
+}
+
+
+def vision_cost(reader, page_numbers):
+    tokens = sum(pdf_routing.estimated_page_tokens(reader.pages[number - 1]) for number in page_numbers)
+    return tokens, round(tokens * pdf_routing.VISION_INPUT_USD_PER_1M / 1e6, 4)
+
+
+def run(latency):
+    import functionalities
+
+    install_fake_llm(latency=latency)
+    results = []
+    totals = {"routed": [0, 0.0], "all_pages": [0, 0.0]}
+    for name, kinds in CORPUS.items():
+        pdf = make_mixed_pdf(kinds, name)
+        reader = PyPDF2.PdfReader(pdf)
+
+        start = time.perf_counter()
+        _, vision_pages = functionalities.extract_and_route_pdf(reader, 0)
+        route_ms = (time.perf_counter() - start) * 1000
+        _, decisions = pdf_routing.route_pdf_pages(reader, [page.extract_text() or "" for page in reader.pages])
+
+        row = {
+            "document": name,
+            "pages": len(kinds),
+            "route_ms": round(route_ms, 3),
+            "vision_pages": vision_pages,
+            "reasons": {decision["page"]: decision["reason"] for decision in decisions},
+        }
+        for mode, routing in (("routed", True), ("all_pages", False)):
+            pdf_routing.VISION_ROUTING = routing
+            pages = vision_pages if routing else list(range(1, len(kinds) + 1))
+            tokens, usd = vision_cost(reader, pages)
+            totals[mode][0] += tokens
+            totals[mode][1] += usd
+            pdf.seek(0)
+            start = time.perf_counter()
+            reply = functionalities.analyze_pdf_with_ai(pdf, max_pages=0)
+            seconds = time.perf_counter() - start
+            row[mode] = {"vision_calls": len(pages), "est_tokens": tokens, "est_usd": usd, "seconds": round(seconds, 3)}
+            if reply.startswith("Error"):
+                row[mode]["error"] = reply[:160]
+        pdf_routing.VISION_ROUTING = True
+        results.append(row)
+
+    routed_tokens, all_tokens = totals["routed"][0], totals["all_pages"][0]
+    return {
+        "documents": results,
+        "summary": {
+            "pages": sum(len(kinds) for kinds in CORPUS.values()),
+            "vision_pages_routed": sum(len(row["vision_pages"]) for row in results),
+            "est_tokens_routed": routed_tokens,
+            "est_tokens_all_pages": all_tokens,
+            "est_usd_saved": round(totals["all_pages"][1] - totals["routed"][1], 4),
+            "token_reduction": round(1 - routed_tokens / all_tokens, 3) if all_tokens else 0.0,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.5, help="fake vision call latency in seconds")
+    args = parser.parse_args()
+    print(json.dumps(run(args.latency), indent=2))
+
+
+if __name__ == "__main__":
+    main()
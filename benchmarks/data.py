@@ -0,0 +1,157 @@
+"""Synthetic dealership documents for the benchmarks - generated in memory, no extra dependencies."""
+import io
+import random
+
+from benchmarks.bench_retrieval import BRANCHES, MODELS, VARIANTS
+
+
+class UploadedBytes(io.BytesIO):
+    """Stand-in for Streamlit's UploadedFile: a BytesIO with .name and .type"""
+
+    def __init__(self, data, name, type):
+        super().__init__(data)
+        self.name = name
+        self.type = type
+
+
+def price_rows(count, seed=7):
+    rng = random.Random(seed)
+    for i in range(count):
+        model = MODELS[i % len(MODELS)]
+        price = rng.randrange(700, 4000) * 1000
+        yield [
+            model,
+            VARIANTS[rng.randrange(len(VARIANTS))],
+            f"{price}",
+            f"{price // 60}",
+            BRANCHES[rng.randrange(len(BRANCHES))],
+        ]
+
+
+def make_csv(rows):
+    lines = ["Model,Variant,SRP,Monthly (60mo),Branch"]
+    lines.extend(",".join(row) for row in price_rows(rows))
+    return UploadedBytes(("\n".join(lines) + "\n").encode("utf-8"), f"prices-{rows}.csv", "text/csv")
+
+
+def _text_stream(rows, lines):
+    text_ops = ["BT /F1 10 Tf 40 800 Td 12 TL"]
+    for _ in range(lines):
+        line = " - ".join(next(rows)).replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        text_ops.append(f"({line}) Tj T*")
+    text_ops.append("ET")
+    return "\n".join(text_ops).encode("latin-1")
+
+
+def _scan_image_object():
+    """A grey JPEG 'scan' as an image XObject (A4 at ~100 dpi)"""
+    image = make_image(827, 1169).getvalue()
+    return (
+        b"<< /Type /XObject /Subtype /Image /Width 827 /Height 1169 /ColorSpace /DeviceRGB "
+        b"/BitsPerComponent 8 /Filter /DCTDecode /Length %d >>\nstream\n" % len(image) + image + b"\nendstream"
+    )
+
+
+def make_pdf_bytes(page_kinds, lines_per_page=40):
+    """Build a PDF whose pages are each one of:
+
+    "text"      born-digital page with a full text layer (Helvetica, one price row per line)
+    "scan"      full-page image and no text layer, like a scanner produces
+    "annotated" text page with a handwritten /Ink annotation (e.g. a signature added in a PDF viewer)
+    "sparse"    a one-line caption over a half-page photo
+    """
+    rows = price_rows(len(page_kinds) * lines_per_page)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    image_ref = None
+    if any(kind in ("scan", "sparse") for kind in page_kinds):
+        objects.append(_scan_image_object())
+        image_ref = len(objects)
+
+    page_refs = []
+    for kind in page_kinds:
+        extra = b""
+        if kind == "scan":
+            stream = b"q 595 0 0 842 0 0 cm /Im0 Do Q"
+        elif kind == "sparse":
+            stream = b"q 595 0 0 421 0 380 cm /Im0 Do Q\n" + _text_stream(rows, 1)
+        else:
+            stream = _text_stream(rows, lines_per_page)
+        if kind == "annotated":
+            objects.append(b"<< /Type /Annot /Subtype /Ink /Rect [300 40 560 120] /InkList [[310 60 400 100 550 70]] >>")
+            extra = b" /Annots [%d 0 R]" % len(objects)
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_ref = len(objects)
+        xobjects = b" /XObject << /Im0 %d 0 R >>" % image_ref if image_ref else b""
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >>%s >> "
+            b"/Contents %d 0 R%s >>" % (xobjects, content_ref, extra)
+        )
+        page_refs.append(len(objects))
+    kids = " ".join(f"{ref} 0 R" for ref in page_refs).encode()
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_kinds)
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref_offset = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset))
+    return out.getvalue()
+
+
+def make_text_pdf_bytes(pages, lines_per_page=40):
+    """Build a born-digital PDF with a real text layer (Helvetica, one price row per line)"""
+    return make_pdf_bytes(["text"] * pages, lines_per_page)
+
+
+def make_text_pdf(pages, lines_per_page=40):
+    return UploadedBytes(make_text_pdf_bytes(pages, lines_per_page), f"brochure-{pages}p.pdf", "application/pdf")
+
+
+def make_mixed_pdf(page_kinds, name=None):
+    return UploadedBytes(make_pdf_bytes(page_kinds), name or f"mixed-{len(page_kinds)}p.pdf", "application/pdf")
+
+
+def make_docx(paragraphs):
+    import docx
+
+    document = docx.Document()
+    document.add_heading("Toyota Dealership Price Guide", level=1)
+    for row in price_rows(paragraphs):
+        document.add_paragraph(" - ".join(row))
+    buffered = io.BytesIO()
+    document.save(buffered)
+    return UploadedBytes(
+        buffered.getvalue(),
+        f"guide-{paragraphs}.docx",
+        "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    )
+
+
+def make_image(width, height, format="JPEG"):
+    """Receipt-like test image: white paper with dark text bars and some noise so it doesn't compress to nothing"""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(width * height)
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    line_height = max(12, height // 60)
+    for top in range(line_height, height - line_height, line_height * 2):
+        right = rng.randrange(width // 3, width - 10)
+        draw.rectangle([10, top, right, top + line_height], fill=(30, 30, 30))
+    for _ in range(width * height // 200):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.point((x, y), fill=(rng.randrange(256),) * 3)
+    buffered = io.BytesIO()
+    image.save(buffered, format=format, quality=95)
+    mime = "image/png" if format == "PNG" else "image/jpeg"
+    return UploadedBytes(buffered.getvalue(), f"receipt-{width}x{height}.{format.lower()}", mime)
@@ -0,0 +1,158 @@
+"""Deterministic stand-in for ChatOpenAI with configurable latency, for offline benchmarks."""
+import asyncio
+import hashlib
+import json
+import time
+import typing
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+import clients
+
+# Prompt prefixes "seen by the provider", shared by every fake model like OpenAI's cache is shared per org
+_prompt_prefixes = set()
+PROMPT_CACHE_MIN_CHARS = 1024 * 4
+PROMPT_CACHE_STEP_CHARS = 128 * 4
+
+FALLBACK_REPLY = (
+    "I'm not sure about that, but you can reach our customer support team or message us directly here "
+    "so one of our agents can assist you."
+)
+
+
+def cached_prefix_chars(prompt):
+    """Mimic OpenAI prompt caching: the longest previously seen prefix of 1024+ tokens, in 128-token steps"""
+    digest = hashlib.sha256()
+    cached = 0
+    missed = False
+    position = 0
+    for end in range(PROMPT_CACHE_MIN_CHARS, len(prompt) + 1, PROMPT_CACHE_STEP_CHARS):
+        digest.update(prompt[position:end].encode("utf-8"))
+        position = end
+        key = digest.copy().hexdigest()
+        if not missed and key in _prompt_prefixes:
+            cached = end
+        else:
+            missed = True
+        _prompt_prefixes.add(key)
+    return cached
+
+
+class FakeChatModel(BaseChatModel):
+    """Replies with a canned, input-dependent answer after `latency` seconds (streamed over `latency` too).
+
+    Token usage is reported like the OpenAI API does, so instrumentation sees realistic-looking numbers,
+    including prompt-cache hits for prefixes repeated from earlier calls. `prefill_latency_per_1k` adds
+    time per 1k uncached prompt tokens before the first token, so prompt size shows up in latency.
+    `with_structured_output` returns `structured_response` (a dict) validated against the schema.
+    """
+
+    model: str = "gpt-4o"
+    temperature: float = 0
+    latency: float = 0.5
+    first_token_latency: float = 0.2
+    reply_words: int = 60
+    prefill_latency_per_1k: float = 0.0
+    structured_response: typing.Optional[dict] = None
+    # Lowercase phrases that make this model answer with the prompt's fallback message, e.g. to exercise escalation
+    fallback_when: tuple = ()
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _reply(self, messages):
+        prompt = "\n".join(str(message.content) for message in messages)
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        words = [f"w{digest[i % 64]}{i}" for i in range(self.reply_words)]
+        text = f"[{self.model}] " + " ".join(words)
+        question = str(messages[-1].content).lower() if messages else ""
+        if any(phrase in question for phrase in self.fallback_when):
+            text = FALLBACK_REPLY
+        usage = {
+            "input_tokens": max(1, len(prompt) // 4),
+            "output_tokens": self.reply_words,
+            "total_tokens": max(1, len(prompt) // 4) + self.reply_words,
+            "input_token_details": {"cache_read": cached_prefix_chars(prompt) // 4},
+        }
+        return text, usage
+
+    def _prefill_seconds(self, usage):
+        uncached = usage["input_tokens"] - usage["input_token_details"]["cache_read"]
+        return self.prefill_latency_per_1k * uncached / 1000
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text, usage = self._reply(messages)
+        time.sleep(self.latency + self._prefill_seconds(usage))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=usage))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        text, usage = self._reply(messages)
+        await asyncio.sleep(self.latency + self._prefill_seconds(usage))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=usage))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        text, usage = self._reply(messages)
+        tokens = text.split(" ")
+        time.sleep(self.first_token_latency + self._prefill_seconds(usage))
+        per_token = max(0.0, self.latency - self.first_token_latency) / len(tokens)
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(per_token)
+            chunk = AIMessageChunk(content=token + (" " if i < len(tokens) - 1 else ""))
+            if i == len(tokens) - 1:
+                chunk.usage_metadata = usage
+            yield ChatGenerationChunk(message=chunk)
+
+
+    def _structured(self, schema, include_raw):
+        if self.structured_response is None:
+            # Every field empty - enough for code paths that only need a well-formed record
+            empty = {
+                name: [] if typing.get_origin(field.annotation) is list else None
+                for name, field in schema.model_fields.items()
+            }
+            parsed = schema.model_construct(**empty)
+        else:
+            parsed = schema.model_validate(self.structured_response)
+        content = json.dumps(parsed.model_dump(), ensure_ascii=False)
+        output_tokens = max(1, len(content) // 4)
+        usage = {
+            "input_tokens": 0,
+            "output_tokens": output_tokens,
+            "total_tokens": output_tokens,
+            "input_token_details": {"cache_read": 0},
+        }
+        raw = AIMessage(content=content, usage_metadata=usage)
+        return {"raw": raw, "parsed": parsed, "parsing_error": None} if include_raw else parsed
+
+    def with_structured_output(self, schema, *, include_raw=False, **kwargs):
+        def invoke(messages):
+            time.sleep(self.latency)
+            return self._structured(schema, include_raw)
+
+        async def ainvoke(messages):
+            await asyncio.sleep(self.latency)
+            return self._structured(schema, include_raw)
+
+        return RunnableLambda(invoke, afunc=ainvoke)
+
+
+def install_fake_llm(per_model=None, **settings):
+    """Route every clients.get_llm() call to a FakeChatModel built with these settings.
+
+    `per_model` maps a model name to settings that override the shared ones for that model only.
+    """
+    per_model = per_model or {}
+    clients.set_llm_factory(lambda **kwargs: FakeChatModel(**{**kwargs, **settings, **per_model.get(kwargs["model"], {})}))
+
+
+def uninstall_fake_llm():
+    clients.set_llm_factory(None)
+
+
+def clear_prompt_cache():
+    _prompt_prefixes.clear()
@@ -0,0 +1,184 @@
+"""Local OpenAI-compatible chat completions stub that injects faults, for testing the resilient call layer.
+
+    python -m benchmarks.fault_server --port 8765 --error-rate 0.05 --slow-rate 0.05 --rpm 600
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=x streamlit run app.py
+
+Serves POST /v1/chat/completions, streaming and not. Each request independently may be answered with a
+500 (`error_rate`), have its connection dropped (`drop_rate`), or be delayed by `slow_latency` (`slow_rate`);
+requests beyond `rpm` get a 429 with Retry-After. Like the real API, the per-minute limit is enforced over a
+shorter window: at most `burst_s` seconds' worth of requests may arrive back to back. `script` lists outcomes
+('error', 'drop', 'slow', 'rate_limited', 'ok') to serve before any of that applies, for deterministic tests.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = "The Toyota Vios 1.5 G CVT starts at ₱1,020,000. Would you like to book a test drive?"
+
+
+class FaultConfig:
+    def __init__(self, latency=0.3, error_rate=0.0, drop_rate=0.0, slow_rate=0.0, slow_latency=10.0, rpm=0, burst_s=10.0,
+                 script=(), retry_after=1.0, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.rpm = rpm
+        self.script = list(script)
+        self.retry_after = retry_after
+        self.capacity = max(1.0, rpm / 60 * burst_s)
+        self.allowance = self.capacity
+        self.updated = time.monotonic()
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = Counter()
+
+    def decide(self):
+        """Fault for the next request: 'rate_limited', 'error', 'drop', 'slow' or 'ok'"""
+        now = time.monotonic()
+        with self.lock:
+            if self.script:
+                outcome = self.script.pop(0)
+                self.counts[outcome] += 1
+                return outcome, self.retry_after if outcome == "rate_limited" else None
+            self.allowance = min(self.capacity, self.allowance + (now - self.updated) * self.rpm / 60)
+            self.updated = now
+            if self.rpm and self.allowance < 1:
+                outcome = "rate_limited"
+            else:
+                self.allowance -= 1
+                roll = self.random.random()
+                if roll < self.error_rate:
+                    outcome = "error"
+                elif roll < self.error_rate + self.drop_rate:
+                    outcome = "drop"
+                elif roll < self.error_rate + self.drop_rate + self.slow_rate:
+                    outcome = "slow"
+                else:
+                    outcome = "ok"
+            self.counts[outcome] += 1
+            retry_after = (1 - self.allowance) * 60 / self.rpm if outcome == "rate_limited" else None
+        return outcome, retry_after
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _json(self, status, body, headers=None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                return self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+            outcome, retry_after = config.decide()
+            if outcome == "rate_limited":
+                return self._json(
+                    429,
+                    {"error": {"message": "Rate limit reached for requests", "type": "requests", "code": "rate_limit_exceeded"}},
+                    {"Retry-After": f"{retry_after:.2f}"},
+                )
+            if outcome == "error":
+                time.sleep(config.latency / 2)
+                return self._json(500, {"error": {"message": "The server had an error while processing your request.", "type": "server_error"}})
+            if outcome == "drop":
+                time.sleep(config.latency / 2)
+                self.close_connection = True
+                self.connection.shutdown(2)
+                return
+            time.sleep(config.slow_latency if outcome == "slow" else config.latency)
+
+            prompt_chars = sum(len(json.dumps(message.get("content", ""))) for message in body.get("messages", []))
+            usage = {
+                "prompt_tokens": prompt_chars // 4,
+                "completion_tokens": len(REPLY) // 4,
+                "total_tokens": prompt_chars // 4 + len(REPLY) // 4,
+                "prompt_tokens_details": {"cached_tokens": 0},
+            }
+            base = {"id": f"chatcmpl-{random.getrandbits(48):x}", "created": int(time.time()), "model": body.get("model", "gpt-4o")}
+            if not body.get("stream"):
+                return self._json(200, {
+                    **base,
+                    "object": "chat.completion",
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": REPLY}, "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            words = REPLY.split(" ")
+            for i, word in enumerate(words):
+                delta = {"role": "assistant", "content": word} if i == 0 else {"content": " " + word}
+                chunk = {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            final = {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            self.wfile.write(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                self.wfile.write(f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+
+    return Handler
+
+
+class FaultServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients abandon timed-out and losing hedged attempts mid-response; that's expected here
+        pass
+
+
+def start_server(port=0, **faults):
+    """Serve on a daemon thread; returns (server, config, base_url). Stop with server.shutdown()."""
+    config = FaultConfig(**faults)
+    server = FaultServer(("127.0.0.1", port), make_handler(config))
+    threading.Thread(target=server.serve_forever, name="fault-server", daemon=True).start()
+    return server, config, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=10.0)
+    parser.add_argument("--rpm", type=int, default=0)
+    parser.add_argument("--burst-s", type=float, default=10.0)
+    args = parser.parse_args()
+    server, config, base_url = start_server(
+        args.port, latency=args.latency, error_rate=args.error_rate, drop_rate=args.drop_rate,
+        slow_rate=args.slow_rate, slow_latency=args.slow_latency, rpm=args.rpm, burst_s=args.burst_s,
+    )
+    print(f"OPENAI_BASE_URL={base_url}")
+    try:
+        while True:
+            time.sleep(10)
+            print(json.dumps(dict(config.counts)))
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
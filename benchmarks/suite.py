@@ -0,0 +1,260 @@
+"""Offline benchmark suite for the whole request path, with a deterministic fake LLM in place of ChatOpenAI.
+
+    python -m benchmarks --output bench.json                       # run and save results
+    python -m benchmarks --compare bench.json --tolerance 0.25     # fail if anything got >25% slower
+    python -m benchmarks --quick --latency 0.05                    # smaller inputs for CI
+
+Every case is timed `--repeat` times and reported as the median. Model calls cost exactly `--latency`
+seconds, so "overhead_ms" isolates the time our own code spends around them.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_retrieval import make_price_list
+from benchmarks.bench_vision_routing import CORPUS
+from benchmarks.data import make_csv, make_docx, make_image, make_mixed_pdf, make_text_pdf
+from benchmarks.fake_llm import install_fake_llm
+
+SIZES = {
+    "full": {
+        "pdf_pages": [1, 20, 100],
+        "docx_paragraphs": [100, 2000, 10000],
+        "csv_rows": [1000, 20000, 100000],
+        "image_sizes": [(640, 480), (1920, 1440), (4032, 3024)],
+        "vision_pdf_pages": [1, 5, 20],
+        "price_list_rows": [0, 1000, 5000],
+        "app_messages": [10, 100],
+    },
+    "quick": {
+        "pdf_pages": [1, 10],
+        "docx_paragraphs": [100, 1000],
+        "csv_rows": [1000, 10000],
+        "image_sizes": [(640, 480), (2048, 1536)],
+        "vision_pdf_pages": [1, 3],
+        "price_list_rows": [0, 1000],
+        "app_messages": [10],
+    },
+}
+
+
+def median_time(fn, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def case(name, size, seconds, **extra):
+    return {"case": name, "size": size, "ms": round(seconds * 1000, 3), **extra}
+
+
+def bench_extraction(sizes, repeat):
+    import functionalities
+
+    inputs = (
+        [("read_uploaded_file/pdf", pages, make_text_pdf(pages)) for pages in sizes["pdf_pages"]]
+        + [("read_uploaded_file/docx", paragraphs, make_docx(paragraphs)) for paragraphs in sizes["docx_paragraphs"]]
+        + [("read_uploaded_file/csv", rows, make_csv(rows)) for rows in sizes["csv_rows"]]
+    )
+    results = []
+    for name, size, file in inputs:
+        def run():
+            # Measure parsing, not the document cache
+            functionalities.document_cache.clear()
+            file.seek(0)
+            return functionalities.read_uploaded_file(file)
+
+        seconds, text = median_time(run, repeat)
+        results.append(case(name, size, seconds, input_bytes=len(file.getvalue()), output_chars=len(text)))
+    return results
+
+
+def bench_image_encoding(sizes, repeat):
+    from functionalities import encode_image_to_base64
+
+    results = []
+    for width, height in sizes["image_sizes"]:
+        image = make_image(width, height)
+        seconds, encoded = median_time(lambda: encode_image_to_base64(image), repeat)
+        results.append(case(
+            "encode_image_to_base64", f"{width}x{height}", seconds,
+            input_bytes=len(image.getvalue()), base64_chars=len(encoded),
+        ))
+    return results
+
+
+def bench_vision(sizes, repeat, latency):
+    import functionalities
+
+    results = []
+    image = make_image(1920, 1440)
+
+    def analyze_image():
+        functionalities.vision_cache.clear()
+        return functionalities.analyze_image_with_ai(image)
+
+    seconds, reply = median_time(analyze_image, repeat)
+    results.append(case("analyze_image_with_ai", "1920x1440", seconds, overhead_ms=round((seconds - latency) * 1000, 3)))
+
+    import PyPDF2
+
+    # Routing is pure local work on every PDF analysis, so it should stay in the low milliseconds
+    for name, kinds in CORPUS.items():
+        pdf = make_mixed_pdf(kinds)
+        seconds, (_, vision_pages) = median_time(
+            lambda: functionalities.extract_and_route_pdf(PyPDF2.PdfReader(pdf), 0), repeat
+        )
+        results.append(case("extract_and_route_pdf", name, seconds, pages=len(kinds), vision_pages=len(vision_pages)))
+
+    for pages in sizes["vision_pdf_pages"]:
+        # Scanned pages, so routing still sends every page to the (fake) vision model
+        pdf = make_mixed_pdf(["scan"] * pages)
+
+        def analyze_pdf():
+            pdf.seek(0)
+            return functionalities.analyze_pdf_with_ai(pdf, max_pages=0)
+
+        seconds, reply = median_time(analyze_pdf, repeat)
+        if reply.startswith("Error"):
+            # e.g. poppler missing on this machine - keep the row so the gap is visible
+            results.append(case("analyze_pdf_with_ai", pages, seconds, error=reply[:200]))
+        else:
+            results.append(case("analyze_pdf_with_ai", pages, seconds, overhead_ms=round((seconds - latency) * 1000, 3)))
+    return results
+
+
+def bench_ask_ai(sizes, repeat, latency):
+    from functionalities import ask_ai, build_ai_chain
+    from history import format_messages
+    from retrieval import index_cache, retrieve_context
+    from tokens import count_tokens
+
+    prompt = build_ai_chain().first
+    history = [{"role": "user" if i % 2 == 0 else "bot", "content": "I'd like to know about the Vios financing."} for i in range(12)]
+    question = "How much is the Vios 1.5 G CVT and is there a promo?"
+    results = []
+    for rows in sizes["price_list_rows"]:
+        text = make_price_list(rows) if rows else ""
+
+        def assemble():
+            index_cache.clear()
+            documents = retrieve_context(text, question)
+            return prompt.format(question=question, documents=documents, chat_history=format_messages(history))
+
+        seconds, rendered = median_time(assemble, repeat)
+        results.append(case("prompt_assembly", rows, seconds, prompt_tokens=count_tokens(rendered)))
+
+        documents = retrieve_context(text, question)
+        seconds, _ = median_time(lambda: ask_ai(question, format_messages(history), documents), repeat)
+        results.append(case("ask_ai", rows, seconds, overhead_ms=round((seconds - latency) * 1000, 3)))
+    return results
+
+
+def bench_app_rerun(sizes, repeat):
+    from streamlit.testing.v1 import AppTest
+
+    results = []
+    for count in sizes["app_messages"]:
+        app = AppTest.from_file("../app.py", default_timeout=60)
+        app.session_state["messages"] = [
+            {"role": "user" if i % 2 == 0 else "bot", "content": f"Message {i} about the Fortuner and the Hilux."}
+            for i in range(count)
+        ]
+        app.run()
+        seconds, _ = median_time(app.run, repeat)
+        results.append(case("app_rerun", count, seconds))
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def run(size_set, repeat, latency, include_app=True):
+    install_fake_llm(latency=latency, first_token_latency=min(latency, 0.05))
+    sizes = SIZES[size_set]
+    results = []
+    results += bench_extraction(sizes, repeat)
+    results += bench_image_encoding(sizes, repeat)
+    results += bench_vision(sizes, repeat, latency)
+    results += bench_ask_ai(sizes, repeat, latency)
+    if include_app:
+        results += bench_app_rerun(sizes, repeat)
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "size_set": size_set,
+            "repeat": repeat,
+            "fake_llm_latency_s": latency,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, tolerance):
+    """Return the cases that are more than `tolerance` slower than in the baseline run"""
+    previous = {(r["case"], str(r["size"])): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        before = previous.get((result["case"], str(result["size"])))
+        if not before or "error" in result or "error" in before:
+            continue
+        # Compare our own time where a fake model call is part of the case
+        metric = "overhead_ms" if "overhead_ms" in result else "ms"
+        # Ignore sub-millisecond noise
+        if result[metric] > before[metric] * (1 + tolerance) and result[metric] - before[metric] > 1:
+            regressions.append({
+                "case": result["case"],
+                "size": result["size"],
+                "metric": metric,
+                "baseline": before[metric],
+                "current": result[metric],
+            })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="write results as JSON to this file (default: stdout)")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before a case counts as a regression")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake model latency in seconds")
+    parser.add_argument("--quick", action="store_true", help="use the small input set")
+    parser.add_argument("--no-app", action="store_true", help="skip the Streamlit rerun benchmark")
+    args = parser.parse_args()
+
+    report = run("quick" if args.quick else "full", args.repeat, args.latency, include_app=not args.no_app)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if report.get("regressions"):
+        for regression in report["regressions"]:
+            print(f"REGRESSION {regression['case']}[{regression['size']}]: {regression['metric']} "
+                  f"{regression['baseline']} -> {regression['current']}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
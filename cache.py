@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def content_hash(*parts):
+    """Return a sha256 hex digest over the given bytes/str parts (length-prefixed so parts can't run together)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def file_bytes(file):
+    """Return the raw bytes of an uploaded file, path or file-like object without consuming it"""
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as f:
+            return f.read()
+    if hasattr(file, "getvalue"):
+        return file.getvalue()
+    file.seek(0)
+    data = file.read()
+    file.seek(0)
+    return data
+
+
+def value_size(value):
+    """Approximate memory footprint of a cached value in bytes"""
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, bytes):
+        return len(value)
+    return len(json.dumps(value))
+
+
+class ResultCache:
+    """Content-addressed result cache with an LRU memory tier and an optional on-disk tier.
+
+    The memory tier is bounded by entry count and, when `max_bytes` is set, by the total size of
+    its values. Values must be JSON-serializable when a disk tier or byte limit is used. The disk
+    tier stores one JSON file per key under `disk_dir`, so results survive process restarts and
+    can be shared between workers.
+    """
+
+    def __init__(self, max_entries=128, disk_dir=None, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._memory = OrderedDict()
+        self._sizes = {}
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _remember(self, key, value):
+        if self.max_bytes is not None:
+            size = value_size(value)
+            if size > self.max_bytes:
+                # Too big to hold in memory at all; don't let a stale value for this key linger
+                if self._memory.pop(key, None) is not None:
+                    self.total_bytes -= self._sizes.pop(key, 0)
+                return
+            self.total_bytes += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries or (self.max_bytes is not None and self.total_bytes > self.max_bytes):
+            evicted_key, _ = self._memory.popitem(last=False)
+            self.total_bytes -= self._sizes.pop(evicted_key, 0)
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), "r", encoding="utf-8") as f:
+                    value = json.load(f)
+            except (OSError, ValueError):
+                pass
+            else:
+                with self._lock:
+                    self._remember(key, value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._sizes.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,112 @@
+import os
+import threading
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+from resilience import LLM_ATTEMPT_TIMEOUT_S, aclamp_request_timeout, clamp_request_timeout
+
+# Shared connection pool for every model client in the process
+HTTP_MAX_CONNECTIONS = int(os.getenv("OPENAI_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("OPENAI_HTTP_MAX_KEEPALIVE", "20"))
+
+_lock = threading.RLock()
+_http_client = None
+_http_async_client = None
+_llm_factory = ChatOpenAI
+_llms = {}
+_chains = {}
+
+
+def get_http_client():
+    """Return the process-wide pooled HTTP client so requests reuse warm connections"""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+                timeout=httpx.Timeout(LLM_ATTEMPT_TIMEOUT_S, connect=10.0),
+                # Requests made inside a resilience call stop waiting at the call's deadline
+                event_hooks={"request": [clamp_request_timeout]},
+            )
+        return _http_client
+
+
+def get_http_async_client():
+    """Return the pooled async HTTP client; only use it from async_runtime's shared event loop"""
+    global _http_async_client
+    with _lock:
+        if _http_async_client is None:
+            _http_async_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+                timeout=httpx.Timeout(LLM_ATTEMPT_TIMEOUT_S, connect=10.0),
+                event_hooks={"request": [aclamp_request_timeout]},
+            )
+        return _http_async_client
+
+
+def get_llm(model="gpt-4o", temperature=0):
+    """Return the shared ChatOpenAI client for this model/temperature, creating it on first use.
+
+    ChatOpenAI holds no per-request state, so one instance is safe to share across Streamlit sessions and threads.
+    """
+    key = (model, temperature)
+    llm = _llms.get(key)
+    if llm is None:
+        with _lock:
+            llm = _llms.get(key)
+            if llm is None:
+                if _llm_factory is ChatOpenAI:
+                    llm = ChatOpenAI(
+                        model=model,
+                        temperature=temperature,
+                        api_key=os.getenv("OPENAI_API_KEY"),
+                        # Streamed replies report token usage too, including prompt-cache hits
+                        stream_usage=True,
+                        # resilience owns retries and deadlines, so the SDK neither retries nor waits out its default timeout
+                        max_retries=0,
+                        timeout=LLM_ATTEMPT_TIMEOUT_S,
+                        http_client=get_http_client(),
+                        http_async_client=get_http_async_client(),
+                    )
+                else:
+                    llm = _llm_factory(model=model, temperature=temperature)
+                _llms[key] = llm
+    return llm
+
+
+def get_chain(name, build):
+    """Return the chain registered under name, calling build() to compile it only the first time"""
+    chain = _chains.get(name)
+    if chain is None:
+        with _lock:
+            chain = _chains.get(name)
+            if chain is None:
+                chain = build()
+                _chains[name] = chain
+    return chain
+
+
+def set_llm_factory(factory):
+    """Build model clients with factory(model=..., temperature=...) instead of ChatOpenAI (e.g. a local fake for benchmarks).
+
+    Pass None to go back to ChatOpenAI. Cached clients and chains are dropped so the change applies everywhere.
+    """
+    global _llm_factory
+    with _lock:
+        _llm_factory = factory or ChatOpenAI
+        _llms.clear()
+        _chains.clear()
+
+
+def reset():
+    """Drop every cached client and chain (e.g. after changing the API key or model settings)"""
+    global _http_client, _http_async_client
+    with _lock:
+        _llms.clear()
+        _chains.clear()
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+        # The async client belongs to the shared event loop; let it be garbage-collected there
+        _http_async_client = None
@@ -0,0 +1,324 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import List, Optional
+
+import PyPDF2
+from pydantic import BaseModel, Field
+
+import resilience
+from async_runtime import limiter
+from cache import content_hash, file_bytes
+from clients import get_chain, get_llm
+from functionalities import (
+    PDF_ANALYSIS_ERROR,
+    PDF_VISION_CONCURRENCY,
+    PDF_VISION_MAX_PAGES,
+    VISION_MODEL,
+    VISION_SKIPPED_NOTE,
+    build_image_message,
+    extract_and_route_pdf,
+    iter_pdf_page_images,
+    pdf_page_message,
+    vision_cache,
+)
+from imaging import IMAGE_JPEG_QUALITY, IMAGE_MAX_DIMENSION, prepare_image
+from tracing import record_usage, trace
+
+# Uploads are analyzed into typed records and passed to the chat as a dense block instead of free-form prose.
+# Set STRUCTURED_EXTRACTION=0 to go back to the prose analyses.
+STRUCTURED_EXTRACTION = os.getenv("STRUCTURED_EXTRACTION", "1").lower() not in ("0", "false", "no")
+# Bump when the schema or prompt changes so cached records aren't reused across versions
+EXTRACTION_SCHEMA_VERSION = "1"
+
+STRUCTURED_EXTRACTION_PROMPT = """Extract the facts in this image for a Toyota dealership sales assistant. It may be a receipt, invoice, price sheet, brochure, form, handwritten note or photo.
+
+Fill every field that the image supports and use null or an empty list otherwise. Copy numbers, names, model variants and dates exactly; never guess. Amounts are plain numbers without currency symbols or thousands separators. Put anything useful that has no dedicated field in other_facts as short phrases, and transcribe handwriting into handwritten_notes."""
+
+STRUCTURED_PAGE_PROMPT = "This is page {page_number} of a PDF document.\n\n" + STRUCTURED_EXTRACTION_PROMPT
+
+
+# Schema sent to the model (OpenAI strict structured output: every field required, nullable where optional)
+
+class LineItemModel(BaseModel):
+    description: str
+    quantity: Optional[float]
+    unit_price: Optional[float]
+    amount: Optional[float]
+
+
+class VehicleModel(BaseModel):
+    model: str = Field(description="Toyota model name, e.g. Vios")
+    variant: Optional[str] = Field(description="Variant / trim, e.g. 1.5 G CVT")
+    price: Optional[float] = Field(description="SRP or cash price")
+    monthly: Optional[float] = Field(description="Monthly amortization if stated")
+    branch: Optional[str]
+    promo: Optional[str]
+
+
+class BranchModel(BaseModel):
+    name: str
+    address: Optional[str]
+    phone: Optional[str]
+    hours: Optional[str]
+
+
+class ExtractionModel(BaseModel):
+    document_type: str = Field(description="receipt, invoice, price_sheet, brochure, form, handwritten_note, photo or other")
+    merchant: Optional[str]
+    date: Optional[str]
+    reference_number: Optional[str] = Field(description="Receipt, invoice or transaction number")
+    currency: Optional[str] = Field(description="ISO code, e.g. PHP")
+    line_items: List[LineItemModel]
+    subtotal: Optional[float]
+    tax: Optional[float]
+    discount: Optional[float]
+    total: Optional[float]
+    payment_method: Optional[str]
+    vehicles: List[VehicleModel]
+    branches: List[BranchModel]
+    contacts: List[str] = Field(description="Names, phone numbers and emails")
+    handwritten_notes: List[str]
+    other_facts: List[str]
+
+
+# Compact in-process records
+
+@dataclass(slots=True)
+class LineItem:
+    description: str
+    quantity: Optional[float] = None
+    unit_price: Optional[float] = None
+    amount: Optional[float] = None
+
+
+@dataclass(slots=True)
+class Vehicle:
+    model: str
+    variant: Optional[str] = None
+    price: Optional[float] = None
+    monthly: Optional[float] = None
+    branch: Optional[str] = None
+    promo: Optional[str] = None
+
+
+@dataclass(slots=True)
+class Branch:
+    name: str
+    address: Optional[str] = None
+    phone: Optional[str] = None
+    hours: Optional[str] = None
+
+
+@dataclass(slots=True)
+class Extraction:
+    document_type: str = "other"
+    merchant: Optional[str] = None
+    date: Optional[str] = None
+    reference_number: Optional[str] = None
+    currency: Optional[str] = None
+    line_items: List[LineItem] = field(default_factory=list)
+    subtotal: Optional[float] = None
+    tax: Optional[float] = None
+    discount: Optional[float] = None
+    total: Optional[float] = None
+    payment_method: Optional[str] = None
+    vehicles: List[Vehicle] = field(default_factory=list)
+    branches: List[Branch] = field(default_factory=list)
+    contacts: List[str] = field(default_factory=list)
+    handwritten_notes: List[str] = field(default_factory=list)
+    other_facts: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build records from a model response or a cached asdict() copy"""
+        return cls(
+            **{key: value for key, value in data.items() if key not in ("line_items", "vehicles", "branches")},
+            line_items=[LineItem(**item) for item in data.get("line_items") or []],
+            vehicles=[Vehicle(**vehicle) for vehicle in data.get("vehicles") or []],
+            branches=[Branch(**branch) for branch in data.get("branches") or []],
+        )
+
+
+def format_amount(value, currency=None):
+    if value is None:
+        return None
+    text = f"{value:,.2f}".removesuffix(".00")
+    if currency in (None, "PHP", "₱"):
+        return f"₱{text}"
+    return f"{currency} {text}"
+
+
+def _join(parts, separator=" "):
+    return separator.join(str(part) for part in parts if part not in (None, ""))
+
+
+def to_context(extraction):
+    """Serialize records into a dense, line-per-kind block for the chat prompt"""
+    currency = extraction.currency
+    lines = [_join([
+        (extraction.document_type or "other").upper(),
+        extraction.merchant,
+        extraction.date,
+        f"#{extraction.reference_number}" if extraction.reference_number else None,
+    ], " | ")]
+    if extraction.line_items:
+        lines.append("items: " + "; ".join(
+            _join([
+                item.description,
+                f"x{item.quantity:g}" if item.quantity is not None else None,
+                f"@{format_amount(item.unit_price, currency)}" if item.unit_price is not None else None,
+                f"= {format_amount(item.amount, currency)}" if item.amount is not None else None,
+            ])
+            for item in extraction.line_items
+        ))
+    totals = _join([
+        f"subtotal {format_amount(extraction.subtotal, currency)}" if extraction.subtotal is not None else None,
+        f"discount {format_amount(extraction.discount, currency)}" if extraction.discount is not None else None,
+        f"tax {format_amount(extraction.tax, currency)}" if extraction.tax is not None else None,
+        f"total {format_amount(extraction.total, currency)}" if extraction.total is not None else None,
+        f"paid {extraction.payment_method}" if extraction.payment_method else None,
+    ], "; ")
+    if totals:
+        lines.append(totals)
+    if extraction.vehicles:
+        lines.append("vehicles: " + "; ".join(
+            _join([
+                vehicle.model,
+                vehicle.variant,
+                format_amount(vehicle.price, currency),
+                f"({format_amount(vehicle.monthly, currency)}/mo)" if vehicle.monthly is not None else None,
+                f"@{vehicle.branch}" if vehicle.branch else None,
+                f"promo: {vehicle.promo}" if vehicle.promo else None,
+            ])
+            for vehicle in extraction.vehicles
+        ))
+    if extraction.branches:
+        lines.append("branches: " + "; ".join(
+            _join([branch.name, branch.address, branch.phone, branch.hours], ", ") for branch in extraction.branches
+        ))
+    for label, values in (
+        ("contacts", extraction.contacts),
+        ("handwritten", extraction.handwritten_notes),
+        ("facts", extraction.other_facts),
+    ):
+        if values:
+            lines.append(f"{label}: " + "; ".join(values))
+    return "\n".join(line for line in lines if line)
+
+
+def build_extractor():
+    llm = get_llm(VISION_MODEL)
+    return llm.with_structured_output(ExtractionModel, method="json_schema", strict=True, include_raw=True)
+
+
+def _parse_result(result, span):
+    record_usage(span, result["raw"], "llm.vision.structured")
+    if result.get("parsing_error"):
+        raise ValueError(f"Unparseable structured output: {result['parsing_error']}")
+    return Extraction.from_dict(result["parsed"].model_dump())
+
+
+def structured_cache_key(image_bytes):
+    return content_hash(
+        image_bytes, STRUCTURED_EXTRACTION_PROMPT, VISION_MODEL, EXTRACTION_SCHEMA_VERSION,
+        f"{IMAGE_MAX_DIMENSION}:{IMAGE_JPEG_QUALITY}",
+    )
+
+
+def extract_image_records(image_file):
+    """Typed records for an image; cached like prose analyses so reruns and repeat uploads are free"""
+    with trace("analyze_image", structured=True) as span:
+        image_bytes = file_bytes(image_file)
+        cache_key = structured_cache_key(image_bytes)
+        cached = vision_cache.get(cache_key)
+        span.set(bytes=len(image_bytes), cache_hit=cached is not None)
+        if cached is not None:
+            return Extraction.from_dict(cached)
+
+        message = build_image_message(image_bytes, STRUCTURED_EXTRACTION_PROMPT)
+        with trace("llm.vision.structured", model=VISION_MODEL) as llm_span:
+            result = resilience.call(
+                limiter.wrap(lambda: get_chain("structured_extraction", build_extractor).invoke([message])),
+                tokens=resilience.estimate_tokens([message]),
+            )
+            extraction = _parse_result(result, llm_span)
+        vision_cache.set(cache_key, asdict(extraction))
+        return extraction
+
+
+async def aextract_image_records(image_file):
+    """Async extract_image_records - the model call runs on the shared loop behind the global limiter"""
+    with trace("analyze_image", structured=True) as span:
+        image_bytes = file_bytes(image_file)
+        cache_key = structured_cache_key(image_bytes)
+        cached = vision_cache.get(cache_key)
+        span.set(bytes=len(image_bytes), cache_hit=cached is not None)
+        if cached is not None:
+            return Extraction.from_dict(cached)
+
+        message = await asyncio.to_thread(build_image_message, image_bytes, STRUCTURED_EXTRACTION_PROMPT)
+
+        async def attempt():
+            async with limiter:
+                return await get_chain("structured_extraction", build_extractor).ainvoke([message])
+
+        with trace("llm.vision.structured", model=VISION_MODEL) as llm_span:
+            result = await resilience.acall(attempt, tokens=resilience.estimate_tokens([message]))
+            extraction = _parse_result(result, llm_span)
+        vision_cache.set(cache_key, asdict(extraction))
+        return extraction
+
+
+def analyze_image_structured(image_file):
+    """Structured counterpart of analyze_image_with_ai: the dense records block, or an error string"""
+    try:
+        return to_context(extract_image_records(image_file))
+    except Exception as e:
+        return f"Error analyzing image: {str(e)}"
+
+
+async def aanalyze_image_structured(image_file):
+    try:
+        return to_context(await aextract_image_records(image_file))
+    except Exception as e:
+        return f"Error analyzing image: {str(e)}"
+
+
+def analyze_pdf_page_structured(page_number, img):
+    """Dense records for one rasterized page; failures come back as text so the other pages still count"""
+    try:
+        message = pdf_page_message(page_number, prepare_image(img)["data_url"], STRUCTURED_PAGE_PROMPT)
+        with trace("llm.vision.structured", model=VISION_MODEL, page=page_number) as span:
+            result = resilience.call(
+                limiter.wrap(lambda: get_chain("structured_extraction", build_extractor).invoke([message])),
+                tokens=resilience.estimate_tokens([message]),
+            )
+            return to_context(_parse_result(result, span))
+    except Exception as e:
+        return f"Error analyzing page {page_number}: {str(e)}"
+
+
+def analyze_pdf_structured(pdf_file, max_pages=None, max_concurrency=None, on_page=None):
+    """Structured counterpart of analyze_pdf_with_ai: the text layer plus dense records for the routed pages"""
+    max_pages = PDF_VISION_MAX_PAGES if max_pages is None else max_pages
+    try:
+        reader = PyPDF2.PdfReader(pdf_file)
+        extracted_text, vision_pages = extract_and_route_pdf(reader, max_pages)
+        if not vision_pages:
+            return f"TEXT EXTRACTION:\n{extracted_text}\n\n{VISION_SKIPPED_NOTE}"
+
+        pdf_file.seek(0)
+        page_count = len(vision_pages)
+        with ThreadPoolExecutor(max_workers=max_concurrency or PDF_VISION_CONCURRENCY) as executor:
+            futures = []
+            for page_number, img in iter_pdf_page_images(pdf_file.read(), vision_pages):
+                future = executor.submit(analyze_pdf_page_structured, page_number, img)
+                if on_page:
+                    future.add_done_callback(lambda done, n=page_number: on_page(n, page_count, done.result()))
+                futures.append((page_number, future))
+            records = "".join(f"\n--- PAGE {page_number} RECORDS ---\n{future.result()}\n" for page_number, future in futures)
+        return f"TEXT EXTRACTION:\n{extracted_text}\n\nPAGE RECORDS:\n{records}"
+    except Exception as e:
+        return f"{PDF_ANALYSIS_ERROR} {str(e)}"
@@ -1,16 +1,17 @@
-from PIL import Image
 import os
 import streamlit as st
 import os
 
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
-from io import BytesIO
-import base64
+from io import BytesIO, TextIOWrapper
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import time
 import docx
 import csv
 import PyPDF2
@@ -19,146 +20,324 @@ import pdf2image
 from dotenv import load_dotenv
 load_dotenv()
 
-
-
-llm = ChatOpenAI(model="gpt-4o", temperature=0, api_key=os.getenv("OPENAI_API_KEY"))
+import resilience
+import tracing
+from async_runtime import LimiterOverloaded, limiter
+from cache import ResultCache, content_hash, file_bytes
+from clients import get_chain, get_llm
+from history import format_messages
+from imaging import IMAGE_JPEG_QUALITY, IMAGE_MAX_DIMENSION, PDF_RASTER_DPI, prepare_image
+from model_tiers import TIERS, choose_tier, might_escalate, needs_escalation, record as record_tier
+from pdf_routing import route_pdf_pages
+from tracing import callbacks, record_usage, trace
+
+
+
+CHAT_MODEL = "gpt-4o"
+VISION_MODEL = "gpt-4o"
+
+# Static sales-agent instructions sent first on every chat turn
+SYSTEM_PROMPT_PATH = os.getenv("SYSTEM_PROMPT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt.md"))
+
+# PDF vision pipeline: pages analyzed per document (0 = all), vision calls in flight, retries per page
+PDF_VISION_MAX_PAGES = int(os.getenv("PDF_VISION_MAX_PAGES", "3"))
+PDF_VISION_CONCURRENCY = int(os.getenv("PDF_VISION_CONCURRENCY", "4"))
+PDF_VISION_RETRIES = int(os.getenv("PDF_VISION_RETRIES", "2"))
+
+# Extraction limits (0 = no limit) and how much text each yielded chunk carries
+EXTRACT_MAX_PAGES = int(os.getenv("EXTRACT_MAX_PAGES", "0"))
+EXTRACT_MAX_ROWS = int(os.getenv("EXTRACT_MAX_ROWS", "0"))
+EXTRACT_BATCH_SIZE = 1000
+TEXT_CHUNK_CHARS = 64 * 1024
+
+SUPPORTED_FILE_TYPES = {
+    "text/plain",
+    "application/pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "text/csv",
+}
+# The whole extracted "text" of a file type we can't read
+UNSUPPORTED_FILE_TYPE = "❌ Unsupported file type"
+# Start of the text PDF analysis returns when the whole document failed (page failures are reported inline)
+PDF_ANALYSIS_ERROR = "Error analyzing PDF:"
+
+# Extracted document text keyed by file bytes + type, shared by every session in the process
+document_cache = ResultCache(
+    max_entries=int(os.getenv("DOCUMENT_CACHE_ENTRIES", "256")),
+    max_bytes=int(os.getenv("DOCUMENT_CACHE_MAX_MB", "256")) * 1024 * 1024,
+    disk_dir=os.getenv("DOCUMENT_CACHE_DIR") or None,
+)
+parse_stats = {}
+parse_stats_lock = threading.Lock()
+
+# Vision results keyed by image bytes + prompt + model; set VISION_CACHE_DIR to persist them across restarts
+vision_cache = ResultCache(
+    max_entries=int(os.getenv("VISION_CACHE_SIZE", "128")),
+    disk_dir=os.getenv("VISION_CACHE_DIR") or None,
+)
+
+IMAGE_ANALYSIS_PROMPT = """You are an advanced OCR and image analysis system. Analyze this image thoroughly and extract ALL information:
+
+PRIMARY TASKS:
+1. **Text Extraction (OCR)**: Extract ALL visible text, including:
+   - Printed text
+   - HANDWRITTEN text (cursive, print, notes)
+   - Text in any language
+   - Numbers, dates, codes
+
+2. **Document Analysis**: If this is a document, identify:
+   - Document type (receipt, invoice, form, letter, note, etc.)
+   - Key information (dates, amounts, names, addresses, phone numbers)
+   - Line items, totals, calculations
+   - Signatures or stamps
+
+3. **Receipt/Invoice Analysis**: If this is a receipt or invoice, extract:
+   - Store/business name and location
+   - Date and time of transaction
+   - Itemized list with prices
+   - Subtotals, taxes, discounts
+   - Total amount
+   - Payment method
+   - Receipt/transaction number
+
+4. **Visual Content**: Describe what you see:
+   - Objects, products, people, scenes
+   - Brands, logos, labels
+   - Colors, layout, condition
+   - Any relevant visual details
+
+5. **Handwritten Notes**: Pay special attention to handwritten content:
+   - Transcribe handwritten text as accurately as possible
+   - Note if handwriting is unclear
+   - Capture margin notes, annotations, signatures
+
+Provide a comprehensive, structured analysis with all extracted information."""
+
+HISTORY_SUMMARY_PROMPT = """Update the running summary of a customer's chat with a Toyota dealership sales assistant.
+
+Current summary:
+{summary}
+
+New messages to fold in:
+{messages}
+
+Write the updated summary in at most 120 words. Keep every concrete detail the customer gave (vehicle models and variants, location or branch, preferred dates and times, name, contact number, budget or financing preferences) and any prices or promos already quoted. Drop greetings and small talk."""
+
+PDF_PAGE_ANALYSIS_PROMPT = """Analyze page {page_number} of this PDF document. Extract ALL information including:
+- Printed text
+- Handwritten text, notes, or annotations
+- Tables, charts, diagrams
+- Signatures, stamps, marks
+- Any visual elements
+
+Provide a comprehensive analysis of this page."""
+
+VISION_SKIPPED_NOTE = "(Visual analysis skipped: every page has a complete text layer)"
 
 def encode_image_to_base64(image_file):
-    """Convert image to base64 string for OpenAI API"""
-    image = Image.open(image_file)
-    buffered = BytesIO()
-    image.save(buffered, format=image.format if image.format else "PNG")
-    return base64.b64encode(buffered.getvalue()).decode('utf-8')
+    """Convert image to a downscaled, EXIF-oriented JPEG base64 string for OpenAI API"""
+    return prepare_image(image_file)["base64"]
+
+def image_cache_key(image_bytes):
+    return content_hash(image_bytes, IMAGE_ANALYSIS_PROMPT, VISION_MODEL, f"{IMAGE_MAX_DIMENSION}:{IMAGE_JPEG_QUALITY}")
+
+def build_image_message(image_bytes, prompt=IMAGE_ANALYSIS_PROMPT):
+    """Build the vision request for an uploaded image"""
+    # Orient, downscale and re-encode before base64 so we don't pay for full-resolution phone photos
+    with trace("image.encode") as span:
+        prepared = prepare_image(BytesIO(image_bytes), original_bytes=len(image_bytes))
+        span.set(bytes=prepared["encoded_bytes"], original_bytes=len(image_bytes))
+    
+    return HumanMessage(
+        content=[
+            {
+                "type": "text",
+                "text": prompt
+            },
+            {
+                "type": "image_url",
+                "image_url": {
+                    "url": prepared["data_url"]
+                }
+            }
+        ]
+    )
+
+def describe_image(image_file):
+    """Prose analysis of an image from the vision model; raises on failure"""
+    with trace("analyze_image") as span:
+        # Streamlit reruns the whole script on every interaction, so reuse earlier results for the same image
+        image_bytes = file_bytes(image_file)
+        cache_key = image_cache_key(image_bytes)
+        cached = vision_cache.get(cache_key)
+        span.set(bytes=len(image_bytes), cache_hit=cached is not None)
+        if cached is not None:
+            return cached
+
+        # Shared ChatOpenAI instance with vision capabilities (gpt-4o supports vision)
+        llm_vision = get_llm(VISION_MODEL)
+        message = build_image_message(image_bytes)
+
+        with trace("llm.vision", model=VISION_MODEL) as llm_span:
+            response = resilience.call(
+                limiter.wrap(lambda: llm_vision.invoke([message])), tokens=resilience.estimate_tokens([message])
+            )
+            record_usage(llm_span, response, "llm.vision")
+        vision_cache.set(cache_key, response.content)
+        return response.content
+
+async def adescribe_image(image_file):
+    """Async describe_image - runs the model call on the shared loop behind the global limiter"""
+    with trace("analyze_image") as span:
+        image_bytes = file_bytes(image_file)
+        cache_key = image_cache_key(image_bytes)
+        cached = vision_cache.get(cache_key)
+        span.set(bytes=len(image_bytes), cache_hit=cached is not None)
+        if cached is not None:
+            return cached
+
+        message = await asyncio.to_thread(build_image_message, image_bytes)
+
+        async def attempt():
+            async with limiter:
+                return await get_llm(VISION_MODEL).ainvoke([message])
+
+        with trace("llm.vision", model=VISION_MODEL) as llm_span:
+            response = await resilience.acall(attempt, tokens=resilience.estimate_tokens([message]))
+            record_usage(llm_span, response, "llm.vision")
+        vision_cache.set(cache_key, response.content)
+        return response.content
 
 def analyze_image_with_ai(image_file):
     """Analyze image using OpenAI Vision API - supports any type of image including handwritten text and receipts"""
     try:
-        # Encode image to base64
-        base64_image = encode_image_to_base64(image_file)
-        
-        # Create a ChatOpenAI instance with vision capabilities
-        llm_vision = ChatOpenAI(
-            model="gpt-4o",  # gpt-4o supports vision
-            temperature=0,
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
+        return describe_image(image_file)
+    except Exception as e:
+        return f"Error analyzing image: {str(e)}"
+
+async def aanalyze_image_with_ai(image_file):
+    try:
+        return await adescribe_image(image_file)
+    except Exception as e:
+        return f"Error analyzing image: {str(e)}"
         
-        # Create message with image
-        message = HumanMessage(
-            content=[
-                {
-                    "type": "text",
-                    "text": """You are an advanced OCR and image analysis system. Analyze this image thoroughly and extract ALL information:
-
-                    PRIMARY TASKS:
-                    1. **Text Extraction (OCR)**: Extract ALL visible text, including:
-                       - Printed text
-                       - HANDWRITTEN text (cursive, print, notes)
-                       - Text in any language
-                       - Numbers, dates, codes
-                    
-                    2. **Document Analysis**: If this is a document, identify:
-                       - Document type (receipt, invoice, form, letter, note, etc.)
-                       - Key information (dates, amounts, names, addresses, phone numbers)
-                       - Line items, totals, calculations
-                       - Signatures or stamps
-                    
-                    3. **Receipt/Invoice Analysis**: If this is a receipt or invoice, extract:
-                       - Store/business name and location
-                       - Date and time of transaction
-                       - Itemized list with prices
-                       - Subtotals, taxes, discounts
-                       - Total amount
-                       - Payment method
-                       - Receipt/transaction number
-                    
-                    4. **Visual Content**: Describe what you see:
-                       - Objects, products, people, scenes
-                       - Brands, logos, labels
-                       - Colors, layout, condition
-                       - Any relevant visual details
-                    
-                    5. **Handwritten Notes**: Pay special attention to handwritten content:
-                       - Transcribe handwritten text as accurately as possible
-                       - Note if handwriting is unclear
-                       - Capture margin notes, annotations, signatures
-                    
-                    Provide a comprehensive, structured analysis with all extracted information."""
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{base64_image}"
-                    }
+def iter_pdf_page_images(pdf_bytes, page_numbers):
+    """Rasterize the given PDF pages one at a time so vision calls can start before the whole document is converted"""
+    from pdf2image import convert_from_bytes
+
+    for page_number in page_numbers:
+        with trace("pdf.rasterize", page=page_number, dpi=PDF_RASTER_DPI):
+            img = convert_from_bytes(pdf_bytes, dpi=PDF_RASTER_DPI, first_page=page_number, last_page=page_number)[0]
+        yield page_number, img
+
+def build_pdf_page_message(page_number, img):
+    # Convert PIL image to a downscaled JPEG data URL
+    with trace("pdf.encode", page=page_number) as span:
+        prepared = prepare_image(img)
+        span.set(bytes=prepared["encoded_bytes"])
+    
+    return pdf_page_message(page_number, prepared["data_url"])
+
+def pdf_page_message(page_number, data_url, prompt=PDF_PAGE_ANALYSIS_PROMPT):
+    """Vision request for a page that is already encoded, e.g. by a rasterizing worker process"""
+    return HumanMessage(
+        content=[
+            {
+                "type": "text",
+                "text": prompt.format(page_number=page_number)
+            },
+            {
+                "type": "image_url",
+                "image_url": {
+                    "url": data_url
                 }
-            ]
-        )
-        
-        # Get response
-        response = llm_vision.invoke([message])
+            }
+        ]
+    )
+
+def analyze_pdf_page(llm_vision, page_number, img, retries=PDF_VISION_RETRIES):
+    """Send one rasterized PDF page to the vision model, retrying transient failures with backoff"""
+    message = build_pdf_page_message(page_number, img)
+    
+    try:
+        with trace("llm.vision", model=VISION_MODEL, page=page_number) as span:
+            response = resilience.call(
+                limiter.wrap(lambda: llm_vision.invoke([message])), tokens=resilience.estimate_tokens([message]),
+                retries=retries,
+            )
+            record_usage(span, response, "llm.vision")
         return response.content
-        
     except Exception as e:
-        return f"Error analyzing image: {str(e)}"
-        
-def analyze_pdf_with_ai(pdf_file):
-    """Analyze PDF using OpenAI Vision API - converts PDF pages to images for visual analysis including handwritten content"""
+        return f"Error analyzing page {page_number}: {str(e)}"
+
+async def aanalyze_pdf_page(llm_vision, page_number, img, retries=PDF_VISION_RETRIES):
+    message = await asyncio.to_thread(build_pdf_page_message, page_number, img)
+    return await ainvoke_pdf_page(llm_vision, page_number, message, retries)
+
+async def ainvoke_pdf_page(llm_vision, page_number, message, retries=PDF_VISION_RETRIES):
+    """Send a prepared page message behind the global limiter, retrying transient failures with backoff"""
+    async def attempt():
+        async with limiter:
+            return await llm_vision.ainvoke([message])
+
+    try:
+        with trace("llm.vision", model=VISION_MODEL, page=page_number) as span:
+            response = await resilience.acall(attempt, tokens=resilience.estimate_tokens([message]), retries=retries)
+            record_usage(span, response, "llm.vision")
+        return response.content
+    except LimiterOverloaded:
+        raise
+    except Exception as e:
+        return f"Error analyzing page {page_number}: {str(e)}"
+
+def extract_and_route_pdf(reader, max_pages):
+    """PyPDF2 text for the whole PDF, plus the pages that still need the vision model (at most `max_pages`)"""
+    with trace("pdf.text_extract", pages=len(reader.pages)) as span:
+        page_texts = [page.extract_text() or "" for page in reader.pages]
+        extracted_text = "".join(text + "\n" for text in page_texts if text)
+        span.set(chars=len(extracted_text))
+    with trace("pdf.route", pages=len(page_texts)) as span:
+        vision_pages, decisions = route_pdf_pages(reader, page_texts, max_pages)
+        span.set(vision_pages=len(vision_pages), text_pages=sum(1 for decision in decisions if decision["route"] == "text"))
+    return extracted_text, vision_pages
+
+def analyze_pdf_with_ai(pdf_file, max_pages=None, max_concurrency=None, on_page=None):
+    """Analyze PDF using OpenAI Vision API - converts PDF pages to images for visual analysis including handwritten content
+
+    Only pages the local routing heuristics flag (no text layer, large images, ink annotations, sparse text) are
+    rasterized and sent to vision, at most `max_pages` of them (0 = no limit); the rest are covered by the text
+    extraction. Routed pages are analyzed concurrently (up to `max_concurrency` in flight).
+    `on_page(page_number, page_count, analysis)` is called from a worker thread as each page finishes.
+    """
+    max_pages = PDF_VISION_MAX_PAGES if max_pages is None else max_pages
+    max_concurrency = max_concurrency or PDF_VISION_CONCURRENCY
     try:
         # First extract text using PyPDF2
         reader = PyPDF2.PdfReader(pdf_file)
-        extracted_text = ""
-        for page in reader.pages:
-            text = page.extract_text()
-            if text:
-                extracted_text += text + "\n"
+        extracted_text, vision_pages = extract_and_route_pdf(reader, max_pages)
+        if not vision_pages:
+            return f"TEXT EXTRACTION:\n{extracted_text}\n\n{VISION_SKIPPED_NOTE}"
         
         # Try to convert PDF to images for vision analysis (if pdf2image is available)
         try:
-            from pdf2image import convert_from_bytes
-            
             pdf_file.seek(0)  # Reset file pointer
             pdf_bytes = pdf_file.read()
+            page_count = len(vision_pages)
             
-            # Convert first 3 pages to images (to avoid token limits)
-            images = convert_from_bytes(pdf_bytes, first_page=1, last_page=min(3, len(reader.pages)))
+            llm_vision = get_llm(VISION_MODEL)
             
-            llm_vision = ChatOpenAI(
-                model="gpt-4o",
-                temperature=0,
-                api_key=os.getenv("OPENAI_API_KEY")
-            )
-            
-            visual_analysis = ""
-            for i, img in enumerate(images):
-                # Convert PIL image to base64
-                buffered = BytesIO()
-                img.save(buffered, format="PNG")
-                base64_image = base64.b64encode(buffered.getvalue()).decode('utf-8')
-                
-                message = HumanMessage(
-                    content=[
-                        {
-                            "type": "text",
-                            "text": f"""Analyze page {i+1} of this PDF document. Extract ALL information including:
-                            - Printed text
-                            - Handwritten text, notes, or annotations
-                            - Tables, charts, diagrams
-                            - Signatures, stamps, marks
-                            - Any visual elements
-                            
-                            Provide a comprehensive analysis of this page."""
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}"
-                            }
-                        }
-                    ]
+            # Submit each page as soon as it is rasterized; futures stay in page order
+            with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+                futures = []
+                for page_number, img in iter_pdf_page_images(pdf_bytes, vision_pages):
+                    future = executor.submit(analyze_pdf_page, llm_vision, page_number, img)
+                    if on_page:
+                        future.add_done_callback(lambda done, n=page_number: on_page(n, page_count, done.result()))
+                    futures.append((page_number, future))
+                visual_analysis = "".join(
+                    f"\n--- PAGE {page_number} VISUAL ANALYSIS ---\n{future.result()}\n"
+                    for page_number, future in futures
                 )
-                
-                response = llm_vision.invoke([message])
-                visual_analysis += f"\n--- PAGE {i+1} VISUAL ANALYSIS ---\n{response.content}\n"
             
             return f"TEXT EXTRACTION:\n{extracted_text}\n\nVISUAL ANALYSIS (with handwriting detection):\n{visual_analysis}"
             
@@ -167,165 +346,313 @@ def analyze_pdf_with_ai(pdf_file):
             return f"TEXT EXTRACTION:\n{extracted_text}\n\n(Note: Install 'pdf2image' and 'poppler' for handwriting and visual analysis of PDFs)"
             
     except Exception as e:
-        return f"Error analyzing PDF: {str(e)}"
-    
-def read_uploaded_file(file):
-    file_type = file.type
+        return f"{PDF_ANALYSIS_ERROR} {str(e)}"
     
-    if file_type == "text/plain":
-        return file.read().decode("utf-8")
+async def aanalyze_pdf_with_ai(pdf_file, max_pages=None, max_concurrency=None):
+    """Async analyze_pdf_with_ai - rasterization runs in worker threads, vision calls on the shared loop"""
+    max_pages = PDF_VISION_MAX_PAGES if max_pages is None else max_pages
+    page_slots = asyncio.Semaphore(max_concurrency or PDF_VISION_CONCURRENCY)
 
-    elif file_type == "application/pdf":
-        reader = PyPDF2.PdfReader(file)
-        text = ""
-        for page in reader.pages:
-            extracted = page.extract_text()
-            if extracted:
-                text += extracted + "\n"
-        return text
-
-    elif file_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-        doc = docx.Document(file)
-        return "\n".join([para.text for para in doc.paragraphs])
+    async def analyze_page(page_number, img):
+        async with page_slots:
+            return await aanalyze_pdf_page(llm_vision, page_number, img)
 
-    elif file_type == "text/csv":
-        csv_text = ""
-        decoded = file.read().decode("utf-8").splitlines()
-        reader = csv.reader(decoded)
-        for row in reader:
-            csv_text += ", ".join(row) + "\n"
-        return csv_text
-
-    else:
-        return "❌ Unsupported file type"
-    
-    
-def ask_ai(question, chat_history, documents=""):
-    llm = ChatOpenAI(model="gpt-4o", temperature=0, api_key=os.getenv("OPENAI_API_KEY"))
-
-    prompt_template_text = """
-        You are Toyota AI — a polite, friendly, and professional virtual sales representative for one of the Philippines' top retail car dealerships.
-
-        Your Goal:
-        Engage customers naturally through chat, just like a real dealership salesperson would. Help them with inquiries about vehicles, specifications, pricing, promotions, financing, comparisons, test drives, and after-sales services.
+    try:
+        reader = PyPDF2.PdfReader(pdf_file)
+        extracted_text, vision_pages = await asyncio.to_thread(extract_and_route_pdf, reader, max_pages)
+        if not vision_pages:
+            return f"TEXT EXTRACTION:\n{extracted_text}\n\n{VISION_SKIPPED_NOTE}"
         
-        User Question: {question}
-        Documents: {documents}
-        Chat History: {chat_history}
-        ---
-
-        BEHAVIOR & CONDUCT RULES
-
-        1. Source of Truth
-
-        - Use only verified dealership information retrieved internally through your RAG knowledge system.
-        - This includes vehicle specifications, features, pricing, promotions, financing options, branch details, contact information, and dealership policies.
-        - Never mention, reference, or imply that your answers come from “files,” “documents,” “knowledge base,” or “internal data.”
-
-        2. Accuracy and Honesty
-
-        - Do not guess, assume, or invent any information such as prices, model variants, or contact details.
-        - If the customer asks about something not found in your data, use the fallback message below.
-
-        3. Tone and Style
-
-        - Sound like a real dealership sales agent — friendly, confident, conversational, and helpful.
-        - Keep responses clear, concise, and suitable for Messenger or Instagram chats.
-        - Your entire response must stay within **1000 characters** to ensure messages are short and readable.
-        - Use Filipino or English naturally, depending on the customer's tone and language.
-        - Avoid robotic or overly formal language. Keep it approachable, polite, and trustworthy.
+        try:
+            pdf_file.seek(0)  # Reset file pointer
+            pdf_bytes = pdf_file.read()
+            
+            llm_vision = get_llm(VISION_MODEL)
+            
+            # Start each page's vision call as soon as it is rasterized; tasks stay in page order
+            pages = iter_pdf_page_images(pdf_bytes, vision_pages)
+            tasks = []
+            while (page := await asyncio.to_thread(next, pages, None)) is not None:
+                page_number, img = page
+                tasks.append((page_number, asyncio.ensure_future(analyze_page(page_number, img))))
+            visual_analysis = "".join([
+                f"\n--- PAGE {page_number} VISUAL ANALYSIS ---\n{await task}\n"
+                for page_number, task in tasks
+            ])
+            
+            return f"TEXT EXTRACTION:\n{extracted_text}\n\nVISUAL ANALYSIS (with handwriting detection):\n{visual_analysis}"
+            
+        except ImportError:
+            return f"TEXT EXTRACTION:\n{extracted_text}\n\n(Note: Install 'pdf2image' and 'poppler' for handwriting and visual analysis of PDFs)"
+            
+    except Exception as e:
+        return f"{PDF_ANALYSIS_ERROR} {str(e)}"
+    
+def record_parse_time(file_type, seconds):
+    with parse_stats_lock:
+        stats = parse_stats.setdefault(file_type, {"files": 0, "total_s": 0.0, "max_s": 0.0})
+        stats["files"] += 1
+        stats["total_s"] += seconds
+        stats["max_s"] = max(stats["max_s"], seconds)
 
-        ---
 
-        PRICING AND FINANCING INQUIRIES
+def parse_time_stats():
+    """Parse count, total/average/max seconds per file type since the process started"""
+    with parse_stats_lock:
+        return {
+            file_type: dict(stats, avg_s=stats["total_s"] / stats["files"])
+            for file_type, stats in parse_stats.items()
+        }
 
-        - When customers ask about vehicle prices, promos, or payment terms:
-        - Provide the exact or official pricing details available from dealership data.
-        - Mention any available promos, installment options, or financing offers if listed in the dealership’s information.
-        - If the data includes monthly payment examples, mention them clearly (e.g., “Monthly starts at ₱X under our financing plan.”)
-        - Never estimate or invent prices, interest rates, or promo details.
-        - Example tone:
-        “The Toyota Vios starts at ₱X. We also have flexible financing plans depending on your preferred term.”
-        “We currently have a promo for the Fortuner this month — would you like me to share the full details?”
 
-        ---
+def read_uploaded_file(file):
+    """Extract text from an uploaded file, reusing the result for content any session has already parsed"""
+    return "".join(stream_uploaded_file(file))
 
-        VEHICLE AND PRODUCT INQUIRIES
 
-        - You should be able to:
-        - Identify and describe vehicles by type, model, or brand (e.g., sedan, SUV, pickup, hatchback, etc.).
-        - Compare vehicle specifications, parts, or features when dealership data allows.
-        - Provide detailed yet concise explanations from verified dealership information.
-        - Guide customers to the most suitable vehicle based on their needs or preferences.
+def stream_uploaded_file(file):
+    """Yield an uploaded file's text chunk by chunk, caching the full text once extraction completes"""
+    file_type = file.type
+    cache_key = content_hash(file_bytes(file), file_type, f"{EXTRACT_MAX_PAGES}:{EXTRACT_MAX_ROWS}")
+    cached = document_cache.get(cache_key)
+    if cached is not None:
+        if tracing.enabled():
+            tracing.record("extract", 0.0, attributes={"file_type": file_type, "cache_hit": True})
+        yield cached
+        return
+
+    start = time.perf_counter()
+    chunks = []
+    for chunk in iter_uploaded_file(file):
+        chunks.append(chunk)
+        yield chunk
+    seconds = time.perf_counter() - start
+    record_parse_time(file_type, seconds)
+    if tracing.enabled():
+        tracing.record("extract", seconds, attributes={"file_type": file_type, "bytes": len(file_bytes(file)), "cache_hit": False})
+    if file_type in SUPPORTED_FILE_TYPES:
+        document_cache.set(cache_key, "".join(chunks))
+
+
+def iter_pdf_text(reader, max_pages=None):
+    """Yield the extracted text of each PDF page (newline-terminated), skipping pages with no text layer"""
+    for page_number, page in enumerate(reader.pages, start=1):
+        if max_pages and page_number > max_pages:
+            break
+        extracted = page.extract_text()
+        if extracted:
+            yield extracted + "\n"
+
+
+def iter_uploaded_file(file, max_pages=None, max_rows=None):
+    """Yield an uploaded file's text lazily - per page for PDFs, in row/paragraph batches for CSV/DOCX.
+
+    Joining the chunks gives the full text; nothing holds the whole document as repeated string copies,
+    so callers can show the first chunk while the rest is still being extracted.
+    """
+    file_type = file.type
+    max_pages = EXTRACT_MAX_PAGES if max_pages is None else max_pages
+    max_rows = EXTRACT_MAX_ROWS if max_rows is None else max_rows
+    
+    if file_type in ("text/plain", "text/csv"):
+        file.seek(0)
 
-        Example tone:
+    if file_type == "text/plain":
+        text_stream = TextIOWrapper(file, encoding="utf-8", newline="")
+        try:
+            yield from iter(lambda: text_stream.read(TEXT_CHUNK_CHARS), "")
+        finally:
+            text_stream.detach()  # leave the uploaded file open for later readers
 
-        - “The Vios is a compact sedan, perfect for city driving. It’s more fuel-efficient compared to the Innova, which is a larger MPV ideal for families.”
-        - “Between the Hilux and the Fortuner, both share the same engine platform, but the Fortuner offers a more premium interior.”
+    elif file_type == "application/pdf":
+        yield from iter_pdf_text(PyPDF2.PdfReader(file), max_pages)
 
-        ---
+    elif file_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
+        paragraphs = (para.text for para in docx.Document(file).paragraphs)
+        first = True
+        for batch in iter_batches(paragraphs, EXTRACT_BATCH_SIZE):
+            yield ("" if first else "\n") + "\n".join(batch)
+            first = False
 
-        TEST DRIVE INQUIRIES
+    elif file_type == "text/csv":
+        text_stream = TextIOWrapper(file, encoding="utf-8", newline="")
+        try:
+            rows = csv.reader(text_stream)
+            if max_rows:
+                rows = islice(rows, max_rows)
+            for batch in iter_batches(rows, EXTRACT_BATCH_SIZE):
+                yield "".join(", ".join(row) + "\n" for row in batch)
+        finally:
+            text_stream.detach()
 
-        - When a customer asks to schedule a test drive:
-        - Politely collect the customer’s name, preferred date and time, contact number, and preferred branch or location.
-        - Confirm the details clearly and naturally.
-        - Example flow:
-            “Sure! I can help you book a test drive. May I get your full name, preferred date and time, and contact number?”
-            “Got it. Would you like to take the test drive at our [branch name]?”
-            If a customer says they want to book a test drive, follow this flow naturally:
+    else:
+        yield UNSUPPORTED_FILE_TYPE
 
-        1. If user says: "I'd like to book a test drive"
-        → Respond: "Sure! Which car would you like to test drive?"
 
-        2. If user names a car (e.g., "I'd like to test drive the Fortuner")
-        → Respond: "Awesome choice! Let’s schedule your test drive. Where are you located?"
+def iter_batches(items, size):
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+    
+    
+def load_system_prompt(path=None):
+    """Read the static sales-agent instructions, dropping the triple quotes prompt.md is wrapped in"""
+    with open(path or SYSTEM_PROMPT_PATH, "r", encoding="utf-8") as f:
+        text = f.read().strip()
+    if text.startswith('"""') and text.endswith('"""'):
+        text = text[3:-3].strip()
+    return text
 
-        3. If user provides a location (e.g., "I'm in Makati")
-        → Respond: "Great, the nearest dealer is located in [branch address from data]. When would you like to do the test drive?"
 
-        4. If user gives a date/time (e.g., "October 11 at 3pm")
-        → Respond: "Can I have your full name and mobile number please?"
+def build_ai_chain(model=CHAT_MODEL):
+    """Build the sales-agent prompt | model | parser chain shared by ask_ai and stream_ask_ai
 
-        5. If user provides name and contact number
-        → Respond: "Thank you. One of our agents will reach out to you for confirmation."
+    Messages run from most to least stable - fixed instructions, then dealership data, then the chat so far,
+    then the question - so every turn repeats the longest possible prefix and hits the provider's prompt cache.
+    The instructions are a plain SystemMessage, not a template, so braces in prompt.md are never parsed.
+    """
+    llm = get_llm(model)
 
-        - Always handle the booking conversation as if you are assisting a real inquiry, but do not process or confirm the booking unless dealership data or process allows it.
+    prompt_template = ChatPromptTemplate.from_messages([
+        SystemMessage(content=load_system_prompt()),
+        ("system", "Dealership data:\n{documents}"),
+        ("system", "Chat history:\n{chat_history}"),
+        ("human", "{question}"),
+    ])
+    return prompt_template | llm | StrOutputParser()
 
-        ---
 
-        WHEN INFORMATION IS NOT AVAILABLE
-        If the knowledge system doesn't contain relevant information, respond politely with the fallback message below (in Filipino or English, whichever matches the user’s tone):
+def build_summary_chain():
+    # Folding old turns into a summary is routine work for the small tier
+    return ChatPromptTemplate.from_template(HISTORY_SUMMARY_PROMPT) | get_llm(TIERS["small"]) | StrOutputParser()
 
-        “I'm not sure about that, but you can reach our customer support team or message us directly here so one of our agents can assist you.”
 
-        Include any known hotline or branch contact if available from dealership data.
+def summarize_history(summary, messages):
+    """Fold messages that dropped out of the verbatim history window into the running conversation summary"""
+    chain = get_chain("summarize_history", build_summary_chain)
+    inputs = {"summary": summary or "(none)", "messages": format_messages(messages)}
+    return resilience.call(limiter.wrap(lambda: chain.invoke(inputs)), tokens=resilience.estimate_tokens(inputs))
 
-        ---
 
-        STRICT RULES
+def tier_chain(tier):
+    return get_chain(f"ask_ai.{tier}", lambda: build_ai_chain(TIERS[tier]))
 
-        - Rely entirely on the dealership's internal knowledge (RAG data).
-        - Never use general internet knowledge or personal assumptions.
-        - Never invent, estimate, or generalize vehicle or financial information.
-        - Never reveal or describe your internal systems, data, or AI nature.
-        - Never ask for information unrelated to vehicle inquiries or dealership services.
-        - Keep all responses within 1000 characters total.
+def invoke_tier(tier, inputs, span):
+    """One chat answer from a tier through the shared deadline / retry / rate-limit layer"""
+    config = {"callbacks": callbacks(span, f"ask_ai.{tier}")}
+    return resilience.call(
+        limiter.wrap(lambda: tier_chain(tier).invoke(inputs, config=config)), tokens=resilience.estimate_tokens(inputs)
+    )
 
-        ---
+async def ainvoke_tier(tier, inputs, span):
+    config = {"callbacks": callbacks(span, f"ask_ai.{tier}")}
 
-        Mission Recap:
-        Act as a trusted dealership sales agent. Provide accurate, helpful, and confident responses grounded only in verified dealership data. Assist customers naturally — whether they're asking about cars, comparing models, or booking a test drive — and make every chat feel like a genuine conversation with a professional car sales expert.
-        """
+    async def attempt():
+        async with limiter:
+            return await tier_chain(tier).ainvoke(inputs, config=config)
 
+    return await resilience.acall(attempt, tokens=resilience.estimate_tokens(inputs))
 
-    prompt_template = ChatPromptTemplate.from_template(prompt_template_text)
-    ai_chain = prompt_template | llm | StrOutputParser()
+def ask_ai(question, chat_history, documents=""):
+    """Answer a chat turn on the tier choose_tier picks, retrying on the large tier when the small one can't answer"""
+    inputs = {"question": question, "documents": documents, "chat_history": chat_history}
+    tier, reason = choose_tier(question, documents)
 
-    try:
-        return ai_chain.invoke({"question": question, "documents": documents, "chat_history": chat_history})
-    except Exception as e:
-        return f"Error: {e}"
+    with trace("ask_ai", documents_chars=len(documents), tier=tier) as span:
+        try:
+            start = time.perf_counter()
+            answer = invoke_tier(tier, inputs, span)
+            escalate = tier == "small" and needs_escalation(answer)
+            record_tier(tier, time.perf_counter() - start, escalated=escalate, reason=reason)
+            if escalate:
+                span.set(escalated=True)
+                start = time.perf_counter()
+                answer = invoke_tier("large", inputs, span)
+                record_tier("large", time.perf_counter() - start, reason="escalated")
+            return answer
+        except Exception as e:
+            span.set(error=str(e))
+            return f"Error: {e}"
+
+
+async def aask_ai(question, chat_history, documents=""):
+    """Async ask_ai - awaits the model on the shared loop behind the global limiter"""
+    inputs = {"question": question, "documents": documents, "chat_history": chat_history}
+    tier, reason = choose_tier(question, documents)
+
+    with trace("ask_ai", documents_chars=len(documents), tier=tier) as span:
+        try:
+            start = time.perf_counter()
+            answer = await ainvoke_tier(tier, inputs, span)
+            escalate = tier == "small" and needs_escalation(answer)
+            record_tier(tier, time.perf_counter() - start, escalated=escalate, reason=reason)
+            if escalate:
+                span.set(escalated=True)
+                start = time.perf_counter()
+                answer = await ainvoke_tier("large", inputs, span)
+                record_tier("large", time.perf_counter() - start, reason="escalated")
+            return answer
+        except Exception as e:
+            span.set(error=str(e))
+            return f"Error: {e}"
+
+
+def stream_tier(tier, inputs, span):
+    config = {"callbacks": callbacks(span, f"ask_ai.{tier}")}
+
+    def attempt():
+        # The slot is held until the stream ends or the reader stops early
+        with limiter.hold():
+            yield from tier_chain(tier).stream(inputs, config=config)
+
+    return resilience.stream(attempt, tokens=resilience.estimate_tokens(inputs))
+
+
+def stream_ask_ai(question, chat_history, documents=""):
+    """Same as ask_ai, but yields the reply token by token as the model generates it
+
+    A small-tier reply is held back only until its first ESCALATION_PROBE_CHARS show it isn't the fallback
+    message or a refusal; if it is, nothing has been shown yet and the large tier answers instead.
+    """
+    inputs = {"question": question, "documents": documents, "chat_history": chat_history}
+    tier, reason = choose_tier(question, documents)
+
+    with trace("ask_ai.stream", documents_chars=len(documents), tier=tier) as span:
+        start = time.perf_counter()
+        first_token = True
+        try:
+            held = ""
+            escalate = False
+            for token in stream_tier(tier, inputs, span):
+                if tier == "small" and held is not None:
+                    held += token
+                    if might_escalate(held):
+                        continue
+                    token, held = held, None
+                if first_token:
+                    span.set(time_to_first_token_s=round(time.perf_counter() - start, 4))
+                    first_token = False
+                yield token
+            if held is not None and tier == "small":
+                # The whole reply fit in the probe window
+                escalate = needs_escalation(held)
+                if not escalate:
+                    span.set(time_to_first_token_s=round(time.perf_counter() - start, 4))
+                    yield held
+            record_tier(tier, time.perf_counter() - start, escalated=escalate, reason=reason)
+
+            if escalate:
+                span.set(escalated=True)
+                start = time.perf_counter()
+                for token in stream_tier("large", inputs, span):
+                    if first_token:
+                        span.set(time_to_first_token_s=round(time.perf_counter() - start, 4))
+                        first_token = False
+                    yield token
+                record_tier("large", time.perf_counter() - start, reason="escalated")
+        except Exception as e:
+            span.set(error=str(e))
+            yield f"Error: {e}"
     
     
     
\ No newline at end of file
@@ -0,0 +1,106 @@
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from tokens import count_tokens, last_tokens
+
+# Recent exchanges (user + assistant) kept verbatim, and the token budget they may use
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "6"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+# Exchanges that may pile up past the window before they are summarized together, instead of one summary per turn
+HISTORY_SUMMARY_BLOCK_TURNS = int(os.getenv("HISTORY_SUMMARY_BLOCK_TURNS", "3"))
+
+# Summaries are written in the background so a chat turn never waits for one
+_summarizer = ThreadPoolExecutor(max_workers=int(os.getenv("HISTORY_SUMMARY_WORKERS", "4")), thread_name_prefix="history-summary")
+
+ROLE_LABELS = {"user": "Customer", "bot": "Assistant"}
+
+
+def format_messages(messages):
+    return "\n".join(f"{ROLE_LABELS.get(msg['role'], msg['role'])}: {msg['content']}" for msg in messages)
+
+
+class ChatHistory:
+    """Bounded chat history for the prompt: recent turns verbatim, older turns folded into a running summary.
+
+    The summary is updated incrementally - each update only folds the messages that have fallen out of the
+    verbatim window into the previous summary - so it is never regenerated from scratch. Updates wait until
+    `block_turns` exchanges have left the window and run in the background; until one lands, the newest of
+    those messages fill whatever token budget the window leaves. `summarize(summary, messages)` must return the
+    new summary text.
+    """
+
+    def __init__(self, summarize, max_turns=HISTORY_MAX_TURNS, token_budget=HISTORY_TOKEN_BUDGET,
+                 block_turns=HISTORY_SUMMARY_BLOCK_TURNS):
+        self.summarize = summarize
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.block_turns = block_turns
+        self.summary = ""
+        self.summarized_count = 0
+        self.verbatim_tokens = 0
+        self.summary_tokens = 0
+        self._pending = None
+
+    def _window_start(self, messages):
+        start = len(messages)
+        tokens = 0
+        while start > self.summarized_count and len(messages) - start < self.max_turns * 2:
+            message_tokens = count_tokens(messages[start - 1]["content"])
+            # Always keep the latest message, even if it alone exceeds the budget
+            if start < len(messages) and tokens + message_tokens > self.token_budget:
+                break
+            tokens += message_tokens
+            start -= 1
+        return start, tokens
+
+    def _collect(self):
+        """Adopt the background summary once it has finished"""
+        if self._pending is None or not self._pending[0].done():
+            return
+        future, end, evicted = self._pending
+        self._pending = None
+        try:
+            self.summary = future.result()
+        except Exception:
+            # Keep the conversation going without a fresh summary rather than failing the turn; cap the raw
+            # fallback at the token budget so repeated failures can't grow it without bound
+            self.summary = last_tokens(f"{self.summary}\n{format_messages(evicted)}".strip(), self.token_budget)
+        self.summarized_count = end
+        self.summary_tokens = count_tokens(self.summary)
+
+    def prompt_history(self, messages):
+        """Return the history text for the prompt, starting a summary update once a block has left the verbatim window"""
+        self._collect()
+        start, self.verbatim_tokens = self._window_start(messages)
+        if self._pending is None and start - self.summarized_count >= max(1, self.block_turns) * 2:
+            evicted = messages[self.summarized_count:start]
+            future = _summarizer.submit(contextvars.copy_context().run, self.summarize, self.summary, evicted)
+            self._pending = (future, start, evicted)
+
+        recent = format_messages(messages[start:])
+        # Messages that left the window but aren't summarized yet get whatever budget the window leaves, newest first
+        unsummarized = last_tokens(
+            format_messages(messages[self.summarized_count:start]), self.token_budget - self.verbatim_tokens
+        )
+        if unsummarized:
+            recent = f"{unsummarized}\n{recent}"
+            self.verbatim_tokens += count_tokens(unsummarized)
+        if not self.summary:
+            return recent
+        return f"Summary of earlier conversation:\n{self.summary}\n\nRecent messages:\n{recent}"
+
+    def reset(self):
+        self._pending = None
+        self.summary = ""
+        self.summarized_count = 0
+        self.verbatim_tokens = 0
+        self.summary_tokens = 0
+
+    def stats(self):
+        return {
+            "verbatim_tokens": self.verbatim_tokens,
+            "summary_tokens": self.summary_tokens,
+            "trimmed_messages": self.summarized_count,
+            "trimmed_turns": self.summarized_count // 2,
+        }
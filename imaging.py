@@ -0,0 +1,76 @@
+import base64
+import math
+import os
+import threading
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+# Vision preprocessing: longest side sent to the model, JPEG quality, and DPI used to rasterize PDF pages.
+# gpt-4o fits high-detail images into 2048x2048 and then 768px on the short side, so larger uploads only cost bandwidth.
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "2048"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+PDF_RASTER_DPI = int(os.getenv("PDF_RASTER_DPI", "150"))
+
+_stats_lock = threading.Lock()
+upload_stats = {"images": 0, "original_bytes": 0, "encoded_bytes": 0, "estimated_tokens": 0}
+
+
+def estimate_vision_tokens(width, height):
+    """Estimate gpt-4o high-detail image tokens: 85 base + 170 per 512px tile after OpenAI's own resizing"""
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def prepare_image(image, original_bytes=None, max_dimension=None, quality=None):
+    """Orient, downscale and JPEG-encode an image (PIL image, path or file) for a vision request.
+
+    Returns a dict with the base64 payload, its MIME type, a ready-to-send data URL, and size/token figures.
+    """
+    max_dimension = max_dimension or IMAGE_MAX_DIMENSION
+    quality = quality or IMAGE_JPEG_QUALITY
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+
+    # Phone photos are often stored sideways with an EXIF rotation flag the model never sees
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "L"):
+        # Flatten transparency onto white so receipts with alpha don't turn black
+        background = Image.new("RGB", image.size, "white")
+        rgba = image.convert("RGBA")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        image = background
+    if max(image.size) > max_dimension:
+        image = image.copy()
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    buffered = BytesIO()
+    image.save(buffered, format="JPEG", quality=quality, optimize=True)
+    encoded = buffered.getvalue()
+    payload = base64.b64encode(encoded).decode("utf-8")
+    prepared = {
+        "base64": payload,
+        "mime_type": "image/jpeg",
+        "data_url": f"data:image/jpeg;base64,{payload}",
+        "width": image.width,
+        "height": image.height,
+        "original_bytes": original_bytes,
+        "encoded_bytes": len(encoded),
+        "estimated_tokens": estimate_vision_tokens(image.width, image.height),
+    }
+
+    with _stats_lock:
+        upload_stats["images"] += 1
+        upload_stats["original_bytes"] += original_bytes or 0
+        upload_stats["encoded_bytes"] += len(encoded)
+        upload_stats["estimated_tokens"] += prepared["estimated_tokens"]
+    return prepared
+
+
+def vision_upload_stats():
+    """Totals across every image prepared in this process"""
+    with _stats_lock:
+        return dict(upload_stats)
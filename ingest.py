@@ -0,0 +1,244 @@
+"""Bulk-load a directory of dealership documents into the shared knowledge base.
+
+    python ingest.py ./brochures                     # text extraction for every supported file
+    python ingest.py ./brochures --vision --workers 8  # also analyze PDF pages with the vision model
+
+Parsing and PDF rasterization run in a process pool; vision calls run on the shared event loop behind a
+bounded pool and the global limiter. Each file is committed to the store as soon as it finishes, and vision
+results are cached per page on disk, so an interrupted run picks up where it stopped. Unchanged files are skipped.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import PyPDF2
+
+from async_runtime import run_async
+from cache import content_hash
+from functionalities import (
+    PDF_PAGE_ANALYSIS_PROMPT,
+    PDF_VISION_MAX_PAGES,
+    VISION_MODEL,
+    UNSUPPORTED_FILE_TYPE,
+    VISION_SKIPPED_NOTE,
+    adescribe_image,
+    ainvoke_pdf_page,
+    extract_and_route_pdf,
+    iter_pdf_page_images,
+    pdf_page_message,
+    read_uploaded_file,
+    vision_cache,
+)
+from clients import get_llm
+from extraction import STRUCTURED_EXTRACTION, aextract_image_records, to_context
+from imaging import prepare_image
+from knowledge import IMAGE_TYPES, KNOWLEDGE_DIR, KnowledgeStore
+
+FILE_TYPES = {
+    ".pdf": "application/pdf",
+    ".txt": "text/plain",
+    ".csv": "text/csv",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+}
+
+
+class LocalFile(BytesIO):
+    """A file on disk presented like a Streamlit upload (.name and .type)"""
+
+    def __init__(self, path, file_type):
+        with open(path, "rb") as f:
+            super().__init__(f.read())
+        self.name = os.path.basename(path)
+        self.type = file_type
+
+
+def find_files(directory):
+    """Yield (store name, path, MIME type) for every supported file below directory, in a stable order"""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for filename in sorted(files):
+            file_type = FILE_TYPES.get(os.path.splitext(filename)[1].lower())
+            if file_type:
+                path = os.path.join(root, filename)
+                yield os.path.relpath(path, directory).replace(os.sep, "/"), path, file_type
+
+
+def extract_file(path, file_type, vision_pages):
+    """Process-pool worker: extract text and, when `vision_pages` is not None, rasterize and encode PDF pages.
+
+    Pages come back as JPEG data URLs so the parent only has to send them.
+    """
+    start = time.perf_counter()
+    file = LocalFile(path, file_type)
+    text = read_uploaded_file(file)
+    pages = []
+    note = None
+    if vision_pages is not None and file_type == "application/pdf":
+        try:
+            # Only pages the routing heuristics flag are rasterized
+            _, page_numbers = extract_and_route_pdf(PyPDF2.PdfReader(file), vision_pages)
+            pages = [
+                (page_number, prepare_image(img)["data_url"])
+                for page_number, img in iter_pdf_page_images(file.getvalue(), page_numbers)
+            ]
+            if not page_numbers:
+                note = VISION_SKIPPED_NOTE
+        except Exception as e:
+            note = f"(Note: visual analysis unavailable: {e})"
+    return {"text": text, "pages": pages, "note": note, "seconds": time.perf_counter() - start}
+
+
+async def analyze_page(llm_vision, page_number, data_url, vision_slots):
+    cache_key = content_hash(data_url, PDF_PAGE_ANALYSIS_PROMPT.format(page_number=page_number), VISION_MODEL)
+    cached = vision_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    async with vision_slots:
+        analysis = await ainvoke_pdf_page(llm_vision, page_number, pdf_page_message(page_number, data_url))
+    if not analysis.startswith(f"Error analyzing page {page_number}:"):
+        vision_cache.set(cache_key, analysis)
+    return analysis
+
+
+async def ingest_one(store, pool, name, path, file_type, source_hash, args, slots):
+    """Extract, analyze and store one file; returns its throughput record"""
+    loop = asyncio.get_running_loop()
+    size = os.path.getsize(path)
+    record = {"file": name, "bytes": size, "pages": 0, "extract_s": 0.0, "vision_s": 0.0}
+    async with slots["files"]:
+        try:
+            if file_type in IMAGE_TYPES:
+                vision_start = time.perf_counter()
+                image = LocalFile(path, file_type)
+                async with slots["vision"]:
+                    if STRUCTURED_EXTRACTION:
+                        text = to_context(await aextract_image_records(image))
+                    else:
+                        text = await adescribe_image(image)
+                record["vision_s"] = time.perf_counter() - vision_start
+                kind = "image"
+            else:
+                vision_pages = args.max_pages if args.vision else None
+                extracted = await loop.run_in_executor(pool, extract_file, path, file_type, vision_pages)
+                record["extract_s"] = extracted["seconds"]
+                text = extracted["text"]
+                kind = "document"
+                if text == UNSUPPORTED_FILE_TYPE:
+                    raise ValueError(text)
+                if extracted["pages"]:
+                    vision_start = time.perf_counter()
+                    llm_vision = get_llm(VISION_MODEL)
+                    analyses = await asyncio.gather(*(
+                        analyze_page(llm_vision, page_number, data_url, slots["vision"])
+                        for page_number, data_url in extracted["pages"]
+                    ))
+                    visual_analysis = "".join(
+                        f"\n--- PAGE {page_number} VISUAL ANALYSIS ---\n{analysis}\n"
+                        for (page_number, _), analysis in zip(extracted["pages"], analyses)
+                    )
+                    text = f"TEXT EXTRACTION:\n{text}\n\nVISUAL ANALYSIS (with handwriting detection):\n{visual_analysis}"
+                    record["vision_s"] = time.perf_counter() - vision_start
+                    record["pages"] = len(extracted["pages"])
+                elif extracted["note"]:
+                    text = f"TEXT EXTRACTION:\n{text}\n\n{extracted['note']}"
+            # Committing here is the checkpoint: a rerun skips every file already in the manifest
+            store_start = time.perf_counter()
+            record["status"] = await asyncio.to_thread(store.add, name, text, source_hash, kind)
+            record["store_s"] = time.perf_counter() - store_start
+        except Exception as e:
+            record["status"] = "failed"
+            record["error"] = str(e)
+    # Time spent working on this file, excluding waits for a free worker or pool start-up
+    record["seconds"] = record["extract_s"] + record["vision_s"] + record.get("store_s", 0.0)
+    record["mb_per_s"] = size / 1e6 / record["seconds"] if record["seconds"] else 0.0
+    print_record(record)
+    return record
+
+
+def print_record(record):
+    line = (f"{record['status']:9} {record['file']}  {record['bytes'] / 1024:,.0f} KB in {record['seconds']:.2f}s "
+            f"({record['mb_per_s']:.2f} MB/s, extract {record['extract_s']:.2f}s, vision {record['vision_s']:.2f}s")
+    if record["pages"]:
+        line += f", {record['pages']} pages"
+    line += ")"
+    if record.get("error"):
+        line += f"  {record['error'][:200]}"
+    print(line, flush=True)
+
+
+async def ingest_directory(store, pool, files, args):
+    slots = {
+        # Bound extracted-but-unsent work so rasterized pages don't pile up in memory
+        "files": asyncio.Semaphore(args.workers * 2),
+        "vision": asyncio.Semaphore(args.vision_concurrency),
+    }
+    return await asyncio.gather(*(
+        ingest_one(store, pool, name, path, file_type, source_hash, args, slots)
+        for name, path, file_type, source_hash in files
+    ))
+
+
+def source_signature(path, vision):
+    """Hash of the file bytes plus the ingest mode, so enabling --vision re-ingests PDFs once"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if vision and path.lower().endswith(".pdf"):
+        return content_hash(data, "vision")
+    return content_hash(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--store", default=KNOWLEDGE_DIR, help="knowledge base directory (default: KNOWLEDGE_DIR)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="processes for parsing and rasterization")
+    parser.add_argument("--vision", action="store_true", help="also analyze PDF pages with the vision model")
+    parser.add_argument("--max-pages", type=int, default=PDF_VISION_MAX_PAGES, help="PDF pages per file sent to vision (0 = all)")
+    parser.add_argument("--vision-concurrency", type=int, default=8, help="vision calls in flight")
+    parser.add_argument("--force", action="store_true", help="re-ingest files even if they are unchanged")
+    parser.add_argument("--report", help="write per-file throughput as JSON to this file")
+    args = parser.parse_args()
+
+    store = KnowledgeStore(args.store)
+    if vision_cache.disk_dir is None:
+        # Finished pages survive an interrupted run
+        vision_cache.disk_dir = os.path.join(args.store, "vision_cache")
+
+    files, skipped = [], 0
+    for name, path, file_type in find_files(args.directory):
+        source_hash = source_signature(path, args.vision)
+        if not args.force and store.is_current(name, source_hash):
+            skipped += 1
+            continue
+        files.append((name, path, file_type, source_hash))
+    print(f"{len(files)} file(s) to ingest, {skipped} unchanged", flush=True)
+
+    start = time.perf_counter()
+    # spawn: the parent already runs the event loop and HTTP client threads, which must not be forked
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        records = run_async(ingest_directory(store, pool, files, args))
+    seconds = time.perf_counter() - start
+
+    failed = sum(1 for record in records if record["status"] == "failed")
+    total_bytes = sum(record["bytes"] for record in records)
+    print(
+        f"done: {len(records) - failed} stored, {failed} failed, {skipped} unchanged in {seconds:.1f}s "
+        f"({len(records) / seconds if seconds else 0:.2f} files/s, {total_bytes / 1e6 / seconds if seconds else 0:.2f} MB/s)"
+    )
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"seconds": seconds, "skipped": skipped, "files": records}, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
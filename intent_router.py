@@ -0,0 +1,263 @@
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from response_cache import STOPWORDS, normalize_question
+
+# Scripted turns (the test-drive booking flow, fixed quick actions) are answered from templates without a model call.
+# Set INTENT_ROUTER=0 to send every turn to the model as before.
+INTENT_ROUTER = os.getenv("INTENT_ROUTER", "1").lower() not in ("0", "false", "no")
+
+TOYOTA_MODELS = [
+    "Land Cruiser Prado", "Land Cruiser", "Corolla Altis", "Corolla Cross", "Yaris Cross", "GR Yaris", "Lite Ace",
+    "Vios", "Wigo", "Raize", "Rush", "Veloz", "Avanza", "Innova", "Zenix", "Fortuner", "Hilux", "Camry", "Hiace",
+    "Coaster", "Tamaraw", "Alphard", "Supra", "GR86", "bZ4X", "Prius", "RAV4",
+]
+MODEL_PATTERN = re.compile(r"\b(" + "|".join(re.escape(model) for model in TOYOTA_MODELS) + r")\b", re.IGNORECASE)
+
+TEST_DRIVE_PATTERN = re.compile(r"\btest[\s-]?drive\b", re.IGNORECASE)
+BOOKING_VERB_PATTERN = re.compile(r"\b(book|schedule|set|reserve|want|like|try|request|arrange)\b", re.IGNORECASE)
+QUESTION_PATTERN = re.compile(
+    r"\?\s*$|^(how|what|which|who|why|where|when|is|are|do|does|can|could|may|will|magkano|ano|saan|paano|kailan|pwede)\b",
+    re.IGNORECASE,
+)
+WH_PATTERN = re.compile(r"\b(how|what|which|who|why|where|when|magkano|ano|saan|paano|kailan)\b", re.IGNORECASE)
+# English only: "kumusta po" and other Filipino greetings go to the model so the reply matches the customer's language
+GREETING_PATTERN = re.compile(r"^(hi|hello|hey|good (morning|afternoon|evening))( there)?[!. ]*$", re.IGNORECASE)
+# Filipino function words: those turns go to the model so the reply matches the customer's language
+FILIPINO_PATTERN = re.compile(r"\b(po|opo|ba|ang|ng|sa|yung|naman|lang|kayo|ako|ko|mo|gusto|nasa|taga|bukas|pangalan)\b", re.IGNORECASE)
+
+MONTHS = r"jan(uary)?|feb(ruary)?|mar(ch)?|apr(il)?|may|june?|july?|aug(ust)?|sep(t(ember)?)?|oct(ober)?|nov(ember)?|dec(ember)?"
+DAYS = r"mon(day)?|tue(s(day)?)?|wed(nesday)?|thu(rs(day)?)?|fri(day)?|sat(urday)?|sun(day)?"
+DATE_PATTERN = re.compile(
+    rf"\b(today|tomorrow|tonight|next week|this weekend|weekend|{DAYS}|{MONTHS})\b"
+    r"|\b\d{1,2}[/-]\d{1,2}([/-]\d{2,4})?\b|\b\d{1,2}(:\d{2})?\s*(am|pm)\b|\b\d{1,2}:\d{2}\b",
+    re.IGNORECASE,
+)
+PHONE_PATTERN = re.compile(r"(\+?63|0)9\d{2}[\s-]?\d{3}[\s-]?\d{4}|\(?0\d{1,2}\)?[\s-]?\d{3,4}[\s-]?\d{4}")
+# A reply to "Where are you located?" counts as a location only with a preposition ("I'm in ...") or a known place name
+LOCATION_PREFIX_PATTERN = re.compile(r"^((i'?m|i am|we'?re|we are|i live|we live|located|staying|currently|just)\s+)?(in|at|from|near|around)\s+", re.IGNORECASE)
+PLACES = [
+    "Metro Manila", "Manila", "Makati", "Pasig", "Taguig", "BGC", "Quezon City", "QC", "Mandaluyong", "San Juan", "Pasay",
+    "Parañaque", "Paranaque", "Las Piñas", "Las Pinas", "Muntinlupa", "Alabang", "Marikina", "Caloocan", "Malabon",
+    "Navotas", "Valenzuela", "Ortigas", "Cubao", "Fairview", "Commonwealth", "Cebu", "Mandaue", "Lapu-Lapu", "Davao",
+    "Iloilo", "Bacolod", "Cagayan de Oro", "Baguio", "Pampanga", "San Fernando", "Angeles", "Clark", "Batangas", "Lipa",
+    "Laguna", "Santa Rosa", "Sta. Rosa", "Calamba", "Cavite", "Bacoor", "Dasmariñas", "Dasmarinas", "Imus", "Bulacan",
+    "Malolos", "Rizal", "Antipolo", "Cainta", "Tarlac", "Pangasinan", "Dagupan", "Naga", "Legazpi", "Tacloban",
+    "Zamboanga", "General Santos", "Butuan", "Iligan", "Bohol", "Tagbilaran", "Palawan", "Puerto Princesa",
+    "Nueva Ecija", "Cabanatuan", "Isabela", "Tuguegarao", "Ilocos", "Laoag", "Vigan", "La Union", "Subic", "Olongapo",
+]
+PLACE_PATTERN = re.compile(r"\b(" + "|".join(re.escape(place) for place in PLACES) + r")\b", re.IGNORECASE)
+# Only dealership-data lines that name a branch or an address can be offered as the nearest dealer
+BRANCH_LINE_PATTERN = re.compile(r"\b(toyota|branch|dealer|dealership|showroom|address)\b", re.IGNORECASE)
+# Words too common in addresses to tell one branch from another
+GENERIC_PLACE_WORDS = {"city", "town", "province", "metro", "area", "near", "street", "st", "road", "rd", "ave", "avenue", "village", "district"}
+NAME_PREFIX_PATTERN = re.compile(r"^(my name is|name is|this is|i'?m|i am|name:)\s*", re.IGNORECASE)
+CONTACT_KEYWORD_PATTERN = re.compile(r"\b(hotline|customer (support|service|care)|contact|call us|trunk ?line|landline|mobile)\b", re.IGNORECASE)
+NOT_A_NAME = {"ok", "okay", "sure", "yes", "yep", "no", "thanks", "thank you", "sige", "wait"}
+
+# Reply templates, taken from the test-drive script and fallback message in prompt.md
+ASK_CAR = "Sure! Which car would you like to test drive?"
+ASK_LOCATION = "Awesome choice! Let’s schedule your {car} test drive. Where are you located?"
+ASK_DATE = "Great, the nearest dealer is located in {branch}. When would you like to do the test drive?"
+ASK_CONTACT = "Can I have your full name and mobile number please?"
+ASK_PHONE = "Thanks, {name}! Can I also have your mobile number please?"
+CONFIRMED = "Thank you. One of our agents will reach out to you for confirmation."
+REPRESENTATIVE = "Sure! You can reach our customer support team or message us directly here so one of our agents can assist you."
+# prompt.md: include any known hotline or branch contact from the dealership data
+REPRESENTATIVE_CONTACT = REPRESENTATIVE + "\n\n📞 {contact}"
+GREETING = "Hello! 👋 How can I help you today? I can help with Toyota models, prices, promos, financing, test drives and service bookings."
+
+# Fixed quick-action intents (app.QUICK_ACTIONS); the others need dealership data and go to the model
+QUICK_ACTION_INTENTS = {
+    "i want to book a test drive": "book_test_drive",
+    "i want to ask a representative": "representative",
+}
+
+_stats_lock = threading.Lock()
+router_stats = {"turns": 0, "handled": 0, "intents": Counter(), "decision_seconds": 0.0, "max_decision_seconds": 0.0}
+
+
+class TestDriveBooking:
+    """Slots collected by the test-drive script for one chat session; kept in Streamlit session state"""
+
+    STEPS = ("car", "location", "date", "contact")
+
+    def __init__(self):
+        self.slots = {"car": None, "location": None, "branch": None, "date": None, "name": None, "contact": None}
+        self.active = False
+        self.confirmed = False
+
+    def start(self):
+        self.__init__()
+        self.active = True
+
+    @property
+    def step(self):
+        """The slot the script is waiting for, or None once the booking is complete"""
+        if not self.active:
+            return None
+        for step in self.STEPS:
+            if not self.slots[step]:
+                return step
+        return None
+
+    def as_dict(self):
+        return {"active": self.active, "confirmed": self.confirmed, "step": self.step, **self.slots}
+
+
+def find_model(message):
+    match = MODEL_PATTERN.search(message)
+    if match is None:
+        return None
+    return next(model for model in TOYOTA_MODELS if model.lower() == match.group(1).lower())
+
+
+def find_branch(location, text):
+    """The branch or address line in dealership data sharing the most whole words with a customer's location, or None"""
+    words = {
+        word for word in normalize_question(location).split()
+        if len(word) > 2 and word not in STOPWORDS and word not in GENERIC_PLACE_WORDS
+    }
+    best, best_score = None, 0
+    for line in (text or "").splitlines():
+        if not BRANCH_LINE_PATTERN.search(line):
+            continue
+        score = len(words & set(normalize_question(line).split()))
+        if score > best_score:
+            best, best_score = line.strip(" -•*"), score
+    return best
+
+
+def find_contact(text):
+    """The dealership-data line labelled as a hotline or contact that carries a phone number, or None"""
+    for line in (text or "").splitlines():
+        if CONTACT_KEYWORD_PATTERN.search(line) and PHONE_PATTERN.search(line):
+            return line.strip(" -•*")
+    return None
+
+
+def find_location(message):
+    """The location in a reply to ASK_LOCATION ("I'm in Makati", "Cebu"), or None when it doesn't read like one"""
+    text = message.strip().strip(" .!")
+    location = LOCATION_PREFIX_PATTERN.sub("", text)
+    if not location or len(location.split()) > 6:
+        return None
+    if location == text and not PLACE_PATTERN.search(text):
+        return None
+    return location
+
+
+def _split_contact(message):
+    phone = PHONE_PATTERN.search(message)
+    rest = PHONE_PATTERN.sub(" ", message) if phone else message
+    rest = re.sub(r"\b(and|my|number|mobile|contact|is|no\.?|cp|phone)\b|[,:;.]", " ", NAME_PREFIX_PATTERN.sub("", rest.strip()), flags=re.IGNORECASE)
+    name = " ".join(rest.split())
+    if name.lower() in NOT_A_NAME or len(name.split()) > 5 or any(char.isdigit() for char in name):
+        name = None
+    return name or None, phone.group(0) if phone else None
+
+
+def _is_open_ended(message):
+    return bool(QUESTION_PATTERN.search(message.strip()))
+
+
+def classify(message, booking):
+    """Local intent for one turn: a scripted intent name, or None when the model should answer"""
+    normalized = normalize_question(message)
+    if normalized in QUICK_ACTION_INTENTS:
+        return QUICK_ACTION_INTENTS[normalized]
+    if FILIPINO_PATTERN.search(message):
+        return None
+    # "Can I book a test drive?" is a booking request; "How long is a test drive?" is a question
+    if TEST_DRIVE_PATTERN.search(message) and BOOKING_VERB_PATTERN.search(message) and not WH_PATTERN.search(message):
+        return "book_test_drive"
+    if booking.step and not _is_open_ended(message):
+        return f"test_drive.{booking.step}"
+    if GREETING_PATTERN.match(message.strip()):
+        return "greeting"
+    return None
+
+
+def respond(intent, message, booking, branch_lookup):
+    """Template reply for a scripted intent, updating the booking slots; None hands the turn to the model"""
+    if intent == "greeting":
+        return GREETING
+    if intent == "representative":
+        contact = find_contact(branch_lookup("hotline contact number") if branch_lookup else "")
+        return REPRESENTATIVE_CONTACT.format(contact=contact) if contact else REPRESENTATIVE
+    if intent == "book_test_drive":
+        booking.start()
+        booking.slots["car"] = find_model(message)
+        if not booking.slots["car"]:
+            return ASK_CAR
+        return ASK_LOCATION.format(car=booking.slots["car"])
+
+    step = booking.step
+    if step == "car":
+        booking.slots["car"] = find_model(message)
+        return ASK_LOCATION.format(car=booking.slots["car"]) if booking.slots["car"] else None
+    if step == "location":
+        location = find_location(message)
+        if location is None:
+            return None
+        branch = find_branch(location, branch_lookup(location) if branch_lookup else "")
+        if branch is None:
+            # The nearest-branch answer has to come from dealership data; let the model say what it knows
+            return None
+        booking.slots["location"], booking.slots["branch"] = location, branch
+        return ASK_DATE.format(branch=branch)
+    if step == "date":
+        if not DATE_PATTERN.search(message):
+            return None
+        booking.slots["date"] = message.strip(" .!")
+        return ASK_CONTACT
+    if step == "contact":
+        name, phone = _split_contact(message)
+        booking.slots["name"] = booking.slots["name"] or name
+        if phone is None:
+            return ASK_PHONE.format(name=booking.slots["name"]) if booking.slots["name"] else None
+        booking.slots["contact"] = phone
+        if not booking.slots["name"]:
+            return None
+        booking.confirmed = True
+        booking.active = False
+        return CONFIRMED
+    return None
+
+
+def route(message, booking, branch_lookup=None):
+    """Answer a scripted turn locally; returns (intent, reply), with reply None when the model should answer.
+
+    `booking` is the session's TestDriveBooking; `branch_lookup(query)` returns dealership data (never the
+    customer's own uploads' analysis) to find the nearest branch or the hotline in. Every call is counted in router_stats.
+    """
+    start = time.perf_counter()
+    intent = classify(message, booking) if INTENT_ROUTER else None
+    reply = respond(intent, message, booking, branch_lookup) if intent else None
+    seconds = time.perf_counter() - start
+    with _stats_lock:
+        router_stats["turns"] += 1
+        router_stats["handled"] += reply is not None
+        router_stats["intents"][intent if reply is not None else "llm"] += 1
+        router_stats["decision_seconds"] += seconds
+        router_stats["max_decision_seconds"] = max(router_stats["max_decision_seconds"], seconds)
+    return intent, reply
+
+
+def intent_router_stats():
+    """Turns answered locally vs by the model, and how long the routing decision takes"""
+    with _stats_lock:
+        stats = dict(router_stats, intents=dict(router_stats["intents"]))
+    turns = stats["turns"] or 1
+    stats["llm_skip_rate"] = round(stats["handled"] / turns, 3)
+    stats["avg_decision_us"] = round(stats.pop("decision_seconds") / turns * 1e6, 1)
+    stats["max_decision_us"] = round(stats.pop("max_decision_seconds") * 1e6, 1)
+    return stats
+
+
+def reset_stats():
+    with _stats_lock:
+        router_stats.update(turns=0, handled=0, intents=Counter(), decision_seconds=0.0, max_decision_seconds=0.0)
@@ -0,0 +1,197 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from async_runtime import run_async
+from cache import content_hash, file_bytes
+from extraction import STRUCTURED_EXTRACTION, aextract_image_records, analyze_pdf_structured, to_context
+from functionalities import (
+    PDF_ANALYSIS_ERROR,
+    UNSUPPORTED_FILE_TYPE,
+    adescribe_image,
+    analyze_pdf_with_ai,
+    stream_uploaded_file,
+)
+from knowledge import ingest_file, knowledge_store
+
+# Worker threads shared by every session, and how many finished jobs stay reattachable
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "200"))
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="analysis-job")
+_lock = threading.Lock()
+_jobs = OrderedDict()
+_jobs_by_content = {}
+
+
+class UploadSnapshot(BytesIO):
+    """In-memory copy of an upload so a worker can keep reading after the Streamlit run that received it ends"""
+
+    def __init__(self, file):
+        super().__init__(file_bytes(file))
+        self.name = getattr(file, "name", "upload")
+        self.type = getattr(file, "type", None)
+
+
+class Job:
+    """Background analysis of one upload. Progress and partial results are readable while it runs."""
+
+    def __init__(self, kind, name):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.name = name
+        self.status = "queued"
+        self.done_steps = 0
+        self.total_steps = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._partials = {}
+        self._lock = threading.Lock()
+
+    def add_partial(self, step, text, total_steps=None):
+        with self._lock:
+            self._partials[step] = text
+            self.done_steps = len(self._partials)
+            if total_steps is not None:
+                self.total_steps = total_steps
+
+    def partial_result(self):
+        """Everything produced so far, in step order"""
+        with self._lock:
+            return "".join(self._partials[step] for step in sorted(self._partials))
+
+    @property
+    def finished(self):
+        return self.status in ("done", "error")
+
+    def progress(self):
+        if self.finished:
+            return 1.0
+        if not self.total_steps:
+            return 0.0
+        return min(1.0, self.done_steps / self.total_steps)
+
+
+def _remember(job, content_key):
+    with _lock:
+        _jobs[job.id] = job
+        _jobs_by_content[content_key] = job
+        while len(_jobs) > JOB_HISTORY:
+            oldest_id, oldest = next(iter(_jobs.items()))
+            if not oldest.finished:
+                break
+            del _jobs[oldest_id]
+            for key in [key for key, value in _jobs_by_content.items() if value is oldest]:
+                del _jobs_by_content[key]
+
+
+class JobFailed(Exception):
+    """Raised by job work with the message to show as the job's error"""
+
+
+def _run(job, work):
+    job.status = "running"
+    try:
+        job.result = work(job)
+        job.status = "done"
+    except JobFailed as e:
+        job.error = str(e)
+        job.status = "error"
+    except Exception as e:
+        job.error = f"Error: {e}"
+        job.status = "error"
+    job.finished_at = time.time()
+
+
+def submit(kind, file, work, reuse_finished=True):
+    """Queue work(job, upload) for a file, reusing the existing job when the same content is already queued or done.
+
+    Jobs are keyed by kind + content hash and kept process-wide, so a browser refresh or a second
+    session uploading the same file attaches to the running job instead of starting over. With
+    `reuse_finished=False` only a job still in progress is reused.
+    """
+    upload = UploadSnapshot(file)
+    content_key = content_hash(kind, upload.getvalue())
+    with _lock:
+        existing = _jobs_by_content.get(content_key)
+    if existing is not None and existing.status != "error" and (reuse_finished or not existing.finished):
+        return existing
+
+    job = Job(kind, upload.name)
+    _remember(job, content_key)
+    _executor.submit(_run, job, lambda job: work(job, upload))
+    return job
+
+
+def extract_document(job, upload):
+    """Document text extraction; each extracted chunk is visible to the chat as soon as it exists"""
+    for step, chunk in enumerate(stream_uploaded_file(upload)):
+        # Document text is the customer's content, so it may start with anything; only this sentinel is a failure
+        if step == 0 and chunk == UNSUPPORTED_FILE_TYPE:
+            raise JobFailed(chunk)
+        job.add_partial(step, chunk)
+    return job.partial_result()
+
+
+def analyze_image(job, upload):
+    job.total_steps = 1
+    # Vision calls go through the shared loop and global limiter like any other model call
+    if STRUCTURED_EXTRACTION:
+        return to_context(run_async(aextract_image_records(upload)))
+    return run_async(adescribe_image(upload))
+
+
+def analyze_pdf_pages(job, upload):
+    """Page-by-page PDF vision analysis, reporting progress as each page comes back"""
+    heading = "RECORDS" if STRUCTURED_EXTRACTION else "VISUAL ANALYSIS"
+
+    def on_page(page_number, page_count, analysis):
+        job.add_partial(page_number, f"\n--- PAGE {page_number} {heading} ---\n{analysis}\n", page_count)
+
+    if STRUCTURED_EXTRACTION:
+        result = analyze_pdf_structured(upload, on_page=on_page)
+    else:
+        result = analyze_pdf_with_ai(upload, on_page=on_page)
+    # A successful result starts with the text-extraction heading; only a whole-document failure starts like this
+    if result.startswith(PDF_ANALYSIS_ERROR):
+        raise JobFailed(result)
+    return result
+
+
+def ingest_knowledge(job, upload):
+    """Add an upload to the shared knowledge base; returns "added", "updated" or "unchanged" """
+    job.total_steps = 1
+    return ingest_file(knowledge_store, upload)
+
+
+JOB_KINDS = {
+    "document": extract_document,
+    "image": analyze_image,
+    "pdf_vision": analyze_pdf_pages,
+    "knowledge": ingest_knowledge,
+}
+
+
+def submit_analysis(kind, file):
+    # Knowledge-base ingestion checks the store itself, so a removed source can be uploaded again
+    return submit(kind, file, JOB_KINDS[kind], reuse_finished=kind != "knowledge")
+
+
+def get(job_id):
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def stats():
+    with _lock:
+        jobs = list(_jobs.values())
+    counts = {}
+    for job in jobs:
+        counts[job.status] = counts.get(job.status, 0) + 1
+    return {"workers": JOB_WORKERS, "jobs": len(jobs), **counts}
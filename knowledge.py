@@ -0,0 +1,233 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+from cache import content_hash, file_bytes
+from extraction import STRUCTURED_EXTRACTION, extract_image_records, to_context
+from functionalities import UNSUPPORTED_FILE_TYPE, describe_image, read_uploaded_file
+from retrieval import RETRIEVAL_MIN_TOKENS, RETRIEVAL_TOP_K, BM25Index, chunk_text, tokenize
+from tokens import count_tokens
+
+# Where the shared dealership knowledge base lives; every session and the ingest CLI read the same store
+KNOWLEDGE_DIR = os.getenv("KNOWLEDGE_DIR", "./knowledge_store")
+
+IMAGE_TYPES = {"image/png", "image/jpeg", "image/jpg"}
+
+
+def _write_json(path, value):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(value, f)
+    os.replace(tmp_path, path)
+
+
+class KnowledgeStore:
+    """Persistent multi-document store with a BM25 index over every chunk.
+
+    Layout under `directory`:
+      manifest.json           source name -> {hash, text_hash, kind, chunks, tokens, updated_at}
+      docs/ab/<text_hash>.json  chunks plus their term frequencies for one extracted text
+
+    Sources are keyed by name (e.g. file name) and carry the hash of their raw bytes, so re-ingesting an
+    unchanged file is a no-op and a changed file only re-chunks that one file. Identical text under two
+    names is stored once. Nothing is read from disk until the first search, and the index is rebuilt from
+    stored term frequencies (no re-tokenizing) whenever the manifest changes, including from another process.
+    """
+
+    def __init__(self, directory=KNOWLEDGE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._manifest_mtime = None
+        self._docs = {}
+        self._index = None
+        self._index_sources = []
+        self.searches = 0
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, "manifest.json")
+
+    def _doc_path(self, text_hash):
+        return os.path.join(self.directory, "docs", text_hash[:2], f"{text_hash}.json")
+
+    def _mtime(self):
+        try:
+            return os.stat(self.manifest_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load_manifest(self):
+        """Reload the manifest when it is missing from memory or was rewritten on disk; call with the lock held"""
+        mtime = self._mtime()
+        if self._manifest is not None and mtime == self._manifest_mtime:
+            return
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self._manifest = json.load(f)
+        except (OSError, ValueError):
+            self._manifest = {}
+        self._manifest_mtime = mtime
+        self._index = None
+
+    def _save_manifest(self):
+        _write_json(self.manifest_path, self._manifest)
+        self._manifest_mtime = self._mtime()
+        self._index = None
+
+    def _load_doc(self, text_hash):
+        doc = self._docs.get(text_hash)
+        if doc is None:
+            with open(self._doc_path(text_hash), "r", encoding="utf-8") as f:
+                doc = json.load(f)
+            self._docs[text_hash] = doc
+        return doc
+
+    def is_current(self, name, source_hash):
+        """True when `name` is already stored from exactly these bytes, so extraction can be skipped"""
+        with self._lock:
+            self._load_manifest()
+            entry = self._manifest.get(name)
+            return entry is not None and entry["hash"] == source_hash
+
+    def add(self, name, text, source_hash=None, kind="document"):
+        """Store extracted text under name; returns "added", "updated" or "unchanged" """
+        source_hash = source_hash or content_hash(text)
+        text_hash = content_hash(text)
+        with self._lock:
+            self._load_manifest()
+            entry = self._manifest.get(name)
+            if entry is not None and entry["hash"] == source_hash and entry["text_hash"] == text_hash:
+                return "unchanged"
+
+            path = self._doc_path(text_hash)
+            if text_hash in self._docs or os.path.exists(path):
+                chunk_count = len(self._load_doc(text_hash)["chunks"])
+            else:
+                chunks = chunk_text(text)
+                doc = {"chunks": chunks, "term_freqs": [Counter(tokenize(chunk)) for chunk in chunks]}
+                _write_json(path, doc)
+                self._docs[text_hash] = doc
+                chunk_count = len(chunks)
+
+            self._manifest[name] = {
+                "hash": source_hash,
+                "text_hash": text_hash,
+                "kind": kind,
+                "chunks": chunk_count,
+                "tokens": count_tokens(text),
+                "updated_at": time.time(),
+            }
+            self._save_manifest()
+            self._collect_garbage(entry)
+            return "added" if entry is None else "updated"
+
+    def remove(self, name):
+        with self._lock:
+            self._load_manifest()
+            entry = self._manifest.pop(name, None)
+            if entry is None:
+                return False
+            self._save_manifest()
+            self._collect_garbage(entry)
+            return True
+
+    def _collect_garbage(self, old_entry):
+        """Delete a replaced source's chunk file unless another name still shares that text"""
+        if old_entry is None:
+            return
+        text_hash = old_entry["text_hash"]
+        if any(entry["text_hash"] == text_hash for entry in self._manifest.values()):
+            return
+        self._docs.pop(text_hash, None)
+        try:
+            os.remove(self._doc_path(text_hash))
+        except OSError:
+            pass
+
+    def _get_index(self):
+        """Return (index, source name per chunk), rebuilding from stored term frequencies when stale"""
+        self._load_manifest()
+        if self._index is None:
+            chunks, term_freqs, sources = [], [], []
+            seen = set()
+            for name, entry in sorted(self._manifest.items()):
+                if entry["text_hash"] in seen:
+                    continue
+                seen.add(entry["text_hash"])
+                doc = self._load_doc(entry["text_hash"])
+                chunks += doc["chunks"]
+                term_freqs += doc["term_freqs"]
+                sources += [name] * len(doc["chunks"])
+            self._index = BM25Index(chunks, term_freqs=term_freqs)
+            self._index_sources = sources
+        return self._index, self._index_sources
+
+    def search(self, question, k=RETRIEVAL_TOP_K):
+        """Return the top-k (source name, chunk) pairs for question, best first"""
+        with self._lock:
+            index, sources = self._get_index()
+            self.searches += 1
+            return [(sources[position], index.chunks[position]) for position, _ in index.search(question, k)]
+
+    def retrieve_context(self, question, k=RETRIEVAL_TOP_K):
+        """Knowledge-base text for the prompt, each chunk labelled with its source; small stores are passed whole"""
+        with self._lock:
+            self._load_manifest()
+            if not self._manifest:
+                return ""
+            total_tokens = sum(entry["tokens"] for entry in self._manifest.values())
+            if total_tokens <= RETRIEVAL_MIN_TOKENS:
+                index, sources = self._get_index()
+                hits = list(zip(sources, index.chunks))
+            else:
+                hits = None
+        if hits is None:
+            hits = self.search(question, k)
+        return "\n...\n".join(f"[{name}]\n{chunk}" for name, chunk in hits)
+
+    def sources(self):
+        with self._lock:
+            self._load_manifest()
+            return [{"name": name, **entry} for name, entry in sorted(self._manifest.items())]
+
+    def fingerprint(self):
+        """Changes whenever any source is added, updated or removed; scopes cached replies to this data"""
+        with self._lock:
+            self._load_manifest()
+            return content_hash(*(f"{name}:{entry['hash']}" for name, entry in sorted(self._manifest.items())))
+
+    def stats(self):
+        with self._lock:
+            self._load_manifest()
+            return {
+                "sources": len(self._manifest),
+                "unique_texts": len({entry["text_hash"] for entry in self._manifest.values()}),
+                "chunks": sum(entry["chunks"] for entry in self._manifest.values()),
+                "tokens": sum(entry["tokens"] for entry in self._manifest.values()),
+                "loaded": self._index is not None,
+                "searches": self.searches,
+            }
+
+
+def ingest_file(store, file, name=None):
+    """Extract a document or analyze an image and store the result; unchanged files skip extraction entirely"""
+    name = name or file.name
+    source_hash = content_hash(file_bytes(file))
+    if store.is_current(name, source_hash):
+        return "unchanged"
+    if file.type in IMAGE_TYPES:
+        # Same switch as chat uploads, so the knowledge base holds the same kind of text the chat gets
+        text = to_context(extract_image_records(file)) if STRUCTURED_EXTRACTION else describe_image(file)
+        kind = "image"
+    else:
+        text, kind = read_uploaded_file(file), "document"
+        if text == UNSUPPORTED_FILE_TYPE:
+            raise ValueError(text)
+    return store.add(name, text, source_hash=source_hash, kind=kind)
+
+
+knowledge_store = KnowledgeStore()
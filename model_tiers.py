@@ -0,0 +1,118 @@
+import os
+import re
+import threading
+from collections import Counter
+
+import tracing
+from intent_router import MODEL_PATTERN
+from tokens import count_tokens
+
+# Chat turns go to the small tier unless they look complex; answers the small tier can't give are retried on the large one.
+# Set MODEL_ROUTING=0 to send every chat turn to the large tier as before.
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "1").lower() not in ("0", "false", "no")
+SMALL_MODEL = os.getenv("SMALL_MODEL", "gpt-4o-mini")
+LARGE_MODEL = os.getenv("LARGE_MODEL", "gpt-4o")
+# Turns above these sizes (question words, dealership-data tokens) go straight to the large tier
+TIER_SMALL_MAX_WORDS = int(os.getenv("TIER_SMALL_MAX_WORDS", "40"))
+TIER_SMALL_MAX_CONTEXT_TOKENS = int(os.getenv("TIER_SMALL_MAX_CONTEXT_TOKENS", "6000"))
+# Streamed small-tier replies are held back until this many characters show they aren't a fallback or refusal
+ESCALATION_PROBE_CHARS = int(os.getenv("ESCALATION_PROBE_CHARS", "40"))
+
+TIERS = {"small": SMALL_MODEL, "large": LARGE_MODEL}
+
+# USD per 1M tokens: (input, cached input, output)
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+}
+
+COMPLEX_PATTERN = re.compile(
+    r"\b(compare|comparison|versus|vs\.?|difference|differences|better|recommend|which (one|is|should)|pros and cons"
+    r"|explain why|trade[- ]?in|computation|compute|calculate|breakdown)\b",
+    re.IGNORECASE,
+)
+# The fallback message from prompt.md and typical refusals: the small tier's answer is retried on the large tier
+ESCALATION_PATTERN = re.compile(
+    r"^\s*(i'?m not sure about that|i'?m sorry,? (but )?i (can'?t|cannot|am unable|'m unable)|i (can'?t|cannot) (help|assist)"
+    r"|sorry,? i (don'?t|do not) (know|have))",
+    re.IGNORECASE,
+)
+
+_stats_lock = threading.Lock()
+tier_stats = {tier: {"calls": 0, "escalated": 0, "seconds": 0.0} for tier in TIERS}
+route_reasons = Counter()
+
+
+def choose_tier(question, documents=""):
+    """Pick the model tier for a chat turn; returns (tier, reason)"""
+    if not MODEL_ROUTING:
+        return "large", "routing_disabled"
+    if COMPLEX_PATTERN.search(question):
+        return "large", "complex_request"
+    if len({match.lower() for match in MODEL_PATTERN.findall(question)}) >= 2:
+        return "large", "several_models"
+    if len(question.split()) > TIER_SMALL_MAX_WORDS:
+        return "large", "long_question"
+    if count_tokens(documents) > TIER_SMALL_MAX_CONTEXT_TOKENS:
+        return "large", "large_context"
+    return "small", "simple_turn"
+
+
+def needs_escalation(answer):
+    """True for an empty or failed answer, the prompt's fallback message, or a refusal"""
+    return not answer.strip() or answer.startswith("Error") or bool(ESCALATION_PATTERN.search(answer))
+
+
+def might_escalate(prefix):
+    """While streaming: could a reply starting with prefix still turn out to need escalation?"""
+    return len(prefix) < ESCALATION_PROBE_CHARS or needs_escalation(prefix)
+
+
+def record(tier, seconds, escalated=False, reason=None):
+    with _stats_lock:
+        stats = tier_stats[tier]
+        stats["calls"] += 1
+        stats["escalated"] += escalated
+        stats["seconds"] += seconds
+        if reason:
+            route_reasons[reason] += 1
+
+
+def usage_cost(model, totals):
+    input_price, cached_price, output_price = MODEL_PRICES.get(model, MODEL_PRICES["gpt-4o"])
+    uncached = totals["prompt_tokens"] - totals["cached_tokens"]
+    return (uncached * input_price + totals["cached_tokens"] * cached_price + totals["completion_tokens"] * output_price) / 1e6
+
+
+def tier_summary():
+    """Per-tier calls, escalations, latency, tokens and cost of the chat turns in this process"""
+    usage = {row["stage"]: row for row in tracing.usage_summary()}
+    with _stats_lock:
+        stats = {tier: dict(values) for tier, values in tier_stats.items()}
+        reasons = dict(route_reasons)
+    rows = []
+    for tier, model in TIERS.items():
+        totals = usage.get(f"ask_ai.{tier}", {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0})
+        calls = stats[tier]["calls"]
+        rows.append({
+            "tier": tier,
+            "model": model,
+            "calls": calls,
+            "escalated": stats[tier]["escalated"],
+            "avg_latency_s": round(stats[tier]["seconds"] / calls, 3) if calls else 0.0,
+            "prompt_tokens": totals["prompt_tokens"],
+            "cached_tokens": totals["cached_tokens"],
+            "completion_tokens": totals["completion_tokens"],
+            "usd": round(usage_cost(model, totals), 5),
+        })
+    return {"tiers": rows, "route_reasons": reasons}
+
+
+def reset_stats():
+    with _stats_lock:
+        for stats in tier_stats.values():
+            stats.update(calls=0, escalated=0, seconds=0.0)
+        route_reasons.clear()
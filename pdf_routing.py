@@ -0,0 +1,147 @@
+import os
+import re
+import threading
+from collections import Counter
+
+from imaging import IMAGE_MAX_DIMENSION, PDF_RASTER_DPI, estimate_vision_tokens
+
+# Per-page vision routing: pages whose text layer is complete are answered from PyPDF2 text and never rasterized.
+# Set VISION_ROUTING=0 to send every page (up to PDF_VISION_MAX_PAGES) to the vision model as before.
+VISION_ROUTING = os.getenv("VISION_ROUTING", "1").lower() not in ("0", "false", "no")
+VISION_MIN_PAGE_CHARS = int(os.getenv("VISION_MIN_PAGE_CHARS", "100"))
+VISION_IMAGE_COVERAGE = float(os.getenv("VISION_IMAGE_COVERAGE", "0.3"))
+# gpt-4o input price, used only to report the estimated saving
+VISION_INPUT_USD_PER_1M = float(os.getenv("VISION_INPUT_USD_PER_1M", "2.50"))
+
+# Handwriting and signatures added in a PDF viewer live in annotations, not in the text layer
+HANDWRITING_ANNOTATIONS = {"/Ink", "/Stamp"}
+
+NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)"
+CONTENT_OPERATOR_PATTERN = re.compile(
+    rf"({NUMBER})\s+({NUMBER})\s+({NUMBER})\s+({NUMBER})\s+{NUMBER}\s+{NUMBER}\s+cm|/([^\s/\[\]()<>{{}}]+)\s+Do"
+)
+
+_stats_lock = threading.Lock()
+routing_stats = {
+    "pdfs": 0,
+    "pages": 0,
+    "vision_pages": 0,
+    "text_pages": 0,
+    "reasons": Counter(),
+    "estimated_tokens_saved": 0,
+}
+
+
+def _resolve(value):
+    return value.get_object() if hasattr(value, "get_object") else value
+
+
+def _image_xobjects(resources, depth=0):
+    """Names of XObjects in resources that are images, or forms that contain images"""
+    xobjects = _resolve((resources or {}).get("/XObject")) or {}
+    names = set()
+    for name, ref in xobjects.items():
+        xobject = _resolve(ref)
+        subtype = xobject.get("/Subtype")
+        if subtype == "/Image":
+            names.add(name.lstrip("/"))
+        elif subtype == "/Form" and depth < 2 and _image_xobjects(_resolve(xobject.get("/Resources")), depth + 1):
+            names.add(name.lstrip("/"))
+    return names
+
+
+def image_coverage(page):
+    """Fraction of the page area covered by placed images.
+
+    Scans the content stream for `a b c d e f cm /Name Do`: the most recent `cm` before drawing an image gives
+    its placed size (|ad - bc|). Nested transforms are ignored; an image drawn without any `cm` counts as
+    covering the whole page, so the estimate errs towards sending the page to vision.
+    """
+    names = _image_xobjects(_resolve(page.get("/Resources")))
+    if not names:
+        return 0.0
+    page_area = float(page.mediabox.width) * float(page.mediabox.height) or 1.0
+    contents = page.get_contents()
+    if contents is None:
+        return 0.0
+    data = contents.get_data().decode("latin-1")
+    covered = 0.0
+    matrix_area = None
+    for match in CONTENT_OPERATOR_PATTERN.finditer(data):
+        if match.group(5) is None:
+            a, b, c, d = (float(value) for value in match.group(1, 2, 3, 4))
+            matrix_area = abs(a * d - b * c)
+        elif match.group(5) in names:
+            covered += page_area if matrix_area is None else matrix_area
+    return min(1.0, covered / page_area)
+
+
+def has_handwriting_annotations(page):
+    for annotation in _resolve(page.get("/Annots")) or []:
+        if _resolve(annotation).get("/Subtype") in HANDWRITING_ANNOTATIONS:
+            return True
+    return False
+
+
+def estimated_page_tokens(page):
+    """Vision input tokens the page would cost once rasterized at PDF_RASTER_DPI and downscaled"""
+    width = float(page.mediabox.width) / 72 * PDF_RASTER_DPI
+    height = float(page.mediabox.height) / 72 * PDF_RASTER_DPI
+    scale = min(1.0, IMAGE_MAX_DIMENSION / max(width, height, 1))
+    return estimate_vision_tokens(max(1, width * scale), max(1, height * scale))
+
+
+def route_page(page, text):
+    """Decide whether one page needs the vision model; returns (route, reason)"""
+    chars = len(text.strip())
+    if chars == 0:
+        return "vision", "no_text_layer"
+    if has_handwriting_annotations(page):
+        return "vision", "handwriting_annotations"
+    if image_coverage(page) >= VISION_IMAGE_COVERAGE:
+        return "vision", "image_coverage"
+    if chars < VISION_MIN_PAGE_CHARS:
+        return "vision", "sparse_text"
+    return "text", "text_layer_complete"
+
+
+def route_pdf_pages(reader, page_texts, max_pages=0):
+    """Route every page of a PDF and return (page numbers to send to vision, per-page decisions).
+
+    `page_texts` are the PyPDF2 extractions already made for the text section, so nothing is parsed twice.
+    At most `max_pages` vision pages are returned (0 = no limit), in page order.
+    """
+    decisions = []
+    for page_number, (page, text) in enumerate(zip(reader.pages, page_texts), start=1):
+        if VISION_ROUTING:
+            try:
+                route, reason = route_page(page, text)
+            except Exception:
+                # Unusual page structure - fall back to the safe choice
+                route, reason = "vision", "unreadable_structure"
+        else:
+            route, reason = "vision", "routing_disabled"
+        decisions.append({"page": page_number, "route": route, "reason": reason, "chars": len(text.strip())})
+
+    vision_pages = [decision["page"] for decision in decisions if decision["route"] == "vision"]
+    if max_pages:
+        vision_pages = vision_pages[:max_pages]
+
+    text_pages = [decision for decision in decisions if decision["route"] == "text"]
+    tokens_saved = sum(estimated_page_tokens(reader.pages[decision["page"] - 1]) for decision in text_pages)
+    with _stats_lock:
+        routing_stats["pdfs"] += 1
+        routing_stats["pages"] += len(decisions)
+        routing_stats["vision_pages"] += len(vision_pages)
+        routing_stats["text_pages"] += len(text_pages)
+        routing_stats["reasons"].update(decision["reason"] for decision in decisions)
+        routing_stats["estimated_tokens_saved"] += tokens_saved
+    return vision_pages, decisions
+
+
+def vision_routing_stats():
+    """Routing totals for this process, including the estimated vision spend avoided"""
+    with _stats_lock:
+        stats = dict(routing_stats, reasons=dict(routing_stats["reasons"]))
+    stats["estimated_usd_saved"] = round(stats["estimated_tokens_saved"] * VISION_INPUT_USD_PER_1M / 1e6, 4)
+    return stats
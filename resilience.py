@@ -0,0 +1,429 @@
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import httpx
+import openai
+
+# Every model call gets an overall deadline; each HTTP attempt inside it is bounded by LLM_ATTEMPT_TIMEOUT_S
+LLM_DEADLINE_S = float(os.getenv("LLM_DEADLINE_S", "60"))
+LLM_ATTEMPT_TIMEOUT_S = float(os.getenv("LLM_ATTEMPT_TIMEOUT_S", "30"))
+# Retries of transient failures (429, 5xx, timeouts, dropped connections) with full-jitter exponential backoff
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_RETRY_BASE_S = float(os.getenv("LLM_RETRY_BASE_S", "0.5"))
+LLM_RETRY_MAX_S = float(os.getenv("LLM_RETRY_MAX_S", "8"))
+# Send a duplicate request when the first hasn't answered after this many seconds (0 = no hedging)
+LLM_HEDGE_AFTER_S = float(os.getenv("LLM_HEDGE_AFTER_S", "0"))
+# Account-level OpenAI budgets shared by every session in the process (0 = unlimited)
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "0"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "0"))
+# OpenAI enforces per-minute limits over shorter windows, so only this many seconds' worth may go out in a burst
+OPENAI_BURST_S = float(os.getenv("OPENAI_BURST_S", "10"))
+# Completion tokens reserved per call on top of the prompt estimate, and the typical cost of one image part
+LLM_RESERVED_OUTPUT_TOKENS = int(os.getenv("LLM_RESERVED_OUTPUT_TOKENS", "500"))
+IMAGE_PART_TOKENS = 765
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    httpx.TimeoutException,
+    httpx.TransportError,
+    TimeoutError,
+)
+
+# Threads for hedged attempts; when all are busy (e.g. with attempts abandoned during a provider slowdown),
+# calls run inline without hedging instead of queueing behind them
+LLM_CALL_WORKERS = int(os.getenv("LLM_CALL_WORKERS", "32"))
+
+_executor = ThreadPoolExecutor(max_workers=LLM_CALL_WORKERS, thread_name_prefix="llm-call")
+_busy_workers = 0
+# time.monotonic() deadline of the model call running in this context; clamp_request_timeout reads it
+_call_deadline = contextvars.ContextVar("llm_call_deadline", default=None)
+_stats_lock = threading.Lock()
+call_stats = {
+    "calls": 0,
+    "attempts": 0,
+    "retries": 0,
+    "hedges": 0,
+    "hedge_wins": 0,
+    "abandoned": 0,
+    "rate_limited": 0,
+    "deadline_exceeded": 0,
+    "failed": 0,
+    "throttle_wait_s": 0.0,
+}
+
+
+class DeadlineExceeded(TimeoutError):
+    """The call had no successful answer before its deadline"""
+
+
+def _count(**increments):
+    with _stats_lock:
+        for name, amount in increments.items():
+            call_stats[name] += amount
+
+
+class TokenBucket:
+    """One per-minute budget, refilled continuously. Reservations may overdraw; the caller waits off the debt."""
+
+    def __init__(self, per_minute, burst_s=OPENAI_BURST_S):
+        self.per_minute = per_minute
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_s)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_for(self, amount, now):
+        """Seconds until amount would be available, without taking it"""
+        if not self.per_minute:
+            return 0.0
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount):
+        if self.per_minute:
+            self.level -= min(amount, self.capacity)
+
+
+class RateScheduler:
+    """Requests-per-minute and tokens-per-minute budgets shared by every caller, sync or async.
+
+    Callers reserve capacity in arrival order and sleep until it is theirs, so sessions queue fairly
+    instead of all hitting 429s at once. A 429 with Retry-After pauses every caller for that long.
+    """
+
+    def __init__(self, rpm=OPENAI_RPM, tpm=OPENAI_TPM):
+        self._lock = threading.Lock()
+        self.configure(rpm, tpm)
+
+    def configure(self, rpm, tpm):
+        with self._lock:
+            self.requests = TokenBucket(rpm)
+            self.tokens = TokenBucket(tpm)
+            self.paused_until = 0.0
+
+    def reserve(self, tokens, max_wait=None):
+        """Claim one request and tokens; returns the seconds to wait first, or None if that exceeds max_wait"""
+        now = time.monotonic()
+        with self._lock:
+            delay = max(self.requests.wait_for(1, now), self.tokens.wait_for(tokens, now), self.paused_until - now)
+            if max_wait is not None and delay > max_wait:
+                return None
+            self.requests.take(1)
+            self.tokens.take(tokens)
+        if delay > 0:
+            _count(throttle_wait_s=delay)
+        return delay
+
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def acquire(self, tokens, deadline=None):
+        """Wait for capacity; raises DeadlineExceeded instead of sleeping past a time.monotonic() deadline"""
+        delay = self.reserve(tokens, None if deadline is None else deadline - time.monotonic())
+        if delay is None:
+            raise DeadlineExceeded("Rate budget has no room before the deadline")
+        if delay > 0:
+            time.sleep(delay)
+
+    async def aacquire(self, tokens, deadline=None):
+        delay = self.reserve(tokens, None if deadline is None else deadline - time.monotonic())
+        if delay is None:
+            raise DeadlineExceeded("Rate budget has no room before the deadline")
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rpm": self.requests.per_minute,
+                "tpm": self.tokens.per_minute,
+                "paused_s": round(max(0.0, self.paused_until - time.monotonic()), 2),
+            }
+
+
+scheduler = RateScheduler()
+
+
+def estimate_tokens(payload):
+    """Rough prompt size of chain inputs or messages (~4 characters per token) plus the reserved output"""
+    if isinstance(payload, dict):
+        chars = sum(len(str(value)) for value in payload.values())
+    elif isinstance(payload, (list, tuple)):
+        chars = images = 0
+        for message in payload:
+            for part in message.content if isinstance(message.content, list) else [message.content]:
+                # Image parts are billed by size, not by the length of their base64 text
+                if isinstance(part, dict) and part.get("type") == "image_url":
+                    images += 1
+                else:
+                    chars += len(part.get("text", "") if isinstance(part, dict) else str(part))
+        return chars // 4 + images * IMAGE_PART_TOKENS + LLM_RESERVED_OUTPUT_TOKENS
+    else:
+        chars = len(str(payload))
+    return chars // 4 + LLM_RESERVED_OUTPUT_TOKENS
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait, if it said"""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def backoff(attempt, error):
+    if isinstance(error, openai.RateLimitError):
+        _count(rate_limited=1)
+        server_delay = retry_after(error)
+        if server_delay is not None:
+            scheduler.pause(server_delay)
+            return server_delay
+    return random.uniform(0, min(LLM_RETRY_MAX_S, LLM_RETRY_BASE_S * 2 ** attempt))
+
+
+def remaining_s():
+    """Seconds left before the deadline of the model call running in this context; None outside one"""
+    deadline = _call_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def clamp_request_timeout(request):
+    """httpx request hook: an attempt made inside call() or acall() never waits past the call's deadline"""
+    remaining = remaining_s()
+    if remaining is None:
+        return
+    remaining = max(0.001, remaining)
+    timeouts = request.extensions.get("timeout", {})
+    request.extensions["timeout"] = {
+        name: remaining if value is None else min(value, remaining) for name, value in timeouts.items()
+    }
+
+
+async def aclamp_request_timeout(request):
+    clamp_request_timeout(request)
+
+
+def _submit(fn):
+    """Start fn on a pool thread if one is free right now; None when every worker is busy"""
+    global _busy_workers
+    with _stats_lock:
+        if _busy_workers >= LLM_CALL_WORKERS:
+            return None
+        _busy_workers += 1
+
+    def release(_):
+        global _busy_workers
+        with _stats_lock:
+            _busy_workers -= 1
+
+    # Copy the caller's context so tracing spans and the call deadline carry over to the pool thread
+    future = _executor.submit(contextvars.copy_context().run, fn)
+    future.add_done_callback(release)
+    return future
+
+
+def _deadline_error(deadline_s):
+    _count(deadline_exceeded=1, failed=1)
+    return DeadlineExceeded(f"No model response within {LLM_DEADLINE_S if deadline_s is None else deadline_s:g}s")
+
+
+def call(fn, tokens=0, deadline_s=None, retries=None, hedge_after_s=None):
+    """Run fn() (a blocking model call) under a deadline, with jittered retries and optional hedging.
+
+    Each attempt waits for rate-limit capacity first, then runs in the calling thread; HTTP requests it makes
+    through the shared clients time out at the deadline (see clamp_request_timeout). With hedging, the attempt
+    runs on a pool thread instead and a duplicate starts if it hasn't answered after `hedge_after_s`; whichever
+    succeeds first wins. Raises DeadlineExceeded, or the last error once retries are used up or the error
+    isn't transient.
+    """
+    deadline = time.monotonic() + (LLM_DEADLINE_S if deadline_s is None else deadline_s)
+    retries = LLM_RETRIES if retries is None else retries
+    hedge_after_s = LLM_HEDGE_AFTER_S if hedge_after_s is None else hedge_after_s
+    _count(calls=1)
+    deadline_token = _call_deadline.set(deadline)
+    try:
+        last_error = None
+        for attempt in range(retries + 1):
+            try:
+                scheduler.acquire(tokens, deadline)
+            except DeadlineExceeded:
+                _count(deadline_exceeded=1, failed=1)
+                raise
+            _count(attempts=1)
+            first = _submit(fn) if hedge_after_s else None
+            if first is None:
+                try:
+                    return fn()
+                except Exception as e:
+                    last_error = e
+                if isinstance(last_error, DeadlineExceeded) or (
+                    isinstance(last_error, RETRYABLE_ERRORS) and time.monotonic() >= deadline
+                ):
+                    raise _deadline_error(deadline_s) from last_error
+            else:
+                pending, hedged = {first}, None
+                while pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        # Pool threads can't be interrupted; their requests end at the deadline via the timeout clamp
+                        _count(abandoned=len(pending))
+                        raise _deadline_error(deadline_s) from last_error
+                    timeout = min(remaining, hedge_after_s) if hedged is None else remaining
+                    done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future.exception() is None:
+                            _count(abandoned=len(pending))
+                            if future is hedged:
+                                _count(hedge_wins=1)
+                            return future.result()
+                        last_error = future.exception()
+                    if not done and hedged is None:
+                        # A duplicate is only worth sending if a worker is free and the rate budget has room right now
+                        hedged = False
+                        if scheduler.reserve(tokens, max_wait=0) is not None:
+                            hedged = _submit(fn) or False
+                        if hedged:
+                            _count(hedges=1, attempts=1)
+                            pending.add(hedged)
+            if not isinstance(last_error, RETRYABLE_ERRORS) or attempt == retries:
+                break
+            delay = backoff(attempt, last_error)
+            if time.monotonic() + delay >= deadline:
+                break
+            _count(retries=1)
+            time.sleep(delay)
+        _count(failed=1)
+        raise last_error
+    finally:
+        _call_deadline.reset(deadline_token)
+
+
+async def acall(make_coro, tokens=0, deadline_s=None, retries=None, hedge_after_s=None):
+    """Async call(): make_coro() creates one attempt; losing hedges and timed-out attempts are cancelled"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + (LLM_DEADLINE_S if deadline_s is None else deadline_s)
+    retries = LLM_RETRIES if retries is None else retries
+    hedge_after_s = LLM_HEDGE_AFTER_S if hedge_after_s is None else hedge_after_s
+    _count(calls=1)
+    # Attempt tasks copy this context, so their HTTP requests are clamped to the deadline too
+    deadline_token = _call_deadline.set(time.monotonic() + deadline - loop.time())
+
+    async def attempt_once(wait_for_budget=True):
+        if wait_for_budget:
+            await scheduler.aacquire(tokens, time.monotonic() + deadline - loop.time())
+        _count(attempts=1)
+        return await make_coro()
+
+    try:
+        last_error = None
+        for attempt in range(retries + 1):
+            pending = {asyncio.ensure_future(attempt_once())}
+            hedged = None
+            try:
+                while pending:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        raise _deadline_error(deadline_s) from last_error
+                    timeout = min(remaining, hedge_after_s) if hedge_after_s and hedged is None else remaining
+                    done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            if task is hedged:
+                                _count(hedge_wins=1)
+                            return task.result()
+                        last_error = task.exception()
+                    if not done and hedge_after_s and hedged is None:
+                        if scheduler.reserve(tokens, max_wait=0) is None:
+                            hedged = False
+                            continue
+                        _count(hedges=1)
+                        hedged = asyncio.ensure_future(attempt_once(wait_for_budget=False))
+                        pending.add(hedged)
+            finally:
+                for task in pending:
+                    task.cancel()
+            if isinstance(last_error, DeadlineExceeded):
+                _count(deadline_exceeded=1, failed=1)
+                raise last_error
+            if not isinstance(last_error, RETRYABLE_ERRORS) or attempt == retries:
+                break
+            delay = backoff(attempt, last_error)
+            if loop.time() + delay >= deadline:
+                break
+            _count(retries=1)
+            await asyncio.sleep(delay)
+        _count(failed=1)
+        raise last_error
+    finally:
+        _call_deadline.reset(deadline_token)
+
+
+def stream(make_stream, tokens=0, deadline_s=None, retries=None):
+    """Yield from make_stream(), retrying transient failures that happen before the first chunk.
+
+    Once output has been yielded a retry would repeat it, so later errors propagate. The deadline applies to
+    starting attempts (queueing, connecting, the first chunk); later reads are bounded by LLM_ATTEMPT_TIMEOUT_S.
+    """
+    deadline = time.monotonic() + (LLM_DEADLINE_S if deadline_s is None else deadline_s)
+    retries = LLM_RETRIES if retries is None else retries
+    _count(calls=1)
+    for attempt in range(retries + 1):
+        try:
+            scheduler.acquire(tokens, deadline)
+        except DeadlineExceeded:
+            _count(deadline_exceeded=1, failed=1)
+            raise
+        _count(attempts=1)
+        started = False
+        try:
+            chunks = iter(make_stream())
+            # Only the start of the attempt runs under the deadline; the context var must not outlive this frame
+            deadline_token = _call_deadline.set(deadline)
+            try:
+                first = next(chunks, None)
+            finally:
+                _call_deadline.reset(deadline_token)
+            if first is None:
+                return
+            started = True
+            yield first
+            yield from chunks
+            return
+        except DeadlineExceeded:
+            _count(deadline_exceeded=1, failed=1)
+            raise
+        except Exception as e:
+            if not isinstance(e, RETRYABLE_ERRORS) or started or attempt == retries:
+                _count(failed=1)
+                raise
+            delay = backoff(attempt, e)
+            if time.monotonic() + delay >= deadline:
+                _count(deadline_exceeded=1, failed=1)
+                raise DeadlineExceeded(f"No model response within {LLM_DEADLINE_S if deadline_s is None else deadline_s:g}s") from e
+            _count(retries=1)
+            time.sleep(delay)
+
+
+def resilience_stats():
+    with _stats_lock:
+        stats = dict(call_stats, workers_busy=_busy_workers)
+    stats["throttle_wait_s"] = round(stats["throttle_wait_s"], 2)
+    return {**stats, **scheduler.stats()}
+
+
+def reset_stats():
+    with _stats_lock:
+        for name in call_stats:
+            call_stats[name] = 0.0 if name == "throttle_wait_s" else 0
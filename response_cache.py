@@ -0,0 +1,150 @@
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+# Exact-match and similarity-match lifetimes, similarity threshold (0 disables the semantic level, e.g. 0.9 enables it) and size
+RESPONSE_CACHE_TTL_S = int(os.getenv("RESPONSE_CACHE_TTL_S", "3600"))
+RESPONSE_CACHE_SEMANTIC_TTL_S = int(os.getenv("RESPONSE_CACHE_SEMANTIC_TTL_S", "900"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+
+EMBEDDING_DIMENSIONS = 2 ** 18
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Filler words (English and Taglish) that may differ between two phrasings of the same question
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "do", "does", "you", "your", "yours", "i", "me", "my", "we", "our",
+    "to", "of", "for", "in", "on", "at", "and", "or", "please", "pls", "can", "could", "would", "will", "what",
+    "whats", "s", "hi", "hello", "hey", "there", "about", "any", "po", "ba", "ang", "ng", "sa", "yung", "naman",
+    "lang", "kayo", "ko", "mo",
+}
+
+
+def normalize_question(question):
+    """Lowercase, drop punctuation and collapse whitespace so trivially different phrasings share a key"""
+    return " ".join(WORD_PATTERN.findall(question.lower()))
+
+
+def embed(text):
+    """Local hashed bag of words + character trigrams, L2-normalized - no model download or network"""
+    normalized = normalize_question(text)
+    features = normalized.split()
+    padded = f" {normalized} "
+    features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+    vector = {}
+    for feature in features:
+        slot = zlib.crc32(feature.encode("utf-8")) % EMBEDDING_DIMENSIONS
+        vector[slot] = vector.get(slot, 0.0) + 1.0
+    norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+    return {slot: value / norm for slot, value in vector.items()}
+
+
+def content_terms(normalized):
+    return frozenset(word for word in normalized.split() if word not in STOPWORDS)
+
+
+def cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(slot, 0.0) for slot, value in a.items())
+
+
+def is_opening_turn(messages):
+    """True when nothing has been said yet, so the reply can't depend on (or repeat) an earlier turn"""
+    return not messages
+
+
+class ResponseCache:
+    """Two-level cache of assistant replies, shared by every session in the process.
+
+    Level 1 matches the normalized question exactly; level 2 (optional) matches the most similar
+    cached question above `similarity` using local embeddings, provided both questions mention the same
+    content words (so models, variants and branches can't be confused). Entries are scoped to a fingerprint of
+    the dealership data they were answered from, so new uploads never get answers built on old data.
+    """
+
+    def __init__(self, ttl_s=RESPONSE_CACHE_TTL_S, semantic_ttl_s=RESPONSE_CACHE_SEMANTIC_TTL_S,
+                 similarity=RESPONSE_CACHE_SIMILARITY, max_entries=RESPONSE_CACHE_SIZE):
+        self.ttl_s = ttl_s
+        self.semantic_ttl_s = semantic_ttl_s
+        self.similarity = similarity
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.latency_saved_s = 0.0
+
+    def get(self, question, data_fingerprint):
+        normalized = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get((data_fingerprint, normalized))
+            if entry and now - entry["stored_at"] < self.ttl_s:
+                self._entries.move_to_end((data_fingerprint, normalized))
+                self.exact_hits += 1
+                self.latency_saved_s += entry["latency_s"]
+                return entry["answer"]
+
+            if self.similarity:
+                vector = embed(normalized)
+                terms = content_terms(normalized)
+                best, best_score = None, self.similarity
+                for (fingerprint, _), candidate in self._entries.items():
+                    if fingerprint != data_fingerprint or now - candidate["stored_at"] >= self.semantic_ttl_s:
+                        continue
+                    # "Vios 1.3" vs "Vios 1.5" or "Vios" vs "Wigo" look alike to trigrams; never serve those
+                    if candidate["terms"] != terms:
+                        continue
+                    score = cosine(vector, candidate["vector"])
+                    if score >= best_score:
+                        best, best_score = candidate, score
+                if best is not None:
+                    self.semantic_hits += 1
+                    self.latency_saved_s += best["latency_s"]
+                    return best["answer"]
+
+            self.misses += 1
+            return None
+
+    def set(self, question, data_fingerprint, answer, latency_s=0.0):
+        normalized = normalize_question(question)
+        key = (data_fingerprint, normalized)
+        with self._lock:
+            self._entries[key] = {
+                "answer": answer,
+                "stored_at": time.time(),
+                "latency_s": latency_s,
+                "vector": embed(normalized) if self.similarity else None,
+                "terms": content_terms(normalized),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, data_fingerprint=None):
+        """Drop entries answered from `data_fingerprint`, or every entry when it is None"""
+        with self._lock:
+            for key in [key for key in self._entries if data_fingerprint is None or key[0] == data_fingerprint]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "latency_saved_s": self.latency_saved_s,
+            }
+
+
+response_cache = ResponseCache()
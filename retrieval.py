@@ -0,0 +1,125 @@
+import math
+import os
+import re
+from collections import Counter
+
+from cache import ResultCache, content_hash
+from tokens import count_tokens
+
+# Chunks passed to the prompt per question, and the document size below which retrieval is skipped
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+RETRIEVAL_MIN_TOKENS = int(os.getenv("RETRIEVAL_MIN_TOKENS", "1500"))
+CHUNK_WORDS = int(os.getenv("RETRIEVAL_CHUNK_WORDS", "180"))
+CHUNK_OVERLAP_WORDS = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP_WORDS", "30"))
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Token counts and built indexes keyed by a hash of the extracted text, so each upload is counted and indexed once per process
+index_cache = ResultCache(max_entries=int(os.getenv("RETRIEVAL_INDEX_CACHE_SIZE", "32")))
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def chunk_text(text, chunk_words=CHUNK_WORDS, overlap_words=CHUNK_OVERLAP_WORDS):
+    """Split text into overlapping word windows, keeping line breaks so tables and price lists stay readable"""
+    lines = [line for line in text.splitlines() if line.strip()]
+    chunks = []
+    current = []
+    current_words = 0
+    for line in lines:
+        words = len(line.split())
+        if current and current_words + words > chunk_words:
+            chunks.append("\n".join(current))
+            # Carry trailing lines over so facts split across a boundary are still retrievable
+            carried = []
+            carried_words = 0
+            for previous in reversed(current):
+                carried_words += len(previous.split())
+                if carried_words > overlap_words:
+                    break
+                carried.insert(0, previous)
+            current = carried
+            current_words = sum(len(previous.split()) for previous in current)
+        current.append(line)
+        current_words += words
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+class BM25Index:
+    """Okapi BM25 over document chunks - pure Python, no network or model downloads.
+
+    Pass precomputed `term_freqs` (one mapping per chunk) to skip tokenizing, e.g. when loading a stored index.
+    """
+
+    def __init__(self, chunks, k1=1.5, b=0.75, term_freqs=None):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = term_freqs if term_freqs is not None else [Counter(tokenize(chunk)) for chunk in chunks]
+        self.lengths = [sum(freqs.values()) for freqs in self.term_freqs]
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        doc_freqs = Counter()
+        for freqs in self.term_freqs:
+            doc_freqs.update(freqs.keys())
+        n = len(chunks)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freqs.items()}
+
+    def scores(self, query):
+        terms = [term for term in set(tokenize(query)) if term in self.idf]
+        scores = []
+        for freqs, length in zip(self.term_freqs, self.lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length) if self.avg_length else self.k1
+            for term in terms:
+                tf = freqs.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            scores.append(score)
+        return scores
+
+    def search(self, query, k=RETRIEVAL_TOP_K):
+        """Return the top-k (chunk_position, score) pairs for query, best first"""
+        ranked = sorted(enumerate(self.scores(query)), key=lambda item: item[1], reverse=True)
+        return [(position, score) for position, score in ranked[:k] if score > 0]
+
+
+def _document(text):
+    """Token count and (lazily built) BM25 index for text, cached together per content hash"""
+    key = content_hash(text)
+    document = index_cache.get(key)
+    if document is None:
+        document = {"tokens": count_tokens(text), "index": None}
+        index_cache.set(key, document)
+    return document
+
+
+def _document_index(document, text):
+    if document["index"] is None:
+        document["index"] = BM25Index(chunk_text(text))
+    return document["index"]
+
+
+def get_index(text):
+    """Return the BM25 index for text, building it only the first time this content is seen"""
+    return _document_index(_document(text), text)
+
+
+def retrieve_context(text, question, k=RETRIEVAL_TOP_K):
+    """Return the parts of text relevant to question; small documents are passed through whole"""
+    if not text:
+        return text
+    # Counting tokens costs as much as indexing, so the count is cached with the index rather than redone per question
+    document = _document(text)
+    if document["tokens"] <= RETRIEVAL_MIN_TOKENS:
+        return text
+    index = _document_index(document, text)
+    hits = index.search(question, k)
+    if not hits:
+        # Nothing matched (e.g. a greeting) - give the model the start of the document for orientation
+        return "\n...\n".join(index.chunks[:k])
+    # Keep document order so related rows read naturally
+    return "\n...\n".join(index.chunks[position] for position in sorted(position for position, _ in hits))
@@ -0,0 +1,158 @@
+"""The resilient call layer against the fault-injecting stub in benchmarks.fault_server"""
+import asyncio
+import threading
+import time
+
+import openai
+import pytest
+from langchain_openai import ChatOpenAI
+
+import clients
+import resilience
+from async_runtime import LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, limiter
+from benchmarks.fault_server import REPLY, start_server
+
+
+@pytest.fixture(autouse=True)
+def fresh_layer():
+    resilience.reset_stats()
+    resilience.scheduler.configure(0, 0)
+    yield
+    resilience.scheduler.configure(resilience.OPENAI_RPM, resilience.OPENAI_TPM)
+
+
+@pytest.fixture
+def stub():
+    """start(**faults) -> (ChatOpenAI pointed at a fresh stub, its FaultConfig)"""
+    servers = []
+
+    def start(**faults):
+        server, config, base_url = start_server(latency=0.01, **faults)
+        servers.append(server)
+        llm = ChatOpenAI(
+            model="gpt-4o", base_url=base_url, api_key="x", max_retries=0, timeout=5,
+            http_client=clients.get_http_client(),
+        )
+        return llm, config
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def ask(llm):
+    return lambda: llm.invoke("How much is the Vios?").content
+
+
+def test_retries_transient_failures(stub):
+    llm, config = stub(script=["error", "drop", "ok"])
+    assert resilience.call(ask(llm), retries=2, deadline_s=10, hedge_after_s=0) == REPLY
+    assert config.counts == {"error": 1, "drop": 1, "ok": 1}
+    assert resilience.resilience_stats()["retries"] == 2
+
+
+def test_raises_last_error_when_retries_run_out(stub):
+    llm, config = stub(script=["error", "error", "ok"])
+    with pytest.raises(openai.InternalServerError):
+        resilience.call(ask(llm), retries=1, deadline_s=10, hedge_after_s=0)
+    assert config.counts == {"error": 2}
+    assert resilience.resilience_stats()["failed"] == 1
+
+
+def test_deadline_cuts_off_a_slow_request(stub):
+    llm, _ = stub(script=["slow"], slow_latency=5)
+    start = time.monotonic()
+    with pytest.raises(resilience.DeadlineExceeded):
+        resilience.call(ask(llm), retries=2, deadline_s=0.5, hedge_after_s=0)
+    assert time.monotonic() - start < 1.5
+    assert resilience.resilience_stats()["deadline_exceeded"] == 1
+
+
+def test_hedge_answers_while_first_attempt_is_slow(stub):
+    llm, config = stub(script=["slow", "ok"], slow_latency=5)
+    start = time.monotonic()
+    assert resilience.call(ask(llm), retries=0, deadline_s=3, hedge_after_s=0.2) == REPLY
+    assert time.monotonic() - start < 1.5
+    stats = resilience.resilience_stats()
+    assert (stats["hedges"], stats["hedge_wins"], stats["abandoned"]) == (1, 1, 1)
+
+
+def test_async_hedge_answers_while_first_attempt_is_slow(stub):
+    llm, _ = stub(script=["slow", "ok"], slow_latency=5)
+
+    async def attempt():
+        return (await llm.ainvoke("How much is the Vios?")).content
+
+    start = time.monotonic()
+    assert asyncio.run(resilience.acall(attempt, retries=0, deadline_s=3, hedge_after_s=0.2)) == REPLY
+    assert time.monotonic() - start < 1.5
+    assert resilience.resilience_stats()["hedge_wins"] == 1
+
+
+def test_waits_for_retry_after_on_429(stub):
+    llm, config = stub(script=["rate_limited", "ok"], retry_after=0.6)
+    start = time.monotonic()
+    assert resilience.call(ask(llm), retries=1, deadline_s=10, hedge_after_s=0) == REPLY
+    assert time.monotonic() - start >= 0.6
+    assert config.counts == {"rate_limited": 1, "ok": 1}
+    assert resilience.resilience_stats()["rate_limited"] == 1
+
+
+def test_stream_retries_before_first_chunk(stub):
+    llm, config = stub(script=["error", "ok"])
+    chunks = resilience.stream(lambda: llm.stream("How much is the Vios?"), retries=1, deadline_s=10)
+    assert "".join(chunk.content for chunk in chunks) == REPLY
+    assert config.counts == {"error": 1, "ok": 1}
+
+
+def test_busy_workers_do_not_block_healthy_calls():
+    release = threading.Event()
+    blocked = []
+    while (future := resilience._submit(release.wait)) is not None:
+        blocked.append(future)
+    try:
+        start = time.monotonic()
+        assert resilience.call(lambda: "ok", deadline_s=0.5, hedge_after_s=0.1) == "ok"
+        assert time.monotonic() - start < 0.1
+    finally:
+        release.set()
+    assert len(blocked) == resilience.LLM_CALL_WORKERS
+
+
+@pytest.fixture
+def busy_limiter():
+    """The global limiter cut to one slot, held by another thread until the test ends"""
+    limiter.reset(1, 8)
+    release, holding = threading.Event(), threading.Event()
+
+    def hold_slot():
+        with limiter.hold():
+            holding.set()
+            release.wait()
+
+    holder = threading.Thread(target=hold_slot)
+    holder.start()
+    holding.wait()
+    yield
+    release.set()
+    holder.join()
+    limiter.reset(LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE)
+
+
+def test_waiting_for_a_limiter_slot_counts_against_the_deadline(busy_limiter):
+    start = time.monotonic()
+    with pytest.raises(resilience.DeadlineExceeded):
+        resilience.call(limiter.wrap(lambda: "ok"), deadline_s=0.5, hedge_after_s=0)
+    assert time.monotonic() - start < 1.0
+    assert limiter.stats()["queue_depth"] == 0
+
+
+def test_stream_waiting_for_a_limiter_slot_counts_against_the_deadline(busy_limiter):
+    def make_stream():
+        with limiter.hold():
+            yield "chunk"
+
+    start = time.monotonic()
+    with pytest.raises(resilience.DeadlineExceeded):
+        list(resilience.stream(make_stream, deadline_s=0.5))
+    assert time.monotonic() - start < 1.0
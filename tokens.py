@@ -0,0 +1,34 @@
+from functools import lru_cache
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    # tiktoken ships with langchain-openai but downloads its BPE tables on first use,
+    # so fall back to a character estimate when it is missing or offline
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model("gpt-4o")
+    except Exception:
+        return None
+
+
+def count_tokens(text):
+    """Count gpt-4o tokens in text (approximated as ~4 characters per token when tiktoken is unavailable)"""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def last_tokens(text, max_tokens):
+    """The end of text, cut to at most max_tokens tokens"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _encoding()
+    if encoding is None:
+        return text[-max_tokens * 4:]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[-max_tokens:])
@@ -0,0 +1,225 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Off by default; when disabled, trace() hands back a shared no-op span and records nothing
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "").lower() in ("1", "true", "yes")
+# Level of the JSON span log lines written to stderr while tracing is on (e.g. DEBUG, INFO, WARNING)
+TRACE_LOG_LEVEL = os.getenv("TRACE_LOG_LEVEL", "INFO").upper()
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+logger = logging.getLogger("toyota_ai.trace")
+
+_enabled = TRACING_ENABLED
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_usage = {}
+recent_spans = deque(maxlen=200)
+
+
+def configure_logging():
+    """Give the span logger its own stderr handler at TRACE_LOG_LEVEL, unless the host app already set one up"""
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(TRACE_LOG_LEVEL)
+    # One JSON line per span; don't repeat it through the root logger's format
+    logger.propagate = False
+
+
+def enabled():
+    return _enabled
+
+
+def set_enabled(value):
+    global _enabled
+    _enabled = bool(value)
+    if _enabled:
+        configure_logging()
+
+
+if _enabled:
+    configure_logging()
+
+
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """One timed stage. Attributes set on it become log fields; bytes/tokens/cache_hit also feed the counters."""
+
+    def __init__(self, stage, attributes):
+        self.stage = stage
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        status = "error" if exc_type or self.attributes.get("error") else "ok"
+        record(self.stage, seconds, status, self.attributes)
+        return False
+
+
+def trace(stage, **attributes):
+    """Time a stage: `with trace("pdf.rasterize", page=3) as span: ...; span.set(bytes=n)`"""
+    if not _enabled:
+        return NOOP_SPAN
+    return Span(stage, attributes)
+
+
+def _inc(name, labels, amount=1):
+    key = (name, labels)
+    _counters[key] = _counters.get(key, 0) + amount
+
+
+def record(stage, seconds, status="ok", attributes=None):
+    attributes = attributes or {}
+    with _lock:
+        _inc("toyota_ai_stage_calls_total", (("stage", stage), ("status", status)))
+        histogram = _histograms.setdefault(stage, {"buckets": [0] * len(DURATION_BUCKETS), "count": 0, "sum": 0.0})
+        index = bisect_left(DURATION_BUCKETS, seconds)
+        if index < len(DURATION_BUCKETS):
+            histogram["buckets"][index] += 1
+        histogram["count"] += 1
+        histogram["sum"] += seconds
+        if attributes.get("bytes"):
+            _inc("toyota_ai_stage_bytes_total", (("stage", stage),), attributes["bytes"])
+        for kind in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+            if attributes.get(kind):
+                _inc("toyota_ai_tokens_total", (("stage", stage), ("kind", kind)), attributes[kind])
+        if "cache_hit" in attributes:
+            result = "hit" if attributes["cache_hit"] else "miss"
+            _inc("toyota_ai_cache_lookups_total", (("stage", stage), ("result", result)))
+
+    entry = {"stage": stage, "status": status, "duration_ms": round(seconds * 1000, 3), **attributes}
+    recent_spans.append(entry)
+    logger.info(json.dumps(entry, default=str))
+
+
+def usage_tokens(usage):
+    """Prompt, completion and prompt-cache-hit token counts from a LangChain usage_metadata dict"""
+    return {
+        "prompt_tokens": usage.get("input_tokens", 0),
+        "completion_tokens": usage.get("output_tokens", 0),
+        "cached_tokens": (usage.get("input_token_details") or {}).get("cache_read", 0),
+    }
+
+
+def tally_usage(stage, tokens):
+    """Per-stage token totals, kept even with tracing off so prompt-cache hits can always be reported"""
+    with _lock:
+        totals = _usage.setdefault(stage, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0})
+        totals["calls"] += 1
+        for kind, count in tokens.items():
+            totals[kind] += count or 0
+
+
+class UsageCallback(BaseCallbackHandler):
+    """LangChain callback that tallies model token usage and copies it onto a span"""
+
+    def __init__(self, span, stage):
+        self.span = span
+        self.stage = stage
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    tokens = usage_tokens(usage)
+                    tally_usage(self.stage, tokens)
+                    self.span.set(**tokens)
+
+
+def callbacks(span, stage):
+    """Callbacks to pass in a LangChain `config` so token usage is tallied under stage (and lands on span when tracing)"""
+    return [UsageCallback(span, stage)]
+
+
+def record_usage(span, message, stage):
+    """Tally usage_metadata from a model response message under stage and copy it onto span"""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        tokens = usage_tokens(usage)
+        tally_usage(stage, tokens)
+        span.set(**tokens)
+
+
+def usage_summary():
+    """Per-stage token totals with the share of prompt tokens served from the provider's prompt cache"""
+    with _lock:
+        return [
+            dict(totals, stage=stage, cache_hit_rate=round(totals["cached_tokens"] / totals["prompt_tokens"], 3) if totals["prompt_tokens"] else 0.0)
+            for stage, totals in sorted(_usage.items())
+        ]
+
+
+def _format_labels(labels):
+    return ",".join(f'{key}="{value}"' for key, value in labels)
+
+
+def render_prometheus():
+    """Counters and per-stage duration histograms in the Prometheus text exposition format"""
+    lines = []
+    with _lock:
+        names = sorted({name for name, _ in _counters})
+        for name in names:
+            lines.append(f"# TYPE {name} counter")
+            for (counter_name, labels), value in sorted(_counters.items()):
+                if counter_name == name:
+                    lines.append(f"{name}{{{_format_labels(labels)}}} {value}")
+        if _histograms:
+            lines.append("# TYPE toyota_ai_stage_duration_seconds histogram")
+        for stage, histogram in sorted(_histograms.items()):
+            cumulative = 0
+            for bound, count in zip(DURATION_BUCKETS, histogram["buckets"]):
+                cumulative += count
+                lines.append(f'toyota_ai_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'toyota_ai_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'toyota_ai_stage_duration_seconds_sum{{stage="{stage}"}} {histogram["sum"]}')
+            lines.append(f'toyota_ai_stage_duration_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+def stage_summary():
+    """Per-stage call count and mean duration, for the admin panel"""
+    with _lock:
+        return [
+            {"stage": stage, "calls": histogram["count"], "avg_ms": round(histogram["sum"] / histogram["count"] * 1000, 2)}
+            for stage, histogram in sorted(_histograms.items())
+            if histogram["count"]
+        ]
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _usage.clear()
+        recent_spans.clear()